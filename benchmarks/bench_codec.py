@@ -0,0 +1,109 @@
+"""
+Compare JSON codecs on realistic contact list pages
+
+Usage: python -m benchmarks.bench_codec [--pages N] [--items N]
+"""
+import argparse
+import random
+import string
+import timeit
+from treillage import (StdlibJSONCodec, OrjsonCodec, MsgspecCodec,
+                       TreillageException)
+
+
+def random_text(length: int) -> str:
+    return ''.join(random.choices(string.ascii_letters + ' ', k=length))
+
+
+def make_contact(i: int) -> dict:
+    first_name = random_text(8).strip() or 'James'
+    last_name = random_text(10).strip() or 'Doe'
+    return {
+        'personId': {'native': 100000 + i, 'partner': None},
+        'firstName': first_name,
+        'middleName': random_text(6),
+        'lastName': last_name,
+        'fullName': f'{first_name} {last_name}',
+        'isSingleName': False,
+        'personTypes': ['Client', 'Involved Party'],
+        'birthDate': '1980-01-01T00:00:00Z',
+        'isMinor': False,
+        'gender': random.choice(['M', 'F', None]),
+        'maritalStatus': random.choice(['s', 'm', 'd', 'u', 'w']),
+        'notes': random_text(200),
+        'phones': [
+            {'phoneId': {'native': i * 10 + n},
+             'number': ''.join(random.choices(string.digits, k=10)),
+             'label': random.choice(['Mobile', 'Home', 'Work'])}
+            for n in range(2)
+        ],
+        'emails': [
+            {'emailId': {'native': i * 10 + n},
+             'address': f'{first_name}.{n}@example.com'.lower(),
+             'label': 'Personal'}
+            for n in range(2)
+        ],
+        'addresses': [
+            {'addressId': {'native': i},
+             'line1': random_text(24),
+             'city': random_text(10),
+             'state': 'UT',
+             'postalCode': '84101',
+             'label': 'Home'}
+        ],
+        'links': {'self': f'/core/contacts/{100000 + i}'},
+    }
+
+
+def make_page(offset: int, items: int) -> dict:
+    return {
+        'count': 200000,
+        'offset': offset,
+        'limit': items,
+        'hasMore': True,
+        'items': [make_contact(offset + i) for i in range(items)],
+        'links': {'self': f'/core/contacts?offset={offset}&limit={items}'},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    pages = [make_page(n * args.items, args.items) for n in range(args.pages)]
+    bodies = [StdlibJSONCodec().dumps(page) for page in pages]
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(f"{args.pages} pages of {args.items} contacts, "
+          f"{size / 1024:.1f} KiB per page")
+
+    codecs = [StdlibJSONCodec()]
+    for codec_class in (OrjsonCodec, MsgspecCodec):
+        try:
+            codecs.append(codec_class())
+        except TreillageException:
+            print(f"{codec_class.name}: not installed")
+
+    baseline = None
+    print(f"{'codec':<10}{'decode ms/page':>16}{'encode ms/page':>16}"
+          f"{'decode speedup':>16}")
+    for codec in codecs:
+        decode = min(timeit.repeat(
+            lambda: [codec.loads(body) for body in bodies],
+            number=1, repeat=args.repeat
+        )) / len(bodies)
+        encode = min(timeit.repeat(
+            lambda: [codec.dumps(page) for page in pages],
+            number=1, repeat=args.repeat
+        )) / len(pages)
+        if baseline is None:
+            baseline = decode
+        print(f"{codec.name:<10}{decode * 1000:>16.3f}{encode * 1000:>16.3f}"
+              f"{baseline / decode:>15.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Measure the client-side overhead of a request
+
+By default requests go to an in-memory stub transport that answers at once,
+so the time measured is spent in ConnectionManager: decorators, headers,
+URLs, rate limiting and decoding. With --http the stub is a local aiohttp
+server instead, which adds aiohttp's own client and server overhead.
+
+Usage: python -m benchmarks.bench_overhead [--requests N]
+           [--concurrency N] [--http] [--profile]
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import pstats
+import time
+import jwt
+from aiohttp import web
+from treillage import ConnectionManager, Credential, Transport
+
+BODY = json.dumps({'personId': {'native': 1}, 'fullName': 'Contact'}).encode()
+
+
+class StubResponse:
+    status = 200
+    headers = {}
+
+    def __init__(self, url):
+        self.url = url
+
+    async def read(self) -> bytes:
+        return BODY
+
+    async def text(self) -> str:
+        return BODY.decode()
+
+    async def json(self):
+        return json.loads(BODY)
+
+
+class StubRequest:
+    def __init__(self, url):
+        self.__url = url
+
+    async def __aenter__(self):
+        return StubResponse(self.__url)
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        pass
+
+
+class StubTransport(Transport):
+    """Answers every request with the same small JSON body"""
+
+    def request(self, method: str, **kwargs):
+        return StubRequest(kwargs['url'])
+
+
+async def start_server():
+    tokens = json.dumps({
+        'accessToken': jwt.encode({'exp': int(time.time()) + 3600},
+                                  'benchmark-signing-key-0123456789abcdef',
+                                  algorithm='HS256'),
+        'refreshToken': 'refresh',
+        'refreshTokenExpiry': int(time.time()) + 3600,
+        'refreshTokenTtl': '3600',
+        'userId': '1',
+        'orgId': '1',
+    }).encode()
+
+    async def session(request):
+        return web.Response(body=tokens, content_type='application/json')
+
+    async def contact(request):
+        return web.Response(body=BODY, content_type='application/json')
+
+    app = web.Application()
+    app.router.add_post('/session', session)
+    app.router.add_get('/core/contacts/{id}', contact)
+    app.router.add_patch('/core/contacts/{id}', contact)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+
+async def measure(request, requests: int, concurrency: int) -> float:
+    async def worker(count: int):
+        for i in range(count):
+            await request(i)
+
+    share, extra = divmod(requests, concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(share + (i < extra))
+                           for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--http', action='store_true',
+                        help='send requests to a local aiohttp server')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the functions taking the most time')
+    args = parser.parse_args()
+
+    runner, url = await start_server()
+
+    async def get(conn, i):
+        await conn.get(f'/core/contacts/{i % 100}')
+
+    async def patch(conn, i):
+        await conn.patch(f'/core/contacts/{i % 100}', {'notes': 'x'})
+
+    scenarios = [
+        ('get', get, dict()),
+        ('get, rate limited', get, dict(rate_limit_token_regen_rate=10 ** 9)),
+        ('get, coalesced', get, dict(coalesce_requests=True)),
+        ('patch', patch, dict()),
+    ]
+    print(f'{args.requests} requests, {args.concurrency} concurrent, '
+          f'{"local aiohttp server" if args.http else "stub transport"}')
+    try:
+        for name, send, options in scenarios:
+            if not args.http:
+                options['transport'] = StubTransport()
+            conn = await ConnectionManager.create(url,
+                                                  Credential('key', 'secret'),
+                                                  **options)
+
+            async def request(i):
+                await send(conn, i)
+
+            # Warm up before timing
+            await measure(request, 1000, args.concurrency)
+            profile = cProfile.Profile() if args.profile else None
+            if profile:
+                profile.enable()
+            elapsed = await measure(request, args.requests, args.concurrency)
+            if profile:
+                profile.disable()
+            print(f'{name:20} {args.requests / elapsed:10.0f} req/s '
+                  f'{elapsed / args.requests * 1e6:8.1f} us/request')
+            if profile:
+                pstats.Stats(profile).sort_stats('tottime').print_stats(12)
+            await conn.close()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
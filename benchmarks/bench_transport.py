@@ -0,0 +1,125 @@
+"""
+Compare the aiohttp and HTTP/2 transports against a local test server
+
+The server adds a fixed latency to every response. With the connection
+count capped, aiohttp can only have that many requests in flight while the
+HTTP/2 transport multiplexes all of them over one connection.
+
+Requires httpx[http2] and hypercorn.
+
+Usage: python -m benchmarks.bench_transport [--requests N]
+           [--concurrency N] [--connections N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import json
+import time
+import jwt
+from treillage import ConnectionManager, Credential, HttpxTransport
+
+
+def make_app(latency: float, items: int):
+    page = json.dumps({
+        'items': [{'personId': {'native': i}, 'fullName': f'Contact {i}'}
+                  for i in range(items)],
+        'hasMore': False,
+    }).encode()
+    tokens = json.dumps({
+        'accessToken': jwt.encode({'exp': int(time.time()) + 3600},
+                                  'benchmark-signing-key-0123456789abcdef',
+                                  algorithm='HS256'),
+        'refreshToken': 'refresh',
+        'refreshTokenExpiry': int(time.time()) + 3600,
+        'refreshTokenTtl': '3600',
+        'userId': '1',
+        'orgId': '1',
+    }).encode()
+    connections = set()
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        if scope['path'] == '/session':
+            body = tokens
+        else:
+            # Token requests use their own session and are not counted
+            connections.add(tuple(scope['client']))
+            await asyncio.sleep(latency)
+            body = page
+        await send({'type': 'http.response.start',
+                    'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    return app, connections
+
+
+async def run(transport, url: str, requests: int, concurrency: int,
+              connections: int) -> float:
+    conn = await ConnectionManager.create(
+        url,
+        Credential(key='key', secret='secret'),
+        max_connections=connections if transport == 'aiohttp' else None,
+        transport=transport
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            await conn.get('/core/contacts', {'limit': 50})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await conn.close()
+    return elapsed
+
+
+async def main():
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--items', type=int, default=50)
+    args = parser.parse_args()
+
+    app, peers = make_app(args.latency, args.items)
+    config = Config()
+    config.bind = ['127.0.0.1:8765']
+    config.loglevel = 'WARNING'
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(
+        serve(app, config, shutdown_trigger=shutdown.wait)
+    )
+    await asyncio.sleep(0.5)
+    url = 'http://127.0.0.1:8765'
+
+    backends = [
+        (f'aiohttp, HTTP/1.1, {args.connections} connections', 'aiohttp'),
+        # Plain-text HTTP/2 needs prior knowledge, TLS would negotiate it
+        (f'httpx, HTTP/2, {args.connections} connections',
+         lambda: HttpxTransport(http1=False,
+                                max_connections=args.connections)),
+    ]
+    print(f'{args.requests} requests, {args.concurrency} concurrent, '
+          f'{args.latency * 1000:.0f} ms server latency')
+    for name, transport in backends:
+        peers.clear()
+        if callable(transport):
+            transport = transport()
+        elapsed = await run(transport, url, args.requests,
+                            args.concurrency, args.connections)
+        print(f'{name:36} {elapsed:7.2f} s '
+              f'{args.requests / elapsed:8.1f} req/s '
+              f'{len(peers):3} connections opened')
+
+    shutdown.set()
+    await server
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,11 +1,9 @@
-from treillage import (Treillage,
-                       TreillageHTTPException,
-                       TreillageRateLimitException)
+from treillage import Treillage, TreillageHTTPException
+from treillage.endpoints import CollectionItemUpdate, update_collection_items
 import asyncio
 import pandas
 import progressbar
 import json
-import copy
 
 
 async def main():
@@ -29,89 +27,53 @@ async def main():
                 credentials_file,
                 requests_per_second=8
         ) as tr:
-            # Iterate over every row in the spreadsheet
-            for idx, row in batch.iterrows():
-                # Process the data from the row
-                await handle_document(
-                    tr=tr,
-                    projectid=row["__ProjectID"],
-                    sectionselector=row["SectionSelector"],
-                    collectionid=row["__CollectionItemGuid"],
-                    fieldselector=row["FieldSelector"],
-                    docids=json.loads(row["JSON__DocIDs"])
-                )
+            # GET the collection item, add the new docIDs to the ones it
+            # already has and PATCH it back, for up to 16 rows at a time.
+            # Rate limited requests are retried by the pipeline.
+            results = update_collection_items(
+                tr.conn,
+                updates(batch),
+                concurrency=16,
+                on_result=log_result,
+                on_error=log_error
+            )
+            finished = 0
+            async for _ in results:
+                finished += 1
                 # Update the position of the progress bar
-                bar.update(idx)
+                bar.update(finished)
 
 
-async def handle_document(
-        tr,
-        projectid,
-        sectionselector,
-        collectionid,
-        fieldselector,
-        docids
-):
-    # Set the endpoint that will be requested
-    endpoint = f'/core/projects/{projectid}/collections/{sectionselector}/' \
-               f'{collectionid}'
-    # Format parameters for the log file
-    log_data = f'{projectid}\t{sectionselector}\t{fieldselector}\t' \
-               f'{collectionid}\t{docids}'
-    # Use a try-except block to handle errors
-    try:
-        # get fieldselector info about the requested collection
-        resp = await tr.conn.get(
-            endpoint=endpoint,
-            params={'requestedFields': fieldselector}
+def updates(batch):
+    # Turn every row in the spreadsheet into a collection item update
+    for idx, row in batch.iterrows():
+        fieldselector = row["FieldSelector"]
+        docids = json.loads(row["JSON__DocIDs"])
+        yield CollectionItemUpdate(
+            project_id=row["__ProjectID"],
+            section_selector=row["SectionSelector"],
+            item_id=row["__CollectionItemGuid"],
+            data=docids,
+            requested_fields=[fieldselector],
+            # Format parameters for the log file
+            context=f'{row["__ProjectID"]}\t{row["SectionSelector"]}\t'
+                    f'{fieldselector}\t{row["__CollectionItemGuid"]}\t'
+                    f'{docids}'
         )
-        # Create a deep copy of the dictionary so nested data
-        # can be edited separate from the original values
-        newdocids = copy.deepcopy(docids)
 
-        # If needed, update docIDs based on
-        # the data returned from the GET request
-        if (fieldselector in resp["dataObject"].keys() and
-                len(resp["dataObject"][fieldselector]) > 0):
-            requestedfield = resp["dataObject"][fieldselector]
-            newdocids["dataObject"][fieldselector] = (
-                    newdocids["dataObject"][fieldselector] + requestedfield
-            )
-        # Update formatted log data with new values
-        log_data = log_data + "\t" + str(newdocids)
-        # Patch the collection item with the additional docIDs
-        await patch_collection_item(tr, endpoint, newdocids, log_data)
 
-    # Retry if the GET request was rate-limited
-    except TreillageRateLimitException:
-        await handle_document(
-            tr,
-            projectid,
-            sectionselector,
-            collectionid,
-            fieldselector,
-            docids
-        )
-    # Log all other failed GET requests
-    except TreillageHTTPException as e:
-        with open("error.txt", "a") as out:
-            out.write(f"{e.code}\t{log_data}\t{''}\t{e.msg}\tFailed to Get\n")
+def log_result(update, response):
+    # log the successful update
+    with open("result.txt", "a") as out:
+        out.write(f"200\t{update.context}\n")
 
 
-async def patch_collection_item(tr, endpoint, json, log_data):
-    try:
-        # make the patch request
-        await tr.conn.patch(endpoint=endpoint, body=json)
-        # log the successful update
-        with open("result.txt", "a") as out:
-            out.write(f"200\t{log_data}\n")
-    # Retry if the PATCH request was rate-limited
-    except TreillageRateLimitException:
-        await patch_collection_item(tr, endpoint, json, log_data)
-    # Log all other failed PATCH requests
-    except TreillageHTTPException as e:
-        with open("error.txt", "a") as out:
-            out.write(f"{e.code}\t{log_data}\t{e.msg}\tFailed to Patch\n")
+def log_error(update, step, error):
+    # Log failed requests, along with the step that failed
+    code = error.code if isinstance(error, TreillageHTTPException) else ''
+    with open("error.txt", "a") as out:
+        out.write(f"{code}\t{update.context}\t{error}\t"
+                  f"Failed to {step.capitalize()}\n")
 
 
 if __name__ == "__main__":
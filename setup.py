@@ -23,6 +23,13 @@ setup(
         'PyJWT>=2.5.0,<3',
         'cryptography>=35,<36'
     ],
+    extras_require={
+        'orjson': ['orjson>=3'],
+        'msgspec': ['msgspec>=0.16'],
+        'http2': ['httpx[http2]>=0.23'],
+        'brotli': ['brotli'],
+        'redis': ['redis>=4.2'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.8",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,157 @@
+import asyncio
+import unittest
+from treillage import (BulkRequest, TreillageRateLimitException,
+                       TreillageValueError, bounded_map)
+from treillage.bulk import send
+
+
+class MockConnection:
+    def __init__(self, rate_limited=0):
+        self.calls = []
+        self.rate_limited = rate_limited
+
+    async def __call(self, *args):
+        self.calls.append(args)
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise TreillageRateLimitException()
+        return args
+
+    async def get(self, endpoint, params=None, headers=None):
+        return await self.__call('GET', endpoint, params, headers)
+
+    async def patch(self, endpoint, body, headers=None):
+        return await self.__call('PATCH', endpoint, body, headers)
+
+    async def post(self, endpoint, body, headers=None):
+        return await self.__call('POST', endpoint, body, headers)
+
+    async def put(self, endpoint, body, headers=None):
+        return await self.__call('PUT', endpoint, body, headers)
+
+    async def delete(self, endpoint, headers=None):
+        return await self.__call('DELETE', endpoint, headers)
+
+
+class TestBoundedMap(unittest.TestCase):
+    def test_ordered(self):
+        async def test():
+            in_flight = 0
+            max_in_flight = 0
+
+            async def work(item):
+                nonlocal in_flight, max_in_flight
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                # Later items finish first
+                await asyncio.sleep(0.01 * (10 - item))
+                in_flight -= 1
+                return item * 2
+
+            results = [r async for r in bounded_map(work, range(10),
+                                                    concurrency=3)]
+            self.assertEqual([r.value for r in results],
+                             [i * 2 for i in range(10)])
+            self.assertEqual([r.index for r in results], list(range(10)))
+            self.assertEqual(max_in_flight, 3)
+        asyncio.run(test())
+
+    def test_unordered(self):
+        async def test():
+            async def work(item):
+                await asyncio.sleep(0.01 * (4 - item))
+                return item
+
+            results = [r.value async for r in bounded_map(
+                work, range(4), concurrency=4, ordered=False)]
+            self.assertEqual(results, [3, 2, 1, 0])
+        asyncio.run(test())
+
+    def test_async_iterable_and_errors(self):
+        async def test():
+            async def items():
+                for i in range(5):
+                    yield i
+
+            async def work(item):
+                if item == 2:
+                    raise TreillageValueError("bad row")
+                return item
+
+            results = [r async for r in bounded_map(work, items())]
+            self.assertEqual([r.ok for r in results],
+                             [True, True, False, True, True])
+            self.assertIsInstance(results[2].exception, TreillageValueError)
+            self.assertEqual(results[2].item, 2)
+            with self.assertRaises(TreillageValueError):
+                results[2].unwrap()
+            self.assertEqual(results[3].unwrap(), 3)
+        asyncio.run(test())
+
+    def test_input_is_consumed_lazily(self):
+        async def test():
+            pulled = []
+
+            def items():
+                for i in range(100):
+                    pulled.append(i)
+                    yield i
+
+            completed = []
+
+            async def work(item):
+                await asyncio.sleep(0.01)
+                completed.append(item)
+                return item
+
+            results = bounded_map(work, items(), concurrency=4)
+            async for result in results:
+                if result.index == 1:
+                    break
+            await results.aclose()
+            self.assertLessEqual(len(pulled), 6)
+            # Calls still in flight were cancelled
+            await asyncio.sleep(0.05)
+            self.assertLess(len(completed), len(pulled))
+        asyncio.run(test())
+
+    def test_invalid_concurrency(self):
+        async def test():
+            with self.assertRaises(TreillageValueError):
+                await bounded_map(lambda x: x, [], concurrency=0).__anext__()
+        asyncio.run(test())
+
+
+class TestSend(unittest.TestCase):
+    def test_methods(self):
+        async def test():
+            conn = MockConnection()
+            await send(conn, BulkRequest('/a', params={'limit': 1}))
+            await send(conn, BulkRequest('/b', 'patch', body={'x': 1}))
+            await send(conn, BulkRequest('/c', 'DELETE'))
+            self.assertEqual(conn.calls, [
+                ('GET', '/a', {'limit': 1}, None),
+                ('PATCH', '/b', {'x': 1}, None),
+                ('DELETE', '/c', None),
+            ])
+        asyncio.run(test())
+
+    def test_rate_limited_retry(self):
+        async def test():
+            conn = MockConnection(rate_limited=2)
+            await send(conn, BulkRequest('/a'))
+            self.assertEqual(len(conn.calls), 3)
+            conn = MockConnection(rate_limited=1)
+            with self.assertRaises(TreillageRateLimitException):
+                await send(conn, BulkRequest('/a'), retry_rate_limited=False)
+        asyncio.run(test())
+
+    def test_invalid_request(self):
+        with self.assertRaises(TreillageValueError):
+            BulkRequest('/a', 'HEAD')
+        with self.assertRaises(TreillageValueError):
+            BulkRequest('/a', 'POST', params={'limit': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
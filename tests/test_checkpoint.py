@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from treillage import (CheckpointStore, FileCheckpointStore,
+                       SQLiteCheckpointStore)
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def test_make_key_ignores_window(self):
+        self.assertEqual(
+            CheckpointStore.make_key('/core/contacts',
+                                     {'firstName': 'James', 'offset': 200,
+                                      'limit': 100}),
+            CheckpointStore.make_key('/core/contacts', {'firstName': 'James'})
+        )
+        self.assertNotEqual(
+            CheckpointStore.make_key('/core/contacts', {'firstName': 'James'}),
+            CheckpointStore.make_key('/core/contacts', {'firstName': 'Joe'})
+        )
+
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoints.json')
+            store = FileCheckpointStore(path)
+            self.assertIsNone(store.load('key'))
+            store.save('key', 300)
+            self.assertEqual(FileCheckpointStore(path).load('key'), 300)
+            store.clear('key')
+            self.assertIsNone(FileCheckpointStore(path).load('key'))
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoints.db')
+            store = SQLiteCheckpointStore(path)
+            self.assertIsNone(store.load('key'))
+            store.save('key', 300)
+            store.save('key', 400)
+            reopened = SQLiteCheckpointStore(path)
+            self.assertEqual(reopened.load('key'), 400)
+            store.clear('key')
+            self.assertIsNone(reopened.load('key'))
+            store.close()
+            reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from treillage import (JSONCodec, StdlibJSONCodec, OrjsonCodec, MsgspecCodec,
+                       TreillageException, TreillageValueError, get_codec)
+
+
+def installed_codecs():
+    codecs = [StdlibJSONCodec()]
+    for codec_class in (OrjsonCodec, MsgspecCodec):
+        try:
+            codecs.append(codec_class())
+        except TreillageException:
+            pass
+    return codecs
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip(self):
+        page = {
+            'count': 1,
+            'hasMore': False,
+            'items': [{'personId': {'native': 1}, 'fullName': 'Zoë Doe',
+                       'phones': [], 'isMinor': False, 'notes': None}]
+        }
+        for codec in installed_codecs():
+            with self.subTest(codec=codec.name):
+                encoded = codec.dumps(page)
+                self.assertIsInstance(encoded, bytes)
+                self.assertEqual(codec.loads(encoded), page)
+                self.assertEqual(StdlibJSONCodec().loads(encoded), page)
+
+    def test_get_codec(self):
+        self.assertIsInstance(get_codec('json'), StdlibJSONCodec)
+        self.assertIsInstance(get_codec('auto'), JSONCodec)
+        codec = StdlibJSONCodec()
+        self.assertIs(get_codec(codec), codec)
+        with self.assertRaises(TreillageValueError):
+            get_codec('yaml')
+
+
+if __name__ == '__main__':
+    unittest.main()
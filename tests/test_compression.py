@@ -0,0 +1,199 @@
+from aiohttp import web
+import asyncio
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+from treillage import (ConnectionManager, Credential, CompressionPolicy,
+                       HttpxTransport, TreillageValueError)
+from test_connection_manager import MockTokenManager
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+PAGE = json.dumps({
+    'items': [{'personId': {'native': i}, 'fullName': f'Contact {i}'}
+              for i in range(100)],
+    'hasMore': False,
+}).encode()
+
+
+async def start_server(received: list):
+    async def contacts(request):
+        received.append(dict(request.headers))
+        if 'gzip' not in request.headers.get('Accept-Encoding', ''):
+            return web.Response(body=PAGE, content_type='application/json')
+        return web.Response(body=gzip.compress(PAGE),
+                            content_type='application/json',
+                            headers={'Content-Encoding': 'gzip'})
+
+    async def echo(request):
+        received.append(dict(request.headers))
+        # aiohttp decompresses the request body
+        return web.json_response(await request.json())
+
+    async def strict(request):
+        received.append(dict(request.headers))
+        if 'Content-Encoding' in request.headers:
+            return web.Response(status=415)
+        return web.json_response(await request.json())
+
+    app = web.Application()
+    app.router.add_get('/core/contacts', contacts)
+    app.router.add_patch('/echo', echo)
+    app.router.add_post('/strict', strict)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+
+class TestCompressionPolicy(unittest.TestCase):
+    def test_options(self):
+        with self.assertRaises(TreillageValueError):
+            CompressionPolicy(level=10)
+        self.assertIn('gzip', CompressionPolicy().accept_encoding)
+        self.assertEqual(CompressionPolicy(accept_encoding='gzip')
+                         .accept_encoding, 'gzip')
+
+    def test_compress(self):
+        policy = CompressionPolicy(compress_requests=True, min_size=100)
+        self.assertIsNone(policy.compress(b'{}'))
+        data = json.dumps({'notes': 'x' * 1000}).encode()
+        compressed = policy.compress(data)
+        self.assertEqual(gzip.decompress(compressed), data)
+        self.assertEqual(policy.stats['compressed_requests'], 1)
+        self.assertEqual(policy.stats['request_bytes'], len(data))
+        self.assertLess(policy.stats['request_ratio'], 0.5)
+        policy.reject_requests()
+        self.assertFalse(policy.compress_requests)
+        self.assertIsNone(policy.compress(data))
+        self.assertIsNone(CompressionPolicy().compress(data))
+
+    def test_record_response(self):
+        policy = CompressionPolicy()
+        policy.record_response({}, 100)
+        policy.record_response({'Content-Encoding': 'gzip',
+                                'Content-Length': '40'}, 200)
+        # Transferred size unknown
+        policy.record_response({'Content-Encoding': 'gzip'}, 300)
+        policy.record_response({'Content-Encoding': 'br'}, 400, 100)
+        stats = policy.stats
+        self.assertEqual(stats['responses'], 4)
+        self.assertEqual(stats['compressed_responses'], 3)
+        self.assertEqual(stats['compressed_bytes'], 140)
+        self.assertEqual(stats['decompressed_bytes'], 600)
+        self.assertEqual(stats['response_bytes'], 1000)
+
+
+class TestCompression(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_compressed_responses(self):
+        async def test():
+            received = []
+            runner, url = await start_server(received)
+            try:
+                policy = CompressionPolicy(accept_encoding='gzip, deflate')
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret=''),
+                    compression=policy
+                )
+                self.assertIs(conn.compression, policy)
+                page = await conn.get('/core/contacts')
+                self.assertEqual(len(page['items']), 100)
+                self.assertEqual(received[0]['Accept-Encoding'],
+                                 'gzip, deflate')
+                stats = policy.stats
+                self.assertEqual(stats['compressed_responses'], 1)
+                self.assertEqual(stats['decompressed_bytes'], len(PAGE))
+                self.assertEqual(stats['compressed_bytes'],
+                                 len(gzip.compress(PAGE)))
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_compressed_requests(self):
+        async def test():
+            received = []
+            runner, url = await start_server(received)
+            try:
+                policy = CompressionPolicy(compress_requests=True,
+                                           min_size=256)
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret=''),
+                    compression=policy
+                )
+                body = {'notes': 'Called about the deposition. ' * 50}
+                self.assertEqual(await conn.patch('/echo', body), body)
+                self.assertEqual(received[-1]['Content-Encoding'], 'gzip')
+                # Small bodies are sent as they are
+                self.assertEqual(await conn.patch('/echo', {'a': 1}),
+                                 {'a': 1})
+                self.assertNotIn('Content-Encoding', received[-1])
+                self.assertEqual(policy.stats['compressed_requests'], 1)
+                self.assertLess(policy.stats['request_ratio'], 0.2)
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_rejected_compression(self):
+        async def test():
+            received = []
+            runner, url = await start_server(received)
+            try:
+                policy = CompressionPolicy(compress_requests=True,
+                                           min_size=0)
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret=''),
+                    rate_limit_token_regen_rate=10,
+                    compression=policy
+                )
+                body = {'notes': 'x' * 100}
+                self.assertEqual(await conn.post('/strict', body), body)
+                self.assertEqual(len(received), 2)
+                self.assertEqual(received[0]['Content-Encoding'], 'gzip')
+                self.assertNotIn('Content-Encoding', received[1])
+                self.assertFalse(policy.compress_requests)
+                # The request sent again took a rate limit token too
+                self.assertEqual(conn.rate_limiter.tokens, 8)
+                # Later requests are no longer compressed
+                self.assertEqual(await conn.post('/strict', body), body)
+                self.assertEqual(len(received), 3)
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_httpx_wire_bytes(self):
+        async def test():
+            received = []
+            runner, url = await start_server(received)
+            try:
+                policy = CompressionPolicy(accept_encoding='gzip')
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret=''),
+                    transport=HttpxTransport(http2=False),
+                    compression=policy
+                )
+                page = await conn.get('/core/contacts')
+                self.assertEqual(len(page['items']), 100)
+                self.assertEqual(policy.stats['compressed_bytes'],
+                                 len(gzip.compress(PAGE)))
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
@@ -1,11 +1,22 @@
 import aiohttp
+from aiohttp import web
 import asyncio
 from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+import time
 import unittest
+import zlib
 from unittest.mock import patch
 from treillage import (ConnectionManager, RateLimiter, TokenManager,
                        Credential, TreillageHTTPException,
-                       TreillageRateLimitException, retry_on_rate_limit)
+                       TreillageRateLimitException, retry_on_rate_limit,
+                       MemoryResponseCache, StdlibJSONCodec, BulkRequest,
+                       TreillageValueError, HedgingPolicy,
+                       TreillageTimeoutError, SQLiteResponseCache)
+from treillage.connection_manager import (_retry_on_rate_limit_with_deadline,
+                                          renew_access_token, rate_limit)
 
 
 class MockTokenManager(TokenManager):
@@ -41,19 +52,89 @@ class MockTokenManager(TokenManager):
         )
 
 
+class MockStreamReader:
+    def __init__(self, response):
+        self.response = response
+
+    async def iter_chunked(self, size):
+        body = await self.response.read()
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+
+
 class MockResponse:
-    def __init__(self, status):
+    def __init__(self, status, headers=None, data=None):
         self.status = status
-        self.data = {'items': []}
+        self.data = data if data is not None else {'items': []}
         self.url = 'http://127.0.0.1'
+        self.headers = headers or {}
+        self.content = MockStreamReader(self)
 
     async def json(self):
         return self.data
 
+    async def read(self):
+        return json.dumps(self.data).encode()
+
     async def text(self):
         return None
 
 
+class MockRequestContext:
+    def __init__(self, session, status, delay, headers=None):
+        self.session = session
+        self.status = status
+        self.delay = delay
+        self.headers = headers
+
+    async def __aenter__(self):
+        self.session.requests += 1
+        self.session.request_headers.append(self.headers)
+        delay = self.delay
+        if isinstance(delay, list):
+            # One delay per request, in the order the requests are made
+            delay = delay.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.session.cancelled += 1
+            raise
+        return MockResponse(self.status, self.session.response_headers,
+                            self.session.data)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.session.released += 1
+
+
+class MockSession:
+    def __init__(self, status=200, delay=0.05, response_headers=None,
+                 data=None):
+        self.status = status
+        self.delay = delay
+        self.data = data
+        self.requests = 0
+        self.released = 0
+        self.cancelled = 0
+        self.request_headers = []
+        self.response_headers = response_headers
+
+    def get(self, **kwargs):
+        return MockRequestContext(self, self.status, self.delay,
+                                  kwargs.get('headers'))
+
+    def patch(self, **kwargs):
+        return MockRequestContext(self, self.status, self.delay)
+
+    async def close(self):
+        pass
+
+
+async def use_mock_session(conn: ConnectionManager, session: MockSession):
+    await conn._ConnectionManager__session.close()
+    conn._ConnectionManager__session = session
+    return session
+
+
 class TestRetryOnRateLimit(unittest.TestCase):
     @patch('treillage.connection_manager.TokenManager', MockTokenManager)
     def test_retry(self):
@@ -82,6 +163,26 @@ class TestRetryOnRateLimit(unittest.TestCase):
 
 
 class TestConnectionManager(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_request_decorators(self):
+        @rate_limit
+        @renew_access_token
+        async def request(conn: ConnectionManager):
+            return conn.token_manager.access_token_expiry
+
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=10
+            )
+            expiry = conn.token_manager.access_token_expiry
+            # The mock token expires within 90 seconds and is renewed
+            self.assertGreater(await request(conn), expiry)
+            self.assertEqual(conn.rate_limiter.tokens, 9)
+            await conn.close()
+        asyncio.run(test())
+
     @patch('treillage.connection_manager.TokenManager', MockTokenManager)
     def test_create(self):
         async def test():
@@ -365,6 +466,660 @@ class TestConnectionManager(unittest.TestCase):
             await conn.close()
         asyncio.run(test())
 
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    @patch('aiohttp.ClientSession', autospec=True)
+    def test_codec(self, mock_session):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                codec='json'
+            )
+            self.assertIsInstance(conn.codec, StdlibJSONCodec)
+            response = MockResponse(200)
+            self.assertEqual(
+                await conn._ConnectionManager__handle_response(response, 200),
+                response.data
+            )
+            try:
+                await conn.post(
+                    endpoint='/post',
+                    body={'firstName': 'John', 'lastName': 'Doe'}
+                )
+            except TreillageHTTPException:
+                pass
+            mock_session.return_value.post.assert_called_with(
+                url='http://127.0.0.1:4010/post',
+                data=b'{"firstName":"John","lastName":"Doe"}',
+                headers={
+                    'x-fv-sessionid': 'mock_refresh_token',
+                    'Authorization': 'Bearer mock_access_token',
+                    'Content-Type': 'application/json'
+                }
+            )
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_auth_headers_follow_token_rotation(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=0))
+            await conn.get('/core/contacts/1')
+            await conn.get('/core/contacts/2')
+            # The same headers are reused while the tokens do not change
+            self.assertIs(session.request_headers[0],
+                          session.request_headers[1])
+            conn.token_manager._MockTokenManager__access_token = 'rotated'
+            conn.token_manager._MockTokenManager__refresh_token = 'session'
+            await conn.get('/core/contacts/3')
+            self.assertEqual(session.request_headers[2], {
+                'x-fv-sessionid': 'session',
+                'Authorization': 'Bearer rotated'
+            })
+            # Headers passed in are extended, not replaced
+            await conn.get('/core/contacts/4', headers={'Accept': 'a/b'})
+            self.assertEqual(session.request_headers[3], {
+                'Accept': 'a/b',
+                'x-fv-sessionid': 'session',
+                'Authorization': 'Bearer rotated'
+            })
+            self.assertEqual(len(session.request_headers[0]), 2)
+            await conn.close()
+        asyncio.run(test())
+
+
+class TestConnectionPool(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_connector_options(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                max_connections=20,
+                connector_options={'limit': 50, 'keepalive_timeout': 60,
+                                   'ttl_dns_cache': 600}
+            )
+            self.assertIsInstance(conn.connector, aiohttp.TCPConnector)
+            self.assertEqual(conn.connector.limit, 50)
+            self.assertEqual(conn.connector.limit_per_host, 20)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_warm_up(self):
+        async def test():
+            peers = {'HEAD': set(), 'GET': set()}
+
+            async def handler(request):
+                peers[request.method].add(request.transport
+                                          .get_extra_info('peername'))
+                await asyncio.sleep(0.05)
+                return web.json_response({'items': []})
+
+            app = web.Application()
+            app.router.add_route('*', '/{tail:.*}', handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            try:
+                conn = await ConnectionManager.create(
+                    base_url=f'http://127.0.0.1:{port}',
+                    credentials=Credential(key='', secret=''),
+                    warm_up_connections=3
+                )
+                self.assertEqual(len(peers['HEAD']), 3)
+                await asyncio.gather(*(conn.get('/core/contacts')
+                                       for _ in range(3)))
+                # The first burst reuses the warmed connections
+                self.assertEqual(peers['GET'], peers['HEAD'])
+                await conn.close()
+
+                # Warm-up failures are ignored
+                conn = await ConnectionManager.create(
+                    base_url='http://127.0.0.1:1',
+                    credentials=Credential(key='', secret=''),
+                    warm_up_connections=2
+                )
+                self.assertEqual(await conn.warm_up(2), 0)
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+
+class TestDeadlines(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_timeout(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=1))
+            start = time.monotonic()
+            with self.assertRaises(TreillageTimeoutError):
+                await conn.get('/core/contacts/1', timeout=0.1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await conn.patch('/core/contacts/1', {},
+                                 deadline=time.monotonic() + 0.1)
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual(session.cancelled, 2)
+            # A deadline that has already passed sends nothing
+            with self.assertRaises(TreillageTimeoutError):
+                await conn.get('/core/contacts/1',
+                               deadline=time.monotonic() - 1)
+            self.assertEqual(session.requests, 2)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_rate_limit_wait_counts(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=1
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=0))
+            conn.rate_limiter.tokens = 0
+            start = time.monotonic()
+            with self.assertRaises(TreillageTimeoutError):
+                await conn.get('/core/contacts/1', timeout=0.2)
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual(session.requests, 0)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    @patch('aiohttp.ClientSession', autospec=True)
+    def test_request_timeout_option(self, mock_session):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            try:
+                await conn.delete(endpoint='/delete', timeout=5)
+            except TreillageHTTPException:
+                pass
+            timeout = mock_session.return_value.delete.call_args[1]['timeout']
+            self.assertIsInstance(timeout, aiohttp.ClientTimeout)
+            self.assertTrue(4 < timeout.total <= 5)
+            await conn.close()
+        asyncio.run(test())
+
+    def test_retry_deadline(self):
+        async def test():
+            deadlines = []
+
+            @_retry_on_rate_limit_with_deadline
+            async def request(timeout=None, deadline=None):
+                self.assertIsNone(timeout)
+                deadlines.append(deadline)
+                if len(deadlines) < 3:
+                    raise TreillageRateLimitException()
+                return True
+
+            self.assertTrue(await request(timeout=10))
+            # Every attempt shares the deadline set by the first one
+            self.assertEqual(len(set(deadlines)), 1)
+            self.assertIsNotNone(deadlines[0])
+        asyncio.run(test())
+
+    def test_retry_passes_timeout(self):
+        async def test():
+            calls = []
+
+            # A user function with a timeout of its own, and no deadline
+            @retry_on_rate_limit
+            async def request(timeout=None):
+                calls.append(timeout)
+                if len(calls) < 2:
+                    raise TreillageRateLimitException()
+                return True
+
+            self.assertTrue(await request(timeout=10))
+            self.assertEqual(calls, [10, 10])
+        asyncio.run(test())
+
+
+class TestHedging(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_hedged_get(self):
+        async def test():
+            policy = HedgingPolicy(initial_delay=0.05, max_hedge_ratio=1)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=10,
+                hedging=policy
+            )
+            self.assertIs(conn.hedging, policy)
+            # Skip the mock token refresh so that only the delays count
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(
+                conn, MockSession(delay=[1.0, 0.01, 0.01])
+            )
+            start = time.monotonic()
+            self.assertEqual(await conn.get('/core/contacts/1'),
+                             {'items': []})
+            self.assertLess(time.monotonic() - start, 0.5)
+            # The slow original request was cancelled
+            self.assertEqual(session.requests, 2)
+            self.assertEqual(session.cancelled, 1)
+            self.assertEqual(policy.stats['hedge_wins'], 1)
+            # The hedge took a rate limit token of its own
+            self.assertLess(conn.rate_limiter.tokens, 9)
+
+            # Fast responses are not hedged
+            await conn.get('/core/contacts/1')
+            self.assertEqual(session.requests, 3)
+            self.assertEqual(policy.stats['hedges'], 1)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_hedge_ratio_cap(self):
+        async def test():
+            policy = HedgingPolicy(initial_delay=0.01, max_hedge_ratio=0.5)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                hedging=policy
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=0.05))
+            for _ in range(4):
+                await conn.get('/core/contacts/1')
+            self.assertEqual(policy.requests, 4)
+            self.assertEqual(policy.hedges, 2)
+            self.assertEqual(session.requests, 6)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_rate_limiter_wait_is_not_latency(self):
+        async def test():
+            policy = HedgingPolicy(initial_delay=0.05, max_hedge_ratio=1)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=10,
+                hedging=policy
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=0.01))
+            conn.rate_limiter.tokens = 0
+            start = time.monotonic()
+            await conn.get('/core/contacts/1')
+            self.assertGreater(time.monotonic() - start, 0.05)
+            # Only the time after the token was taken is recorded
+            self.assertLess(policy._HedgingPolicy__latencies[0], 0.05)
+            self.assertEqual(session.requests, 1)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_no_hedge_during_backoff(self):
+        async def test():
+            policy = HedgingPolicy(initial_delay=0.05, max_hedge_ratio=1)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=10,
+                hedging=policy
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(
+                conn, MockSession(delay=[0.2, 0.01])
+            )
+            conn.rate_limiter.last_try_success(False)
+            await conn.get('/core/contacts/1')
+            self.assertEqual(session.requests, 1)
+            self.assertEqual(policy.hedges, 0)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_hedge_takes_free_token(self):
+        async def hedges(token_rate: int) -> tuple:
+            policy = HedgingPolicy(initial_delay=0.15, max_hedge_ratio=1)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limit_token_regen_rate=token_rate,
+                hedging=policy
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(
+                conn, MockSession(delay=[0.5, 0.01])
+            )
+            # The request takes the last token, as after a burst
+            conn.rate_limiter.tokens = 1
+            await conn.get('/core/contacts/1')
+            await conn.close()
+            return session.requests, policy.hedges, conn.rate_limiter.tokens
+
+        # Tokens regenerated during the hedge delay are used, although the
+        # bucket has not been refilled since the burst
+        requests, hedge_count, tokens = asyncio.run(hedges(10))
+        self.assertEqual(requests, 2)
+        self.assertEqual(hedge_count, 1)
+        self.assertLess(tokens, 1)
+        # Without a free token the hedge is neither sent nor waited for,
+        # and is not counted against the budget
+        requests, hedge_count, _ = asyncio.run(hedges(2))
+        self.assertEqual(requests, 1)
+        self.assertEqual(hedge_count, 0)
+
+
+class TestRequestCoalescing(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_coalesce_identical_requests(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                coalesce_requests=True
+            )
+            session = await use_mock_session(conn, MockSession())
+            results = await asyncio.gather(
+                *[conn.get('/core/contacts/1', {'requestedFields': 'a'})
+                  for _ in range(5)],
+                conn.get('/core/contacts/2')
+            )
+            self.assertEqual(session.requests, 2)
+            self.assertEqual(results[0], {'items': []})
+            self.assertIs(results[0], results[4])
+            # Once finished, the next call sends a new request
+            await conn.get('/core/contacts/1', {'requestedFields': 'a'})
+            self.assertEqual(session.requests, 3)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_coalesce_disabled_by_default(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            session = await use_mock_session(conn, MockSession())
+            await asyncio.gather(
+                *[conn.get('/core/contacts/1') for _ in range(3)]
+            )
+            self.assertEqual(session.requests, 3)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_coalesce_propagates_errors(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                coalesce_requests=True
+            )
+            session = await use_mock_session(conn, MockSession(status=429))
+            results = await asyncio.gather(
+                *[conn.get('/core/contacts/1') for _ in range(3)],
+                return_exceptions=True
+            )
+            self.assertEqual(session.requests, 1)
+            for result in results:
+                self.assertIsInstance(result, TreillageRateLimitException)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_coalesce_cancellation(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                coalesce_requests=True
+            )
+            session = await use_mock_session(conn, MockSession(delay=0.2))
+            first = asyncio.ensure_future(conn.get('/core/contacts/1'))
+            second = asyncio.ensure_future(conn.get('/core/contacts/1'))
+            await asyncio.sleep(0.05)
+            # Cancelling one waiter leaves the shared request running
+            first.cancel()
+            self.assertEqual(await second, {'items': []})
+            self.assertEqual(session.requests, 1)
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+
+            # Cancelling every waiter cancels the shared request
+            third = asyncio.ensure_future(conn.get('/core/contacts/1'))
+            await asyncio.sleep(0.05)
+            third.cancel()
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(conn._ConnectionManager__in_flight), 0)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_coalesce_after_abandoned_call(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                coalesce_requests=True
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            session = await use_mock_session(conn, MockSession(delay=0.05))
+            first = asyncio.ensure_future(conn.get('/core/contacts/1'))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            # The abandoned request is cancelled but not yet finished when
+            # the next caller arrives, which must start a request of its own
+            await asyncio.sleep(0)
+            self.assertTrue(first.done())
+            self.assertEqual(await conn.get('/core/contacts/1'),
+                             {'items': []})
+            self.assertEqual(session.requests, 2)
+            await conn.close()
+        asyncio.run(test())
+
+
+class TestResponseCache(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_cached_get(self):
+        async def test():
+            cache = MemoryResponseCache()
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                response_cache=cache
+            )
+            self.assertIs(conn.response_cache, cache)
+            session = await use_mock_session(conn, MockSession(delay=0))
+            await conn.get('/core/contacts/1')
+            await conn.get('/core/contacts/1')
+            await conn.get('/core/contacts/1', {'requestedFields': 'a'})
+            self.assertEqual(session.requests, 2)
+            self.assertEqual(cache.stats['hits'], 1)
+            # A successful write invalidates the cached path
+            await conn.patch('/core/contacts/1', {'firstName': 'Joe'})
+            await conn.get('/core/contacts/1')
+            self.assertEqual(session.requests, 4)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_cached_values_are_copies(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                response_cache=MemoryResponseCache()
+            )
+            session = await use_mock_session(conn, MockSession(delay=0))
+            (await conn.get('/core/contacts/1'))['items'].append(1)
+            (await conn.get('/core/contacts/1'))['items'].append(2)
+            self.assertEqual(await conn.get('/core/contacts/1'),
+                             {'items': []})
+            self.assertEqual(session.requests, 1)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_stale_entry_is_decoded_once(self):
+        async def test(path):
+            cache = SQLiteResponseCache(path, default_ttl=0.05)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                response_cache=cache
+            )
+            session = await use_mock_session(conn, MockSession(
+                delay=0, response_headers={'ETag': '"v1"'}
+            ))
+            await conn.get('/core/contacts/1')
+            await asyncio.sleep(0.1)
+            session.status = 304
+            with patch('treillage.response_cache.zlib.decompress',
+                       wraps=zlib.decompress) as decompress:
+                self.assertEqual(await conn.get('/core/contacts/1'),
+                                 {'items': []})
+            self.assertEqual(decompress.call_count, 1)
+            self.assertEqual(cache.stats['revalidations'], 1)
+            await conn.close()
+            cache.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(test(os.path.join(directory, 'cache.db')))
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_conditional_revalidation(self):
+        async def test():
+            cache = MemoryResponseCache(default_ttl=0.05)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                response_cache=cache
+            )
+            session = await use_mock_session(conn, MockSession(
+                delay=0,
+                response_headers={'ETag': '"v1"',
+                                  'Last-Modified': 'Tue, 01 Jun 2021'}
+            ))
+            first = await conn.get('/core/contacts/1')
+            self.assertNotIn('If-None-Match', session.request_headers[0])
+            await asyncio.sleep(0.1)
+            # The stale entry is revalidated and confirmed by a 304
+            session.status = 304
+            self.assertEqual(await conn.get('/core/contacts/1'), first)
+            self.assertEqual(session.request_headers[1]['If-None-Match'],
+                             '"v1"')
+            self.assertEqual(
+                session.request_headers[1]['If-Modified-Since'],
+                'Tue, 01 Jun 2021'
+            )
+            self.assertEqual(cache.stats['revalidations'], 1)
+            # The refreshed entry is fresh again
+            await conn.get('/core/contacts/1')
+            self.assertEqual(session.requests, 2)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_not_modified_without_cache_entry(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            with self.assertRaises(TreillageHTTPException):
+                response = MockResponse(304)
+                await conn._ConnectionManager__handle_response(response, 200)
+            await conn.close()
+        asyncio.run(test())
+
+
+class TestStreaming(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_stream(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            data = {'items': [{'id': i} for i in range(50)],
+                    'hasMore': True, 'count': 120}
+            session = await use_mock_session(
+                conn, MockSession(delay=0, data=data)
+            )
+            page = await conn.stream('/core/contacts',
+                                     {'offset': 0, 'limit': 50},
+                                     chunk_size=7)
+            items = [item async for item in page]
+            self.assertEqual(items, data['items'])
+            self.assertEqual(page.fields, {'hasMore': True, 'count': 120})
+            self.assertEqual(page.item_count, 50)
+            self.assertEqual(session.released, 1)
+            await conn.close()
+        asyncio.run(test())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_stream_error(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            session = await use_mock_session(
+                conn, MockSession(status=429, delay=0)
+            )
+            with self.assertRaises(TreillageRateLimitException):
+                await conn.stream('/core/contacts')
+            self.assertEqual(session.released, 1)
+            await conn.close()
+        asyncio.run(test())
+
+
+class TestExecuteMany(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_execute_many(self):
+        async def test():
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret='')
+            )
+            session = await use_mock_session(conn, MockSession(delay=0.01))
+            requests = [BulkRequest(f'/core/contacts/{i}') for i in range(3)]
+            requests.append({'endpoint': '/core/contacts/3',
+                             'method': 'PATCH',
+                             'body': {'firstName': 'Joe'}})
+            requests.append({'endpoint': '/core/contacts/4',
+                             'method': 'HEAD'})
+            results = [r async for r in conn.execute_many(requests,
+                                                          concurrency=2)]
+            self.assertEqual([r.ok for r in results],
+                             [True, True, True, True, False])
+            self.assertEqual(results[0].value, {'items': []})
+            self.assertIsInstance(results[4].exception, TreillageValueError)
+            self.assertEqual(session.requests, 4)
+
+            session.status = 404
+            results = [r async for r in conn.execute_many(requests[:2])]
+            self.assertTrue(all(isinstance(r.exception,
+                                           TreillageHTTPException)
+                                for r in results))
+            await conn.close()
+        asyncio.run(test())
+
 
 if __name__ == '__main__':
     unittest.main()
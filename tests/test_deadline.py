@@ -0,0 +1,48 @@
+import asyncio
+import time
+import unittest
+from treillage import TreillageTimeoutError
+from treillage.deadline import (make_deadline, remaining, deadline_options,
+                                run_with_deadline)
+
+
+class TestDeadline(unittest.TestCase):
+    def test_make_deadline(self):
+        self.assertIsNone(make_deadline(None, None))
+        now = time.monotonic()
+        self.assertAlmostEqual(make_deadline(10, None), now + 10, places=1)
+        self.assertEqual(make_deadline(None, now + 5), now + 5)
+        # The earlier of the two wins
+        self.assertEqual(make_deadline(60, now + 5), now + 5)
+        self.assertAlmostEqual(make_deadline(1, now + 5), now + 1, places=1)
+
+    def test_remaining(self):
+        self.assertTrue(0 < remaining(time.monotonic() + 5) <= 5)
+        with self.assertRaises(TreillageTimeoutError) as context:
+            remaining(time.monotonic() - 1, '/core/contacts')
+        self.assertEqual(context.exception.url, '/core/contacts')
+
+    def test_deadline_options(self):
+        self.assertEqual(deadline_options(), {})
+        self.assertEqual(deadline_options(timeout=5), {'timeout': 5})
+        self.assertEqual(deadline_options(5, 10),
+                         {'timeout': 5, 'deadline': 10})
+
+    def test_run_with_deadline(self):
+        async def test():
+            async def work(delay):
+                await asyncio.sleep(delay)
+                return delay
+
+            self.assertEqual(
+                await run_with_deadline(work(0.01), time.monotonic() + 1),
+                0.01
+            )
+            with self.assertRaises(TreillageTimeoutError):
+                await run_with_deadline(work(1), time.monotonic() + 0.05)
+            with self.assertRaises(TreillageTimeoutError):
+                await run_with_deadline(work(0), time.monotonic() - 1)
+        asyncio.run(test())
+
+    def test_is_asyncio_timeout(self):
+        self.assertIsInstance(TreillageTimeoutError(), asyncio.TimeoutError)
@@ -0,0 +1,51 @@
+import unittest
+from treillage import HedgingPolicy, TreillageValueError
+
+
+class TestHedgingPolicy(unittest.TestCase):
+    def test_delay_percentile(self):
+        policy = HedgingPolicy(percentile=90, initial_delay=0.5,
+                               min_samples=10)
+        for i in range(9):
+            policy.record(i / 100)
+        self.assertEqual(policy.delay(), 0.5)
+        policy.record(0.09)
+        self.assertAlmostEqual(policy.delay(), 0.08)
+        for _ in range(100):
+            policy.record(0.2)
+        self.assertAlmostEqual(policy.delay(), 0.2)
+
+    def test_delay_bounds(self):
+        policy = HedgingPolicy(min_delay=0.05, max_delay=1, min_samples=1)
+        policy.record(0.001)
+        self.assertEqual(policy.delay(), 0.05)
+        policy = HedgingPolicy(min_delay=0.05, max_delay=1, min_samples=1)
+        policy.record(30)
+        self.assertEqual(policy.delay(), 1)
+
+    def test_window(self):
+        policy = HedgingPolicy(percentile=100, window=5, min_samples=1)
+        policy.record(5)
+        for _ in range(5):
+            policy.record(0.1)
+        self.assertEqual(policy.delay(), 0.1)
+
+    def test_hedge_budget(self):
+        policy = HedgingPolicy(max_hedge_ratio=0.1)
+        for _ in range(9):
+            policy.request_started()
+        self.assertFalse(policy.allow_hedge())
+        policy.request_started()
+        self.assertTrue(policy.allow_hedge())
+        self.assertFalse(policy.allow_hedge())
+        self.assertEqual(policy.stats['hedge_rate'], 0.1)
+
+    def test_invalid(self):
+        with self.assertRaises(TreillageValueError):
+            HedgingPolicy(percentile=0)
+        with self.assertRaises(TreillageValueError):
+            HedgingPolicy(max_hedge_ratio=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,426 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from treillage import (TreillageRateLimitException, TreillageValueError,
+                       TreillageTimeoutError, SQLiteCheckpointStore)
+from treillage.endpoints.list_paginator import (list_paginator,
+                                                page_paginator,
+                                                AdaptivePageSize, Page)
+from treillage.endpoints import (get_contact_list, get_contact_pages,
+                                 get_document_list, get_document_pages)
+from treillage.streaming import JSONItemParser
+
+
+class MockConnection:
+    def __init__(self, total_items, delay=0.01, first_page_delay=None,
+                 rate_limited_offsets=None, report_count=True):
+        self.total_items = total_items
+        self.report_count = report_count
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = delay
+        self.first_page_delay = first_page_delay
+        self.rate_limited_offsets = set(rate_limited_offsets or [])
+        self.requested_offsets = []
+        self.requested_limits = []
+        self.cancelled_offsets = []
+        self.streamed_offsets = []
+        self.request_options = []
+
+    async def get(self, endpoint, params=None, headers=None, **options):
+        self.request_options.append(options)
+        offset = params['offset']
+        limit = params['limit']
+        self.requested_offsets.append(offset)
+        self.requested_limits.append(limit)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if offset == 0 and self.first_page_delay is not None:
+                await asyncio.sleep(self.first_page_delay)
+            else:
+                await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled_offsets.append(offset)
+            raise
+        finally:
+            self.in_flight -= 1
+        if offset in self.rate_limited_offsets:
+            self.rate_limited_offsets.remove(offset)
+            raise TreillageRateLimitException()
+        end = min(offset + limit, self.total_items)
+        resp = {
+            'offset': offset,
+            'limit': limit,
+            'hasMore': end < self.total_items,
+            'items': [{'id': i} for i in range(offset, end)]
+        }
+        if self.report_count:
+            resp['count'] = self.total_items
+        return resp
+
+    async def stream(self, endpoint, params=None, headers=None, **options):
+        resp = await self.get(endpoint, params, headers, **options)
+        self.streamed_offsets.append(params['offset'])
+        return MockStreamedResponse(json.dumps(resp).encode())
+
+
+class MockStreamedResponse:
+    def __init__(self, body, chunk_size=16):
+        self.parser = JSONItemParser()
+        self.chunks = [body[i:i + chunk_size]
+                       for i in range(0, len(body), chunk_size)]
+        self.closed = False
+
+    @property
+    def fields(self):
+        return self.parser.fields
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.closed = True
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            for item in self.parser.feed(chunk):
+                yield item
+        for item in self.parser.close():
+            yield item
+
+
+class TestListPaginator(unittest.TestCase):
+    def test_sequential(self):
+        async def test():
+            conn = MockConnection(total_items=250)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict())]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(250)))
+            self.assertEqual(conn.requested_offsets, [0, 100, 200])
+        asyncio.run(test())
+
+    def test_sequential_is_lazy(self):
+        async def test():
+            conn = MockConnection(total_items=250)
+            paginator = list_paginator(conn, '/core/contacts', dict())
+            await paginator.__anext__()
+            await asyncio.sleep(0.05)
+            self.assertEqual(conn.requested_offsets, [0])
+            await paginator.aclose()
+        asyncio.run(test())
+
+    def test_prefetch(self):
+        async def test():
+            conn = MockConnection(total_items=1000)
+            paginator = list_paginator(conn, '/core/contacts', dict(),
+                                       prefetch=3)
+            await paginator.__anext__()
+            self.assertEqual(conn.requested_offsets, [0, 100, 200, 300])
+            items = [item async for item in paginator]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(1, 1000)))
+        asyncio.run(test())
+
+    def test_prefetch_early_exit_cancels_pending(self):
+        async def test():
+            conn = MockConnection(total_items=1000, delay=0.1,
+                                  first_page_delay=0.01)
+            async for item in list_paginator(conn, '/core/contacts', dict(),
+                                             prefetch=2):
+                break
+            # The event loop finalizes the abandoned generator
+            await asyncio.sleep(0.01)
+            self.assertEqual(sorted(conn.cancelled_offsets), [100, 200])
+            self.assertEqual(len(asyncio.all_tasks()), 1)
+        asyncio.run(test())
+
+    def test_prefetch_close_cancels_pending(self):
+        async def test():
+            conn = MockConnection(total_items=1000, delay=0.1,
+                                  first_page_delay=0.01)
+            paginator = list_paginator(conn, '/core/contacts', dict(),
+                                       prefetch=2)
+            await paginator.__anext__()
+            await paginator.aclose()
+            self.assertEqual(sorted(conn.cancelled_offsets), [100, 200])
+            self.assertEqual(len(asyncio.all_tasks()), 1)
+        asyncio.run(test())
+
+    def test_endpoint_close_cancels_pending(self):
+        async def test(endpoint):
+            conn = MockConnection(total_items=1000, delay=0.1,
+                                  first_page_delay=0.01)
+            paginator = endpoint(conn, prefetch=2)
+            await paginator.__anext__()
+            # Closing the endpoint generator closes the paginator at once
+            await paginator.aclose()
+            self.assertEqual(sorted(conn.cancelled_offsets), [100, 200])
+            self.assertEqual(len(asyncio.all_tasks()), 1)
+
+        for endpoint in (get_contact_list, get_contact_pages,
+                         get_document_list, get_document_pages):
+            with self.subTest(endpoint=endpoint.__name__):
+                asyncio.run(test(endpoint))
+
+    def test_rate_limited_page_is_retried(self):
+        async def test():
+            conn = MockConnection(total_items=300,
+                                  rate_limited_offsets=[100])
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    prefetch=1)]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(300)))
+            self.assertEqual(conn.requested_offsets.count(100), 2)
+        asyncio.run(test())
+
+    def test_fan_out_ordered(self):
+        async def test():
+            conn = MockConnection(total_items=2050)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    concurrency=8)]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(2050)))
+            # No windows are requested past the reported count
+            self.assertEqual(sorted(conn.requested_offsets),
+                             list(range(0, 2100, 100)))
+            self.assertEqual(conn.max_in_flight, 8)
+        asyncio.run(test())
+
+    def test_fan_out_unordered(self):
+        async def test():
+            conn = MockConnection(total_items=2050)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    concurrency=8, ordered=False)]
+            self.assertEqual(sorted(item['id'] for item in items),
+                             list(range(2050)))
+            self.assertLessEqual(conn.max_in_flight, 8)
+        asyncio.run(test())
+
+    def test_fan_out_without_count(self):
+        async def test():
+            conn = MockConnection(total_items=450, report_count=False)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    concurrency=4)]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(450)))
+            # Speculative windows stop once hasMore is false
+            self.assertLessEqual(max(conn.requested_offsets), 700)
+            self.assertEqual(len(asyncio.all_tasks()), 1)
+        asyncio.run(test())
+
+    def test_fixed_page_size(self):
+        async def test():
+            conn = MockConnection(total_items=120)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    page_size=50)]
+            self.assertEqual(len(items), 120)
+            self.assertEqual(conn.requested_offsets, [0, 50, 100])
+            self.assertEqual(conn.requested_limits, [50, 50, 50])
+        asyncio.run(test())
+
+    def test_adaptive_page_size(self):
+        async def test():
+            conn = MockConnection(total_items=1000)
+            policy = AdaptivePageSize(initial=10, maximum=400)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    page_size=policy)]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(1000)))
+            self.assertEqual(conn.requested_limits,
+                             [10, 20, 40, 80, 160, 320, 400])
+        asyncio.run(test())
+
+    def test_checkpoint_resume(self):
+        async def test(path):
+            store = SQLiteCheckpointStore(path)
+            key = store.make_key('/core/documents/', {'folderId': '1'})
+            conn = MockConnection(total_items=500)
+            seen = []
+            async for item in list_paginator(conn, '/core/documents/',
+                                             {'folderId': '1'},
+                                             checkpoint=store, prefetch=2):
+                seen.append(item['id'])
+                if item['id'] == 250:
+                    break
+            await asyncio.sleep(0.01)
+            # Only fully consumed pages are checkpointed
+            self.assertEqual(store.load(key), 200)
+
+            conn = MockConnection(total_items=500)
+            items = [item async for item in
+                     list_paginator(conn, '/core/documents/',
+                                    {'folderId': '1'}, checkpoint=store)]
+            self.assertEqual(conn.requested_offsets, [200, 300, 400])
+            self.assertEqual([item['id'] for item in items],
+                             list(range(200, 500)))
+            self.assertIsNone(store.load(key))
+            store.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(test(os.path.join(directory, 'checkpoints.db')))
+
+    def test_checkpoint_unordered(self):
+        async def test(path):
+            store = SQLiteCheckpointStore(path)
+            conn = MockConnection(total_items=1000)
+            saved = []
+            save = store.save
+            store.save = lambda key, offset: (saved.append(offset),
+                                              save(key, offset))
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    concurrency=4, ordered=False,
+                                    checkpoint=store)]
+            self.assertEqual(len(items), 1000)
+            # The checkpoint only ever covers a contiguous prefix
+            self.assertEqual(saved, sorted(saved))
+            self.assertTrue(all(offset % 100 == 0 for offset in saved))
+            store.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(test(os.path.join(directory, 'checkpoints.db')))
+
+    def test_page_paginator(self):
+        async def test():
+            conn = MockConnection(total_items=250)
+            pages = [page async for page in
+                     page_paginator(conn, '/core/contacts', dict())]
+            self.assertTrue(all(isinstance(page, Page) for page in pages))
+            self.assertEqual([page.offset for page in pages], [0, 100, 200])
+            self.assertEqual([len(page) for page in pages], [100, 100, 50])
+            self.assertEqual([page.has_more for page in pages],
+                             [True, True, False])
+            self.assertEqual(pages[0].count, 250)
+            self.assertGreater(pages[0].latency, 0)
+            self.assertEqual([item['id'] for item in pages[2]],
+                             list(range(200, 250)))
+        asyncio.run(test())
+
+    def test_page_paginator_checkpoint(self):
+        async def test(path):
+            store = SQLiteCheckpointStore(path)
+            key = store.make_key('/core/contacts', dict())
+            conn = MockConnection(total_items=500)
+            pages = page_paginator(conn, '/core/contacts', dict(),
+                                   checkpoint=store)
+            await pages.__anext__()
+            self.assertIsNone(store.load(key))
+            # Asking for the next page marks the previous one as consumed
+            await pages.__anext__()
+            self.assertEqual(store.load(key), 100)
+            await pages.aclose()
+            store.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(test(os.path.join(directory, 'checkpoints.db')))
+
+    def test_stream(self):
+        async def test():
+            conn = MockConnection(total_items=250,
+                                  rate_limited_offsets=[100])
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    stream=True)]
+            self.assertEqual([item['id'] for item in items],
+                             list(range(250)))
+            self.assertEqual(conn.requested_offsets, [0, 100, 100, 200])
+            self.assertEqual(conn.streamed_offsets, [0, 100, 200])
+        asyncio.run(test())
+
+    def test_stream_checkpoint(self):
+        async def test(path):
+            store = SQLiteCheckpointStore(path)
+            conn = MockConnection(total_items=250)
+            paginator = list_paginator(conn, '/core/contacts', dict(),
+                                       stream=True, checkpoint=store)
+            async for item in paginator:
+                if item['id'] == 150:
+                    break
+            await paginator.aclose()
+            conn = MockConnection(total_items=250)
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    stream=True, checkpoint=store)]
+            self.assertEqual(items[0]['id'], 100)
+            key = store.make_key('/core/contacts', dict())
+            self.assertIsNone(store.load(key))
+            store.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(test(os.path.join(directory, 'checkpoints.db')))
+
+    def test_stream_rejects_buffering_options(self):
+        async def test():
+            conn = MockConnection(total_items=10)
+            for options in ({'prefetch': 1}, {'concurrency': 2},
+                            {'page_size': AdaptivePageSize()}):
+                with self.subTest(**options):
+                    with self.assertRaises(TreillageValueError):
+                        await list_paginator(conn, '/core/contacts', dict(),
+                                             stream=True,
+                                             **options).__anext__()
+        asyncio.run(test())
+
+    def test_deadline(self):
+        async def test():
+            conn = MockConnection(total_items=1000, delay=0.05)
+            deadline = time.monotonic() + 0.12
+            items = []
+            with self.assertRaises(TreillageTimeoutError):
+                async for item in list_paginator(conn, '/core/contacts',
+                                                 dict(), deadline=deadline):
+                    items.append(item)
+            # Pages that arrived before the deadline were yielded
+            self.assertTrue(0 < len(items) < 1000)
+            self.assertEqual(len(items) % 100, 0)
+            self.assertEqual(conn.request_options[0], {'deadline': deadline})
+        asyncio.run(test())
+
+    def test_page_timeout_covers_retries(self):
+        async def test():
+            conn = MockConnection(total_items=100,
+                                  rate_limited_offsets=[0])
+            items = [item async for item in
+                     list_paginator(conn, '/core/contacts', dict(),
+                                    timeout=5)]
+            self.assertEqual(len(items), 100)
+            # Both attempts for the first page share one deadline
+            self.assertEqual(conn.request_options[0],
+                             conn.request_options[1])
+        asyncio.run(test())
+
+
+class TestAdaptivePageSize(unittest.TestCase):
+    def test_shrinks_on_slow_page(self):
+        policy = AdaptivePageSize(initial=100, minimum=10, target_latency=1)
+        policy.record(100, 2.5, {'items': [{}] * 100})
+        self.assertEqual(policy.next_limit(), 50)
+        for _ in range(5):
+            policy.record(policy.next_limit(), 2.5, {'items': []})
+        self.assertEqual(policy.next_limit(), 10)
+
+    def test_shrinks_on_large_page(self):
+        policy = AdaptivePageSize(initial=100, max_page_bytes=1000)
+        page = {'items': [{'notes': 'x' * 100} for _ in range(100)]}
+        policy.record(100, 0.1, page)
+        self.assertEqual(policy.next_limit(), 50)
+
+    def test_does_not_grow_on_partial_page(self):
+        policy = AdaptivePageSize(initial=100)
+        policy.record(100, 0.1, {'items': [{}] * 30})
+        self.assertEqual(policy.next_limit(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+from aiohttp import web
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from treillage import (ConnectionManager, Credential, ProcessPoolRunner,
+                       RateLimiter, SharedRateLimiter, TreillageException,
+                       TreillageValueError)
+from test_connection_manager import MockTokenManager
+
+
+class LongLivedTokenManager(MockTokenManager):
+    @classmethod
+    async def create(cls, credentials, base_url):
+        self = LongLivedTokenManager(credentials, base_url)
+        self._MockTokenManager__access_token_expiry += 3600
+        return self
+
+
+async def fetch(connection, item):
+    await connection.get(f'/items/{item}')
+    return item * 2, os.getpid()
+
+
+async def fail_odd(connection, item):
+    if item % 2:
+        raise ValueError(f"odd item {item}")
+    return item
+
+
+class UnpicklableError(Exception):
+    def __init__(self, item, reason):
+        super().__init__(f"{item}: {reason}")
+
+
+async def raise_unpicklable(connection, item):
+    raise UnpicklableError(item, 'broken')
+
+
+async def return_unpicklable(connection, item):
+    return lambda: item
+
+
+class TestProcessPoolRunner(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+
+        async def item(request):
+            self.requests.append(time.monotonic())
+            return web.json_response({'id': request.match_info['id']})
+
+        async def start():
+            app = web.Application()
+            app.router.add_get('/items/{id}', item)
+            self.runner = web.AppRunner(app)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            return f'http://127.0.0.1:{port}'
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+        self.base_url = asyncio.run_coroutine_threadsafe(
+            start(), self.loop
+        ).result()
+        credentials = tempfile.NamedTemporaryFile('w', suffix='.yml',
+                                                  delete=False)
+        with credentials:
+            credentials.write('key: "key"\nsecret: "secret"\n')
+        self.credentials_file = credentials.name
+        # Workers are forked so that they inherit the patched token manager
+        patcher = patch('treillage.connection_manager.TokenManager',
+                        LongLivedTokenManager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(
+            self.runner.cleanup(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        os.unlink(self.credentials_file)
+
+    def run_map(self, func, items, **options):
+        async def test():
+            async with ProcessPoolRunner(
+                    self.credentials_file,
+                    self.base_url,
+                    mp_context=multiprocessing.get_context('fork'),
+                    **options
+            ) as runner:
+                return [result async for result in runner.map(func, items)]
+        return asyncio.run(test())
+
+    def test_map(self):
+        results = self.run_map(fetch, range(40), processes=2, batch_size=5)
+        self.assertEqual([result.index for result in results],
+                         list(range(40)))
+        self.assertEqual([result.value[0] for result in results],
+                         [i * 2 for i in range(40)])
+        self.assertEqual(len({result.value[1] for result in results}), 2)
+        self.assertEqual(len(self.requests), 40)
+
+    def test_shared_rate_limit(self):
+        start = time.monotonic()
+        results = self.run_map(fetch, range(40), processes=4, batch_size=5,
+                               requests_per_second=20)
+        self.assertTrue(all(result.ok for result in results))
+        # 20 tokens are in the bucket, the other 20 take a second to regen
+        self.assertGreater(self.requests[-1] - start, 0.9)
+        self.assertLess(self.requests[-1] - self.requests[0], 1.5)
+
+    def test_failures(self):
+        results = self.run_map(fail_odd, range(6), processes=2, batch_size=2)
+        self.assertEqual([result.ok for result in results],
+                         [True, False] * 3)
+        self.assertIsInstance(results[1].exception, ValueError)
+
+        results = self.run_map(raise_unpicklable, range(2), processes=1)
+        self.assertIsInstance(results[0].exception, TreillageException)
+        self.assertIn('UnpicklableError', str(results[0].exception))
+
+        results = self.run_map(return_unpicklable, range(3), processes=1,
+                               batch_size=2)
+        self.assertEqual(len(results), 3)
+        self.assertFalse(any(result.ok for result in results))
+
+    def test_batch_size(self):
+        with self.assertRaises(TreillageValueError):
+            ProcessPoolRunner(self.credentials_file, batch_size=0)
+
+
+class TestRateLimiterOption(unittest.TestCase):
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_rate_limiter_option(self):
+        async def test():
+            rate_limiter = SharedRateLimiter(token_rate=5)
+            conn = await ConnectionManager.create(
+                base_url='http://127.0.0.1:4010',
+                credentials=Credential(key='', secret=''),
+                rate_limiter=rate_limiter
+            )
+            self.assertIs(conn.rate_limiter, rate_limiter)
+            self.assertNotIsInstance(conn.rate_limiter, RateLimiter)
+            await conn.close()
+
+            with self.assertRaises(TreillageValueError):
+                ConnectionManager(
+                    'http://127.0.0.1:4010',
+                    Credential(key='', secret=''),
+                    rate_limit_token_regen_rate=5,
+                    rate_limiter=rate_limiter
+                )
+        asyncio.run(test())
@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from treillage import TreillageHTTPException, TreillageRateLimitException
+from treillage.endpoints import (CollectionItemUpdate,
+                                 update_collection_items,
+                                 merge_data_object, replace_data_object)
+
+
+class MockConnection:
+    def __init__(self, items, delay=0.02, rate_limited=None, missing=None):
+        self.items = items
+        self.delay = delay
+        # Number of times each method is rate limited before succeeding
+        self.rate_limited = dict(rate_limited or {})
+        self.missing = set(missing or [])
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __request(self, method, endpoint, *args):
+        self.calls.append((method, endpoint) + args)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if self.rate_limited.get(method):
+            self.rate_limited[method] -= 1
+            raise TreillageRateLimitException()
+        item_id = endpoint.rsplit('/', 1)[1]
+        if item_id in self.missing:
+            raise TreillageHTTPException(code=404)
+        return item_id
+
+    async def get(self, endpoint, params=None, headers=None):
+        item_id = await self.__request('GET', endpoint, params)
+        return {'itemId': item_id, 'dataObject': self.items[item_id]}
+
+    async def patch(self, endpoint, body, headers=None):
+        item_id = await self.__request('PATCH', endpoint)
+        self.items[item_id] = body['dataObject']
+        return {'itemId': item_id}
+
+
+def make_updates(count):
+    return [CollectionItemUpdate(project_id='10',
+                                 section_selector='documents',
+                                 item_id=str(i),
+                                 data={'dataObject': {'docs': [f'new{i}']}},
+                                 context=i)
+            for i in range(count)]
+
+
+class TestUpdateCollectionItems(unittest.TestCase):
+    def test_read_modify_write(self):
+        async def test():
+            conn = MockConnection(
+                {str(i): {'docs': [f'old{i}'], 'title': 't'}
+                 for i in range(20)}
+            )
+            results = [r async for r in update_collection_items(
+                conn, make_updates(20), concurrency=5, ordered=True)]
+            self.assertTrue(all(r.ok for r in results))
+            self.assertEqual(results[3].value, {'itemId': '3'})
+            self.assertEqual(conn.items['3'], {'docs': ['new3', 'old3']})
+            self.assertEqual(
+                conn.calls[0],
+                ('GET', '/core/projects/10/collections/documents/0',
+                 {'requestedFields': 'docs'})
+            )
+            # GETs and PATCHes of different rows overlap
+            self.assertEqual(conn.max_in_flight, 5)
+        asyncio.run(test())
+
+    def test_rate_limited_steps_are_retried(self):
+        async def test():
+            conn = MockConnection({'0': {'docs': []}},
+                                  rate_limited={'GET': 1, 'PATCH': 2})
+            results = [r async for r in update_collection_items(
+                conn, make_updates(1))]
+            self.assertTrue(results[0].ok)
+            self.assertEqual([call[0] for call in conn.calls],
+                             ['GET', 'GET', 'PATCH', 'PATCH', 'PATCH'])
+        asyncio.run(test())
+
+    def test_sinks(self):
+        async def test():
+            conn = MockConnection({str(i): {'docs': []} for i in range(3)},
+                                  missing=['1'])
+            succeeded = []
+            failed = []
+
+            async def on_result(update, response):
+                succeeded.append(update.context)
+
+            results = [r async for r in update_collection_items(
+                conn, make_updates(3),
+                on_result=on_result,
+                on_error=lambda u, step, e: failed.append((u.context, step))
+            )]
+            self.assertEqual(sorted(succeeded), [0, 2])
+            self.assertEqual(failed, [(1, 'get')])
+            failed_results = [r for r in results if not r.ok]
+            self.assertEqual(len(failed_results), 1)
+            self.assertEqual(failed_results[0].exception.code, 404)
+        asyncio.run(test())
+
+    def test_replace_without_get(self):
+        async def test():
+            conn = MockConnection({'0': {'docs': ['old']}})
+            update = CollectionItemUpdate('10', 'documents', '0',
+                                          {'dataObject': {'docs': ['new']}},
+                                          requested_fields=[])
+            results = [r async for r in update_collection_items(
+                conn, [update], merge=replace_data_object)]
+            self.assertTrue(results[0].ok)
+            self.assertEqual([call[0] for call in conn.calls], ['PATCH'])
+            self.assertEqual(conn.items['0'], {'docs': ['new']})
+        asyncio.run(test())
+
+
+class TestMergeDataObject(unittest.TestCase):
+    def test_merge(self):
+        current = {'dataObject': {'docs': [1], 'title': 'old', 'n': None}}
+        data = {'dataObject': {'docs': [2], 'title': 'new', 'n': [3]}}
+        self.assertEqual(merge_data_object(current, data),
+                         {'dataObject': {'docs': [2, 1], 'title': 'new',
+                                         'n': [3]}})
+        # The update data is left untouched
+        self.assertEqual(data['dataObject']['docs'], [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,22 @@
 import asyncio
+import multiprocessing
 import time
 import unittest
-from treillage import RateLimiter
+from treillage import (RateLimiter, SharedRateLimiter, RedisRateLimiter,
+                       TreillageException)
+
+try:
+    import fakeredis
+    import lupa  # noqa: F401, fakeredis runs Lua scripts with it
+except ImportError:
+    fakeredis = None
+
+
+def take_tokens(rate_limiter: SharedRateLimiter, count: int):
+    async def take():
+        for _ in range(count):
+            await rate_limiter.get_token()
+    asyncio.run(take())
 
 
 class TestRateLimiter(unittest.TestCase):
@@ -64,6 +79,151 @@ class TestRateLimiter(unittest.TestCase):
             1 / rl._RateLimiter__token_rate
         )
 
+    def test_try_get_token(self):
+        rl = RateLimiter(token_rate=10)
+        rl.tokens = 0
+        rl._RateLimiter__last_update = time.monotonic()
+        self.assertFalse(asyncio.run(rl.try_get_token()))
+        # Regenerated tokens are added before checking
+        time.sleep(0.15)
+        self.assertTrue(asyncio.run(rl.try_get_token()))
+        self.assertLess(rl.tokens, 1)
+        rl.tokens = 5
+        rl.last_try_success(False)
+        self.assertFalse(asyncio.run(rl.try_get_token()))
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    def test_burst(self):
+        rl = SharedRateLimiter(token_rate=10)
+        start = time.monotonic()
+        take_tokens(rl, 10)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertLess(rl.tokens, 1)
+
+    def test_processes_share_budget(self):
+        context = multiprocessing.get_context('spawn')
+        rl = SharedRateLimiter(token_rate=10, context=context)
+        start = time.monotonic()
+        workers = [context.Process(target=take_tokens, args=(rl, 10))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+        self.assertTrue(all(worker.exitcode == 0 for worker in workers))
+        # Ten tokens are in the bucket, the other ten take a second to regen
+        self.assertGreater(elapsed, 0.9)
+
+    def test_shared_backoff(self):
+        rl = SharedRateLimiter(token_rate=10)
+        rl.last_try_success(False)
+        self.assertEqual(1, rl._SharedRateLimiter__state[2])
+        start = time.monotonic()
+        take_tokens(rl, 1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        rl.last_try_success(True)
+        self.assertEqual(0, rl._SharedRateLimiter__state[2])
+
+    def test_try_get_token(self):
+        rl = SharedRateLimiter(token_rate=10)
+        take_tokens(rl, 10)
+        self.assertFalse(asyncio.run(rl.try_get_token()))
+        time.sleep(0.15)
+        self.assertTrue(asyncio.run(rl.try_get_token()))
+        self.assertLess(rl.tokens, 1)
+        time.sleep(0.15)
+        rl.last_try_success(False)
+        self.assertFalse(asyncio.run(rl.try_get_token()))
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis[lua] is not installed")
+class TestRedisRateLimiter(unittest.TestCase):
+    def setUp(self):
+        # Limiters on one fake server stand in for hosts sharing Redis
+        self.server = fakeredis.FakeServer()
+
+    def limiter(self, **options) -> RedisRateLimiter:
+        client = fakeredis.aioredis.FakeRedis(server=self.server)
+        return RedisRateLimiter(client, **options)
+
+    def test_hosts_share_budget(self):
+        async def test():
+            hosts = [self.limiter(token_rate=10) for _ in range(2)]
+            start = time.monotonic()
+            await asyncio.gather(*(
+                host.get_token() for host in hosts for _ in range(10)
+            ))
+            return time.monotonic() - start, hosts
+
+        elapsed, hosts = asyncio.run(test())
+        # Ten tokens are in the bucket, the other ten take a second to regen
+        self.assertGreater(elapsed, 0.85)
+        self.assertLess(elapsed, 1.5)
+        self.assertLess(min(host.tokens for host in hosts), 1)
+
+    def test_burst(self):
+        async def test():
+            rl = self.limiter(token_rate=10)
+            start = time.monotonic()
+            for _ in range(10):
+                await rl.get_token()
+            self.assertLess(time.monotonic() - start, 0.1)
+            await rl.get_token()
+            self.assertGreater(time.monotonic() - start, 0.09)
+        asyncio.run(test())
+
+    def test_shared_backoff(self):
+        async def test():
+            first = self.limiter(token_rate=10)
+            second = self.limiter(token_rate=10)
+            # Successes are not written while nothing is backing off
+            first.last_try_success(True)
+            self.assertFalse(first._RedisRateLimiter__pending)
+            first.last_try_success(False)
+            await first.flush()
+            start = time.monotonic()
+            await second.get_token()
+            self.assertGreaterEqual(time.monotonic() - start, 0.1)
+            self.assertEqual(1, second._RedisRateLimiter__failed_attempts)
+            second.last_try_success(True)
+            await second.flush()
+            await first.get_token()
+            self.assertEqual(0, first._RedisRateLimiter__failed_attempts)
+        asyncio.run(test())
+
+    def test_try_get_token(self):
+        async def test():
+            first = self.limiter(token_rate=10)
+            second = self.limiter(token_rate=10)
+            for _ in range(10):
+                await first.get_token()
+            # The other host sees the burst and reserves nothing
+            self.assertFalse(await second.try_get_token())
+            await asyncio.sleep(0.15)
+            self.assertTrue(await second.try_get_token())
+            self.assertFalse(await first.try_get_token())
+            await asyncio.sleep(0.15)
+            first.last_try_success(False)
+            await first.flush()
+            self.assertFalse(await second.try_get_token())
+        asyncio.run(test())
+
+    def test_separate_keys(self):
+        async def test():
+            first = self.limiter(token_rate=2, key='org-1')
+            second = self.limiter(token_rate=2, key='org-2')
+            start = time.monotonic()
+            for rl in (first, first, second, second):
+                await rl.get_token()
+            self.assertLess(time.monotonic() - start, 0.1)
+        asyncio.run(test())
+
+    def test_requires_client(self):
+        with self.assertRaises(TreillageException):
+            RedisRateLimiter()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,219 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import time
+import unittest
+from treillage import (MemoryResponseCache, SQLiteResponseCache,
+                       TieredResponseCache)
+
+
+class TestMemoryResponseCache(unittest.TestCase):
+    def test_hits_are_copies(self):
+        cache = MemoryResponseCache()
+        value = {'items': [{'id': 1}]}
+        cache.store('a', '/core/contacts', value)
+        value['items'].append({'id': 2})
+        cache.lookup('a').value['items'][0]['id'] = 3
+        self.assertEqual(cache.lookup('a').value, {'items': [{'id': 1}]})
+
+    def test_lookup_include_stale(self):
+        cache = MemoryResponseCache(default_ttl=0.01)
+        cache.store('a', '/core/contacts/1', {}, etag='"v1"')
+        time.sleep(0.02)
+        self.assertIsNone(cache.lookup('a'))
+        entry = cache.lookup('a', include_stale=True)
+        self.assertFalse(entry.fresh)
+        self.assertEqual(entry.etag, '"v1"')
+        self.assertEqual(cache.stats['misses'], 2)
+
+    def test_store_and_lookup(self):
+        cache = MemoryResponseCache(default_ttl=60)
+        self.assertIsNone(cache.lookup('a'))
+        cache.store('a', '/core/contacts/1', {'firstName': 'James'})
+        self.assertEqual(cache.lookup('a').value, {'firstName': 'James'})
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hit_rate'], 0.5)
+        self.assertEqual(cache.stats['entries'], 1)
+        self.assertGreater(cache.stats['bytes'], 0)
+
+    def test_ttl(self):
+        cache = MemoryResponseCache(default_ttl=0.1)
+        cache.store('a', '/core/contacts/1', {})
+        self.assertIsNotNone(cache.lookup('a'))
+        time.sleep(0.15)
+        self.assertIsNone(cache.lookup('a'))
+
+    def test_per_endpoint_ttl(self):
+        cache = MemoryResponseCache(
+            default_ttl=60,
+            ttls={'/core/documents/*': 0, '/core/contacts/*': 300}
+        )
+        self.assertEqual(cache.ttl_for('/core/contacts/1'), 300)
+        self.assertEqual(cache.ttl_for('/core/projects/1'), 60)
+        cache.store('a', '/core/documents/1', {})
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_max_entries(self):
+        cache = MemoryResponseCache(max_entries=2)
+        cache.store('a', '/a', 1)
+        cache.store('b', '/b', 2)
+        cache.lookup('a')
+        cache.store('c', '/c', 3)
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_lru_max_bytes(self):
+        cache = MemoryResponseCache(max_bytes=3000)
+        for key in 'abcd':
+            cache.store(key, '/' + key, 'x' * 900)
+        self.assertLessEqual(cache.size, 3000)
+        self.assertIsNone(cache.lookup('a'))
+        self.assertIsNotNone(cache.lookup('d'))
+        # Bodies larger than the whole cache are never stored
+        cache.store('e', '/e', 'x' * 4000)
+        self.assertIsNone(cache.lookup('e'))
+
+    def test_invalidate(self):
+        cache = MemoryResponseCache()
+        cache.store('a', '/core/contacts/1', {})
+        cache.store('b', '/core/contacts/1/phones', {})
+        cache.store('c', '/core/contacts/12', {})
+        cache.invalidate('/core/contacts/1')
+        self.assertIsNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
+
+
+class TestSQLiteResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persists_between_instances(self):
+        cache = SQLiteResponseCache(self.path)
+        cache.store('a', '/core/contacts/1', {'firstName': 'James'})
+        cache.close()
+        cache = SQLiteResponseCache(self.path)
+        self.assertEqual(cache.lookup('a').value, {'firstName': 'James'})
+        self.assertEqual(cache.stats['entries'], 1)
+        self.assertGreater(cache.size, 0)
+        cache.close()
+
+    def test_ttl(self):
+        cache = SQLiteResponseCache(self.path, default_ttl=0.1)
+        cache.store('a', '/core/contacts/1', {})
+        self.assertIsNotNone(cache.lookup('a'))
+        time.sleep(0.15)
+        self.assertIsNone(cache.lookup('a'))
+        cache.close()
+
+    def test_size_eviction(self):
+        cache = SQLiteResponseCache(self.path, max_bytes=2000)
+        for i in range(10):
+            cache.store(str(i), f'/core/contacts/{i}',
+                        {'notes': os.urandom(400).hex()})
+        self.assertLessEqual(cache.size, 2000)
+        self.assertIsNone(cache.lookup('0'))
+        self.assertIsNotNone(cache.lookup('9'))
+        self.assertGreater(cache.stats['evictions'], 0)
+        cache.close()
+
+    def test_hits_do_not_write(self):
+        cache = SQLiteResponseCache(self.path, max_bytes=1000)
+        db = cache._SQLiteResponseCache__db
+        for i in range(2):
+            cache.store(str(i), f'/core/contacts/{i}',
+                        {'notes': os.urandom(400).hex()})
+        changes = db.total_changes
+        for _ in range(10):
+            self.assertIsNotNone(cache.lookup('0'))
+        self.assertEqual(db.total_changes, changes)
+        # The pending access time still counts when the next store evicts
+        cache.store('2', '/core/contacts/2', {'notes': os.urandom(400).hex()})
+        self.assertIsNotNone(cache.lookup('0'))
+        self.assertIsNone(cache.lookup('1'))
+        cache.close()
+
+    def test_access_batch(self):
+        cache = SQLiteResponseCache(self.path, access_batch=2)
+        db = cache._SQLiteResponseCache__db
+        cache.store('a', '/core/contacts/1', {})
+        cache.store('b', '/core/contacts/2', {})
+        changes = db.total_changes
+        cache.lookup('a')
+        self.assertEqual(db.total_changes, changes)
+        cache.lookup('b')
+        self.assertEqual(db.total_changes, changes + 2)
+        cache.close()
+
+    def test_threads(self):
+        # Stats may be read from other threads while the event loop stores
+        cache = SQLiteResponseCache(self.path, max_bytes=20000)
+
+        def use(thread: int):
+            for i in range(200):
+                key = f'{thread}-{i}'
+                cache.store(key, f'/core/contacts/{i}',
+                            {'notes': os.urandom(100).hex()})
+                cache.lookup(key)
+                cache.stats
+
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(use, range(4)))
+        stored = cache._SQLiteResponseCache__db.execute(
+            "SELECT SUM(size) FROM responses"
+        ).fetchone()[0]
+        self.assertEqual(cache.size, stored)
+        self.assertLessEqual(cache.size, 20000)
+        cache.close()
+
+    def test_invalidate(self):
+        cache = SQLiteResponseCache(self.path)
+        cache.store('a', '/core/contacts/1', {})
+        cache.store('b', '/core/contacts/1/phones', {})
+        cache.store('c', '/core/contacts/12', {})
+        cache.invalidate('/core/contacts/1')
+        self.assertIsNone(cache.lookup('a'))
+        self.assertIsNone(cache.lookup('b'))
+        self.assertIsNotNone(cache.lookup('c'))
+        cache.close()
+
+    def test_validators_and_refresh(self):
+        cache = SQLiteResponseCache(self.path, default_ttl=0.05)
+        cache.store('a', '/core/contacts/1', {}, etag='"v1"',
+                    last_modified='Tue, 01 Jun 2021')
+        time.sleep(0.1)
+        self.assertIsNone(cache.lookup('a'))
+        stale = cache.get('a')
+        self.assertEqual(stale.conditional_headers, {
+            'If-None-Match': '"v1"',
+            'If-Modified-Since': 'Tue, 01 Jun 2021'
+        })
+        cache.refresh('a', stale)
+        self.assertIsNotNone(cache.lookup('a'))
+        self.assertEqual(cache.stats['revalidations'], 1)
+        cache.close()
+
+    def test_tiered(self):
+        persistent = SQLiteResponseCache(self.path)
+        persistent.store('a', '/core/contacts/1', {'firstName': 'James'})
+        memory = MemoryResponseCache()
+        cache = TieredResponseCache(memory, persistent)
+        self.assertEqual(cache.lookup('a').value, {'firstName': 'James'})
+        self.assertIsNotNone(memory.lookup('a'))
+        cache.store('b', '/core/contacts/2', {})
+        self.assertIsNotNone(persistent.lookup('b'))
+        cache.invalidate('/core/contacts/2')
+        self.assertIsNone(memory.lookup('b'))
+        self.assertIsNone(persistent.lookup('b'))
+        persistent.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
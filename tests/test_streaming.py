@@ -0,0 +1,67 @@
+import json
+import unittest
+from treillage import TreillageException
+from treillage.streaming import JSONItemParser
+
+
+def parse(body: bytes, chunk_size: int, items_key='items'):
+    parser = JSONItemParser(items_key)
+    items = []
+    for start in range(0, len(body), chunk_size):
+        items.extend(parser.feed(body[start:start + chunk_size]))
+    items.extend(parser.close())
+    return items, parser
+
+
+class TestJSONItemParser(unittest.TestCase):
+    def test_items_and_fields(self):
+        data = {
+            'count': 3,
+            'items': [{'id': 1, 'name': 'Zoë'}, 12.5, [1, {'a': None}]],
+            'hasMore': False,
+            'links': {'self': '/core/contacts'},
+        }
+        body = json.dumps(data, indent=2, ensure_ascii=False).encode()
+        # Every chunk size splits numbers, strings and multi-byte characters
+        for chunk_size in (1, 2, 3, 7, 64, len(body)):
+            with self.subTest(chunk_size=chunk_size):
+                items, parser = parse(body, chunk_size)
+                self.assertEqual(items, data['items'])
+                self.assertEqual(parser.fields, {
+                    'count': 3,
+                    'hasMore': False,
+                    'links': {'self': '/core/contacts'},
+                })
+                self.assertEqual(parser.item_count, 3)
+
+    def test_items_are_returned_as_they_complete(self):
+        parser = JSONItemParser()
+        self.assertEqual(parser.feed(b'{"items": [{"id": 1}, {"id"'), [
+            {'id': 1}
+        ])
+        self.assertEqual(parser.feed(b': 2}]'), [{'id': 2}])
+        self.assertEqual(parser.feed(b', "hasMore": true}'), [])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.fields, {'hasMore': True})
+
+    def test_custom_items_key(self):
+        body = b'{"items": "unchanged", "rows": [1, 2]}'
+        items, parser = parse(body, 5, items_key='rows')
+        self.assertEqual(items, [1, 2])
+        self.assertEqual(parser.fields, {'items': 'unchanged'})
+
+    def test_empty_items(self):
+        items, parser = parse(b'{"items":[],"hasMore":false}', 4)
+        self.assertEqual(items, [])
+        self.assertEqual(parser.fields, {'hasMore': False})
+
+    def test_invalid_bodies(self):
+        for body in (b'[1, 2]', b'{"items": [1, 2', b'{"items": [1, }',
+                     b'{"a": 1} {}'):
+            with self.subTest(body=body):
+                with self.assertRaises(TreillageException):
+                    parse(body, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+from aiohttp import web
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from treillage import (SyncTreillage, SQLiteResponseCache,
+                       SQLiteCheckpointStore, TreillageException,
+                       TreillageHTTPException)
+from test_connection_manager import MockTokenManager
+
+CONTACTS = [{'personId': {'native': i}} for i in range(250)]
+
+
+class Server:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.requests = []
+
+    async def start(self) -> str:
+        async def contacts(request):
+            self.requests.append(('GET', request.path))
+            offset = int(request.query.get('offset', 0))
+            limit = int(request.query.get('limit', 100))
+            return web.json_response({
+                'items': CONTACTS[offset:offset + limit],
+                'hasMore': offset + limit < len(CONTACTS)
+            })
+
+        async def session(request):
+            self.requests.append((request.method, request.path))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                self.active -= 1
+            if request.method == 'DELETE':
+                return web.Response(status=204,
+                                    content_type='application/json')
+            if request.method == 'GET':
+                return web.json_response({'thread': request.path})
+            return web.json_response(await request.json())
+
+        async def missing(request):
+            return web.json_response({'error': 'missing'}, status=404)
+
+        app = web.Application()
+        app.router.add_get('/core/contacts', contacts)
+        app.router.add_route('*', '/session', session)
+        app.router.add_get('/missing', missing)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+@patch('treillage.treillage.Credential', autospec=True)
+@patch('treillage.connection_manager.TokenManager', MockTokenManager)
+class TestSyncTreillage(unittest.TestCase):
+    def setUp(self):
+        # The server runs on its own loop, like a remote API would
+        self.server = Server()
+        self.server_loop = asyncio.new_event_loop()
+        self.server_thread = threading.Thread(
+            target=self.server_loop.run_forever, daemon=True
+        )
+        self.server_thread.start()
+        self.base_url = asyncio.run_coroutine_threadsafe(
+            self.server.start(), self.server_loop
+        ).result()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(
+            self.server.stop(), self.server_loop
+        ).result()
+        self.server_loop.call_soon_threadsafe(self.server_loop.stop)
+        self.server_thread.join()
+        self.server_loop.close()
+
+    def create(self, **options) -> SyncTreillage:
+        tr = SyncTreillage('creds.yml', self.base_url, **options)
+        tr.conn.connection.token_manager.\
+            _MockTokenManager__access_token_expiry += 3600
+        return tr
+
+    def test_verbs(self, mock_credential):
+        with self.create() as tr:
+            self.assertEqual(tr.conn.get('/session'), {'thread': '/session'})
+            self.assertEqual(tr.conn.post('/session', {'a': 1}), {'a': 1})
+            self.assertEqual(tr.conn.patch('/session', {'b': 2}), {'b': 2})
+            self.assertEqual(tr.conn.put('/session', {'c': 3}), {'c': 3})
+            tr.conn.delete('/session')
+            with self.assertRaises(TreillageHTTPException):
+                tr.conn.get('/missing')
+        self.assertEqual(
+            [method for method, _ in self.server.requests],
+            ['GET', 'POST', 'PATCH', 'PUT', 'DELETE']
+        )
+        mock_credential.get_credentials.assert_called_once_with('creds.yml')
+
+    def test_iterate_endpoint(self, mock_credential):
+        with self.create() as tr:
+            contacts = list(tr.endpoints.get_contact_list(page_size=100))
+            self.assertEqual(contacts, CONTACTS)
+            # Stopping early closes the generator on the loop
+            contacts = tr.endpoints.get_contact_list(page_size=100)
+            self.assertEqual(next(contacts), CONTACTS[0])
+            contacts.close()
+            with self.assertRaises(AttributeError):
+                tr.endpoints.not_an_endpoint
+
+    def test_sqlite_stores(self, mock_credential):
+        # Both are opened in this thread and used on the event loop thread
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SQLiteResponseCache(os.path.join(directory, 'cache.db'))
+            checkpoint = SQLiteCheckpointStore(
+                os.path.join(directory, 'checkpoints.db')
+            )
+            with self.create(response_cache=cache) as tr:
+                self.assertEqual(tr.conn.get('/session'),
+                                 {'thread': '/session'})
+                self.assertEqual(tr.conn.get('/session'),
+                                 {'thread': '/session'})
+                contacts = list(tr.endpoints.get_contact_list(
+                    page_size=100, checkpoint=checkpoint
+                ))
+            self.assertEqual(contacts, CONTACTS)
+            self.assertEqual(cache.stats['hits'], 1)
+            cache.close()
+            checkpoint.close()
+        self.assertEqual(
+            [path for _, path in self.server.requests].count('/session'), 1
+        )
+
+    def test_execute_many(self, mock_credential):
+        with self.create() as tr:
+            requests = [dict(method='GET', endpoint='/session')] * 5
+            results = list(tr.conn.execute_many(requests, concurrency=5))
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_threads_share_connection(self, mock_credential):
+        self.server.delay = 0.2
+        with self.create(requests_per_second=100) as tr:
+            rate_limiter = tr.conn.connection.rate_limiter
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda _: tr.conn.get('/session'), range(8)
+                ))
+            self.assertIs(tr.conn.connection.rate_limiter, rate_limiter)
+        self.assertEqual(len(results), 8)
+        # Calls from different threads overlap on the shared event loop
+        self.assertGreater(self.server.max_active, 1)
+
+    def test_blocking_call_from_loop_thread(self, mock_credential):
+        with self.create() as tr:
+            async def nested():
+                return tr.conn.get('/session')
+
+            with self.assertRaises(TreillageException):
+                tr.run(nested())
+
+    def test_close(self, mock_credential):
+        tr = self.create()
+        thread = tr._SyncTreillage__thread
+        self.assertTrue(thread.is_alive())
+        tr.close()
+        tr.close()
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(tr.loop.is_closed())
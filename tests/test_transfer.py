@@ -0,0 +1,475 @@
+from aiohttp import web
+import asyncio
+import gzip
+import hashlib
+import io
+import os
+import re
+import tempfile
+import unittest
+from unittest.mock import patch
+from treillage import (ConnectionManager, Credential, TransferStats,
+                       TreillageHTTPException, TreillageTimeoutError,
+                       TreillageIntegrityError, TreillageValueError)
+from treillage.endpoints import (download_document, download_documents,
+                                 get_document_locator, upload_document,
+                                 upload_documents, DocumentUpload)
+from test_connection_manager import MockTokenManager
+
+DOCUMENTS = {str(i): os.urandom(300 * 1024 + i) for i in range(6)}
+DOCUMENTS['large'] = os.urandom(1024 * 1024 + 100)
+
+
+class Server:
+    def __init__(self, delay: float = 0, ranges: bool = True):
+        self.delay = delay
+        self.ranges = ranges
+        self.active = 0
+        self.max_active = 0
+        self.file_headers = []
+        # Range starts that fail with a server error
+        self.fail_starts = set()
+        # Range starts whose connection is dropped halfway, once
+        self.drop_starts = set()
+        self.range_starts = []
+        self.uploads = dict()
+        self.upload_headers = []
+        self.attached = []
+        # Uploads whose connection is dropped halfway, once
+        self.drop_uploads = set()
+        # Responses with 429 before a document is created
+        self.rate_limited_creates = 0
+        # Gzip file bodies: None, 'negotiate' when accepted, or 'always'
+        self.gzip = None
+
+    async def start(self) -> str:
+        async def locator(request):
+            document_id = request.match_info['id']
+            return web.json_response({
+                'url': f'{self.url}/files/{document_id}?signature=secret'
+            })
+
+        async def file(request):
+            self.file_headers.append(dict(request.headers))
+            document_id = request.match_info['id']
+            if document_id not in DOCUMENTS:
+                return web.Response(status=404, text='missing')
+            body = DOCUMENTS[document_id]
+            status = 200
+            headers = {'ETag': '"v1"'}
+            match = re.match(r'bytes=(\d+)-(\d+)',
+                             request.headers.get('Range', ''))
+            drop = False
+            if match and self.ranges:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), len(body) - 1)
+                self.range_starts.append(start)
+                if start in self.fail_starts:
+                    return web.Response(status=500)
+                drop = start in self.drop_starts
+                self.drop_starts.discard(start)
+                status = 206
+                headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+                body = body[start:end + 1]
+            accept = request.headers.get('Accept-Encoding', '')
+            if (self.gzip == 'always' or
+                    (self.gzip == 'negotiate' and 'gzip' in accept)):
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+            headers['Content-Length'] = str(len(body))
+            response = web.StreamResponse(status=status, headers=headers)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                await response.prepare(request)
+                for start in range(0, len(body), 64 * 1024):
+                    if drop and start >= len(body) // 2:
+                        request.transport.close()
+                        return response
+                    await response.write(body[start:start + 64 * 1024])
+                    await asyncio.sleep(self.delay)
+            finally:
+                self.active -= 1
+            await response.write_eof()
+            return response
+
+        async def create(request):
+            if self.rate_limited_creates:
+                self.rate_limited_creates -= 1
+                return web.Response(status=429)
+            body = await request.json()
+            document_id = 1000 + len(self.uploads)
+            self.uploads[document_id] = None
+            return web.json_response({
+                'documentId': {'native': document_id, 'partner': None},
+                'filename': body['filename'],
+                'url': f'{self.url}/uploads/{document_id}?signature=secret'
+            })
+
+        async def receive(request):
+            document_id = int(request.match_info['id'])
+            self.upload_headers.append(dict(request.headers))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            data = bytearray()
+            try:
+                async for chunk in request.content.iter_chunked(64 * 1024):
+                    data += chunk
+                    await asyncio.sleep(self.delay)
+                    if (document_id in self.drop_uploads and
+                            len(data) > 100 * 1024):
+                        self.drop_uploads.discard(document_id)
+                        request.transport.close()
+                        return web.Response(status=500)
+            finally:
+                self.active -= 1
+            self.uploads[document_id] = bytes(data)
+            return web.Response()
+
+        async def attach(request):
+            self.attached.append((request.match_info['project'],
+                                  int(request.match_info['id']),
+                                  await request.json()))
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_get('/core/documents/{id}/locator', locator)
+        app.router.add_get('/files/{id}', file)
+        app.router.add_post('/core/documents', create)
+        app.router.add_put('/uploads/{id}', receive)
+        app.router.add_post('/core/projects/{project}/documents/{id}',
+                            attach)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f'http://127.0.0.1:{self.runner.addresses[0][1]}'
+        return self.url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class AsyncWriter:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.writes = 0
+
+    async def write(self, chunk: bytes):
+        self.writes += 1
+        self.buffer.write(chunk)
+
+
+class ServerTestCase(unittest.TestCase):
+    def run_with_server(self, test, delay: float = 0, ranges: bool = True):
+        @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+        async def run():
+            server = Server(delay, ranges)
+            url = await server.start()
+            conn = await ConnectionManager.create(
+                base_url=url,
+                credentials=Credential(key='', secret='')
+            )
+            conn.token_manager._MockTokenManager__access_token_expiry += 3600
+            try:
+                await test(conn, server)
+            finally:
+                await conn.close()
+                await server.stop()
+        asyncio.run(run())
+
+
+class TestDownload(ServerTestCase):
+    def test_download_to_file(self):
+        async def test(conn, server):
+            locator = await get_document_locator(conn, '1')
+            self.assertIn('/files/1', locator['url'])
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'document.pdf')
+                progress = []
+                result = await download_document(
+                    conn, '1', path, chunk_size=64 * 1024,
+                    on_progress=lambda done, total: progress.append(
+                        (done, total))
+                )
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), DOCUMENTS['1'])
+                self.assertEqual(os.listdir(directory), ['document.pdf'])
+            self.assertEqual(result.size, len(DOCUMENTS['1']))
+            self.assertGreater(result.throughput, 0)
+            self.assertEqual(progress[-1], (result.size, result.size))
+            self.assertGreater(len(progress), 1)
+            # The download URL is not part of the API
+            self.assertNotIn('Authorization', server.file_headers[0])
+        self.run_with_server(test)
+
+    def test_download_to_writer(self):
+        async def test(conn, server):
+            writer = AsyncWriter()
+            await download_document(conn, '2', writer, chunk_size=1024)
+            self.assertEqual(writer.buffer.getvalue(), DOCUMENTS['2'])
+            self.assertGreater(writer.writes, 1)
+            buffer = io.BytesIO()
+            await download_document(conn, '3', buffer)
+            self.assertEqual(buffer.getvalue(), DOCUMENTS['3'])
+        self.run_with_server(test)
+
+    def test_failed_download(self):
+        async def test(conn, server):
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'missing.pdf')
+                with self.assertRaises(TreillageHTTPException) as context:
+                    await download_document(conn, 'missing', path,
+                                            stats=stats)
+                self.assertEqual(context.exception.code, 404)
+                self.assertNotIn('secret', str(context.exception.url))
+                self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(stats.failed, 1)
+        self.run_with_server(test)
+
+    def test_stalled_download(self):
+        async def test(conn, server):
+            url = (await get_document_locator(conn, '1'))['url']
+            body = await conn.download(url, chunk_size=1024,
+                                       read_timeout=0.05)
+            with self.assertRaises(asyncio.TimeoutError):
+                async for _ in body:
+                    pass
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'document.pdf')
+                with self.assertRaises(TreillageTimeoutError):
+                    await download_document(conn, '1', path, timeout=0.3)
+                self.assertEqual(os.listdir(directory), [])
+        self.run_with_server(test, delay=0.1)
+
+    def test_download_many(self):
+        async def test(conn, server):
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                downloads = [(document_id,
+                              os.path.join(directory, document_id))
+                             for document_id in DOCUMENTS]
+                results = [result async for result in
+                           download_documents(conn, downloads,
+                                              concurrency=2, stats=stats)]
+                self.assertTrue(all(result.ok for result in results))
+                for document_id, path in downloads:
+                    with open(path, 'rb') as file:
+                        self.assertEqual(file.read(), DOCUMENTS[document_id])
+            self.assertEqual(server.max_active, 2)
+            self.assertEqual(stats.files, len(DOCUMENTS))
+            self.assertEqual(stats.bytes,
+                             sum(len(body) for body in DOCUMENTS.values()))
+            self.assertGreater(stats.throughput, 0)
+            self.assertEqual(stats.active, 0)
+        self.run_with_server(test, delay=0.01)
+
+    def test_identity_encoding(self):
+        async def test(conn, server):
+            server.gzip = 'negotiate'
+            writer = AsyncWriter()
+            result = await download_document(conn, '2', writer)
+            self.assertEqual(writer.buffer.getvalue(), DOCUMENTS['2'])
+            self.assertEqual(result.size, len(DOCUMENTS['2']))
+            self.assertEqual(server.file_headers[0]['Accept-Encoding'],
+                             'identity')
+        self.run_with_server(test)
+
+    def test_encoded_response(self):
+        async def test(conn, server):
+            # Servers that compress anyway are decoded, without a size check
+            server.gzip = 'always'
+            writer = AsyncWriter()
+            result = await download_document(conn, '2', writer)
+            self.assertEqual(writer.buffer.getvalue(), DOCUMENTS['2'])
+            self.assertEqual(result.size, len(DOCUMENTS['2']))
+
+            with tempfile.TemporaryDirectory() as directory:
+                with self.assertRaises(TreillageIntegrityError):
+                    await download_document(
+                        conn, 'large', os.path.join(directory, 'a.pdf'),
+                        parallel_ranges=2, range_size=256 * 1024
+                    )
+        self.run_with_server(test)
+
+
+class TestRangeDownload(ServerTestCase):
+    def test_parallel_ranges(self):
+        async def test(conn, server):
+            body = DOCUMENTS['large']
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'exhibit.pdf')
+                result = await download_document(
+                    conn, 'large', path, stats=stats,
+                    parallel_ranges=4, range_size=128 * 1024,
+                    checksum='sha256:' + hashlib.sha256(body).hexdigest()
+                )
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), body)
+                self.assertEqual(os.listdir(directory), ['exhibit.pdf'])
+            self.assertEqual(result.size, len(body))
+            self.assertEqual(stats.bytes, len(body))
+            self.assertEqual(sorted(server.range_starts),
+                             list(range(0, len(body), 128 * 1024)))
+            self.assertGreater(server.max_active, 1)
+            self.assertLessEqual(server.max_active, 4)
+        self.run_with_server(test, delay=0.01)
+
+    def test_resume(self):
+        async def test(conn, server):
+            body = DOCUMENTS['large']
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'exhibit.pdf')
+                server.fail_starts = {512 * 1024, 640 * 1024}
+                with self.assertRaises(TreillageHTTPException):
+                    await download_document(conn, 'large', path,
+                                            parallel_ranges=2,
+                                            range_size=128 * 1024)
+                self.assertEqual(sorted(os.listdir(directory)),
+                                 ['exhibit.pdf.part',
+                                  'exhibit.pdf.progress'])
+                server.fail_starts = set()
+                server.range_starts = []
+                progress = []
+                await download_document(
+                    conn, 'large', path, parallel_ranges=2,
+                    range_size=128 * 1024,
+                    on_progress=lambda done, total: progress.append(done)
+                )
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), body)
+                self.assertEqual(os.listdir(directory), ['exhibit.pdf'])
+            # Ranges completed before the failure were not fetched again
+            self.assertIn(512 * 1024, server.range_starts)
+            self.assertNotIn(0, server.range_starts)
+            self.assertEqual(progress[-1], len(body))
+        self.run_with_server(test)
+
+    def test_dropped_connection_is_retried(self):
+        async def test(conn, server):
+            body = DOCUMENTS['large']
+            server.drop_starts = {256 * 1024}
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'exhibit.pdf')
+                await download_document(conn, 'large', path, stats=stats,
+                                        parallel_ranges=3,
+                                        range_size=256 * 1024)
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), body)
+            self.assertEqual(server.range_starts.count(256 * 1024), 2)
+            self.assertEqual(stats.bytes, len(body))
+        self.run_with_server(test)
+
+    def test_checksum_mismatch(self):
+        async def test(conn, server):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'exhibit.pdf')
+                for parallel_ranges in (None, 2):
+                    with self.assertRaises(TreillageIntegrityError):
+                        await download_document(
+                            conn, 'large', path, checksum='md5:' + '0' * 32,
+                            parallel_ranges=parallel_ranges,
+                            range_size=256 * 1024
+                        )
+                    self.assertEqual(os.listdir(directory), [])
+            with self.assertRaises(TreillageValueError):
+                await download_document(conn, 'large', 'x', checksum='crc')
+            with self.assertRaises(TreillageValueError):
+                await download_document(conn, 'large', io.BytesIO(),
+                                        parallel_ranges=2)
+        self.run_with_server(test)
+
+    def test_ranges_not_supported(self):
+        async def test(conn, server):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'exhibit.pdf')
+                result = await download_document(conn, 'large', path,
+                                                 parallel_ranges=4,
+                                                 range_size=128 * 1024)
+                with open(path, 'rb') as file:
+                    self.assertEqual(file.read(), DOCUMENTS['large'])
+                self.assertEqual(os.listdir(directory), ['exhibit.pdf'])
+            self.assertEqual(result.size, len(DOCUMENTS['large']))
+        self.run_with_server(test, ranges=False)
+
+
+class TestUpload(ServerTestCase):
+    @staticmethod
+    def write_files(directory: str) -> list:
+        paths = []
+        for document_id, body in DOCUMENTS.items():
+            path = os.path.join(directory, f'{document_id}.pdf')
+            with open(path, 'wb') as file:
+                file.write(body)
+            paths.append(path)
+        return paths
+
+    def test_upload_document(self):
+        async def test(conn, server):
+            with tempfile.TemporaryDirectory() as directory:
+                path = self.write_files(directory)[0]
+                progress = []
+                result = await upload_document(
+                    conn, path, project_id='77', folder_id='5',
+                    chunk_size=64 * 1024,
+                    on_progress=lambda sent, total: progress.append(sent)
+                )
+            body = DOCUMENTS['0']
+            self.assertEqual(server.uploads[result.document_id], body)
+            self.assertEqual(result.size, len(body))
+            self.assertEqual(progress[-1], len(body))
+            self.assertGreater(len(progress), 1)
+            headers = server.upload_headers[0]
+            self.assertEqual(headers['Content-Length'], str(len(body)))
+            self.assertNotIn('Transfer-Encoding', headers)
+            self.assertNotIn('Authorization', headers)
+            self.assertEqual(server.attached,
+                             [('77', result.document_id, {'folderId': '5'})])
+        self.run_with_server(test)
+
+    def test_upload_retries(self):
+        async def test(conn, server):
+            server.rate_limited_creates = 2
+            server.drop_uploads = {1000}
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                path = self.write_files(directory)[0]
+                result = await upload_document(conn, path, stats=stats,
+                                               chunk_size=16 * 1024)
+            self.assertEqual(result.document_id, 1000)
+            self.assertEqual(server.uploads, {1000: DOCUMENTS['0']})
+            self.assertEqual(len(server.upload_headers), 2)
+            self.assertEqual(stats.bytes, len(DOCUMENTS['0']))
+            self.assertEqual(server.attached, [])
+        self.run_with_server(test)
+
+    def test_upload_many(self):
+        async def test(conn, server):
+            stats = TransferStats()
+            with tempfile.TemporaryDirectory() as directory:
+                paths = self.write_files(directory)
+                uploads = paths[:-1] + [
+                    DocumentUpload(paths[-1], filename='renamed.pdf',
+                                   project_id='99', context='last')
+                ]
+                results = [result async for result in
+                           upload_documents(conn, uploads, concurrency=2,
+                                            project_id='77', stats=stats)]
+            self.assertTrue(all(result.ok for result in results))
+            self.assertEqual(
+                sorted(server.uploads.values()),
+                sorted(DOCUMENTS.values())
+            )
+            self.assertEqual(server.max_active, 2)
+            self.assertEqual(stats.files, len(DOCUMENTS))
+            self.assertEqual(stats.bytes,
+                             sum(len(body) for body in DOCUMENTS.values()))
+            projects = sorted(project for project, _, _ in server.attached)
+            self.assertEqual(projects, ['77'] * (len(DOCUMENTS) - 1) + ['99'])
+            last = next(result for result in results
+                        if isinstance(result.item, DocumentUpload))
+            self.assertEqual(last.item.context, 'last')
+        self.run_with_server(test, delay=0.005)
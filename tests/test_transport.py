@@ -0,0 +1,159 @@
+from aiohttp import web
+import asyncio
+import unittest
+from unittest.mock import patch
+from treillage import (ConnectionManager, Credential, AiohttpTransport,
+                       HttpxTransport, Transport, TreillageHTTPException,
+                       TreillageValueError)
+from test_connection_manager import MockTokenManager
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+async def start_server():
+    async def contacts(request):
+        return web.json_response({'items': [{'id': i} for i in range(20)],
+                                  'hasMore': False})
+
+    async def echo(request):
+        return web.json_response({'body': await request.json(),
+                                  'type': request.content_type})
+
+    async def missing(request):
+        return web.Response(status=404, text='not found')
+
+    async def root(request):
+        return web.Response()
+
+    async def slow(request):
+        # Sends the headers and part of the body, then stalls
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(20):
+            await response.write(b'x' * 10)
+            await asyncio.sleep(0.05)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get('/core/contacts', contacts)
+    app.router.add_post('/echo', echo)
+    app.router.add_get('/missing', missing)
+    app.router.add_route('HEAD', '/', root)
+    app.router.add_get('/slow', slow)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f'http://127.0.0.1:{runner.addresses[0][1]}'
+
+
+class TestTransport(unittest.TestCase):
+    def test_transport_options(self):
+        with self.assertRaises(TreillageValueError):
+            ConnectionManager('http://127.0.0.1', None, transport='curl')
+        with self.assertRaises(TreillageValueError):
+            ConnectionManager('http://127.0.0.1', None, transport='httpx',
+                              connector_options={'limit': 10})
+        with self.assertRaises(TreillageValueError):
+            ConnectionManager('http://127.0.0.1', None, max_connections=4,
+                              transport=Transport())
+
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_aiohttp_transport(self):
+        async def test():
+            runner, url = await start_server()
+            try:
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret='')
+                )
+                self.assertIsInstance(conn.transport, AiohttpTransport)
+                resp = await conn.get('/core/contacts')
+                self.assertEqual(len(resp['items']), 20)
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    @patch('treillage.connection_manager.TokenManager', MockTokenManager)
+    def test_httpx_transport(self):
+        async def test():
+            runner, url = await start_server()
+            try:
+                conn = await ConnectionManager.create(
+                    base_url=url,
+                    credentials=Credential(key='', secret=''),
+                    transport='httpx',
+                    codec='json'
+                )
+                self.assertIsInstance(conn.transport, HttpxTransport)
+                self.assertEqual(await conn.warm_up(2), 2)
+                resp = await conn.get('/core/contacts', {'limit': 20})
+                self.assertEqual(len(resp['items']), 20)
+                resp = await conn.post('/echo', {'firstName': 'Joe'})
+                self.assertEqual(resp, {'body': {'firstName': 'Joe'},
+                                        'type': 'application/json'})
+                page = await conn.stream('/core/contacts', chunk_size=16)
+                items = [item async for item in page]
+                self.assertEqual(len(items), 20)
+                self.assertEqual(page.fields, {'hasMore': False})
+                with self.assertRaises(TreillageHTTPException) as context:
+                    await conn.get('/missing')
+                self.assertEqual(context.exception.code, 404)
+                self.assertEqual(context.exception.msg, 'not found')
+                await conn.close()
+            finally:
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_httpx_total_timeout(self):
+        async def test():
+            runner, url = await start_server()
+            transport = HttpxTransport(timeout=0.3)
+            try:
+                # Each chunk arrives in time, but the whole body does not
+                with self.assertRaises(asyncio.TimeoutError):
+                    async with transport.get(url=url + '/slow') as resp:
+                        await resp.read()
+                with self.assertRaises(asyncio.TimeoutError):
+                    async with transport.get(url=url + '/slow') as resp:
+                        async for _ in resp.content.iter_chunked(10):
+                            pass
+                async with transport.get(url=url + '/slow',
+                                         timeout=None) as resp:
+                    self.assertEqual(len(await resp.read()), 200)
+            finally:
+                await transport.close()
+                await runner.cleanup()
+        asyncio.run(test())
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_httpx_read_timeout(self):
+        async def test():
+            runner, url = await start_server()
+            transport = HttpxTransport(timeout=None)
+            transport.client.timeout = httpx.Timeout(None, read=0.01)
+            try:
+                # httpx's own timeouts while reading the body are reported
+                # as asyncio.TimeoutError too
+                with self.assertRaises(asyncio.TimeoutError):
+                    async with transport.get(url=url + '/slow') as resp:
+                        await resp.read()
+                with self.assertRaises(asyncio.TimeoutError):
+                    async with transport.get(url=url + '/slow') as resp:
+                        async for _ in resp.content.iter_chunked(10):
+                            pass
+            finally:
+                await transport.close()
+                await runner.cleanup()
+        asyncio.run(test())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -136,6 +136,24 @@ class TestTreillage(unittest.TestCase):
 
         asyncio.run(test())
 
+    def test_connection_options(self, mock_connection_manager,
+                                mock_credential):
+        async def test():
+            async with Treillage(
+                    credentials_file='creds.yml',
+                    requests_per_second=20,
+                    coalesce_requests=True
+            ) as tr:
+                mock_connection_manager.create.assert_called_once_with(
+                    BaseURL.UNITED_STATES.value,
+                    tr._Treillage__credential,
+                    None,
+                    20,
+                    coalesce_requests=True
+                )
+
+        asyncio.run(test())
+
 
 if __name__ == '__main__':
     unittest.main()
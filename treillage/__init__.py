@@ -1,12 +1,27 @@
 from ._version import get_versions
 from .treillage import Treillage
 from .treillage import BaseURL
+from .sync import SyncTreillage
 from .exceptions import *
 from .credential import Credential
-from .ratelimiter import RateLimiter
+from .ratelimiter import (RateLimiter, RateLimiterBackend, SharedRateLimiter,
+                          RedisRateLimiter)
 from .token_manager import TokenManager
 from .connection_manager import ConnectionManager
 from .connection_manager import retry_on_rate_limit
+from .response_cache import (ResponseCache, MemoryResponseCache,
+                             SQLiteResponseCache, TieredResponseCache,
+                             CacheEntry)
+from .codec import (JSONCodec, StdlibJSONCodec, OrjsonCodec, MsgspecCodec,
+                    get_codec)
+from .transport import Transport, AiohttpTransport, HttpxTransport
+from .transfer import TransferStats, TransferResult, FileWriter
+from .hedging import HedgingPolicy
+from .compression import CompressionPolicy
+from .bulk import BulkRequest, BulkResult, bounded_map
+from .process_pool import ProcessPoolRunner
+from .checkpoint import (CheckpointStore, FileCheckpointStore,
+                         SQLiteCheckpointStore)
 
 __version__ = get_versions()['version']
 del get_versions
@@ -0,0 +1,147 @@
+import asyncio
+from collections import deque
+from .exceptions import TreillageRateLimitException, TreillageValueError
+
+METHODS = ('GET', 'POST', 'PATCH', 'PUT', 'DELETE')
+
+
+class BulkRequest:
+    """One request to send with `ConnectionManager.execute_many`"""
+
+    def __init__(self,
+                 endpoint: str,
+                 method: str = 'GET',
+                 params: dict = None,
+                 body: dict = None,
+                 headers: dict = None):
+        method = method.upper()
+        if method not in METHODS:
+            raise TreillageValueError(
+                f"Unsupported method {method}, expected one of: " +
+                ', '.join(METHODS)
+            )
+        if params and method != 'GET':
+            raise TreillageValueError(
+                "Query parameters are only supported for GET requests"
+            )
+        self.endpoint = endpoint
+        self.method = method
+        self.params = params
+        self.body = body
+        self.headers = headers
+
+    def __repr__(self):
+        return f"BulkRequest({self.method} {self.endpoint})"
+
+
+class BulkResult:
+    """The outcome of one item of a bulk run"""
+
+    def __init__(self, item, index: int, value=None, exception=None):
+        # The input the result belongs to and its position in the input
+        self.item = item
+        self.index = index
+        self.value = value
+        self.exception = exception
+
+    @property
+    def ok(self) -> bool:
+        return self.exception is None
+
+    def unwrap(self):
+        """Return the value, or raise the exception the item failed with"""
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, '__aiter__'):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+async def _run(func, item, index: int) -> BulkResult:
+    try:
+        return BulkResult(item, index, value=await func(item))
+    except Exception as exception:
+        return BulkResult(item, index, exception=exception)
+
+
+async def bounded_map(func,
+                      iterable,
+                      concurrency: int = 10,
+                      ordered: bool = True):
+    """
+    Await `func(item)` for every item with at most `concurrency` in flight
+
+    `iterable` may be a regular or an async iterable and is only consumed
+    as capacity frees up, so it can be arbitrarily long. A `BulkResult` is
+    yielded for every item, in input order or, with `ordered=False`, as soon
+    as each call completes. A call that raises does not stop the run; its
+    result carries the exception instead. Calls still in flight are
+    cancelled when the consumer stops early.
+    """
+    if concurrency < 1:
+        raise TreillageValueError("Concurrency must be at least 1")
+    items = _aiter(iterable)
+    pending = deque()
+    index = 0
+    exhausted = False
+
+    async def fill():
+        nonlocal index, exhausted
+        while not exhausted and len(pending) < concurrency:
+            try:
+                item = await items.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                break
+            pending.append(asyncio.ensure_future(_run(func, item, index)))
+            index += 1
+
+    try:
+        await fill()
+        while pending:
+            if ordered:
+                results = [await pending.popleft()]
+            else:
+                await asyncio.wait(pending,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                done = [task for task in pending if task.done()]
+                for task in done:
+                    pending.remove(task)
+                results = [task.result() for task in done]
+            # Start the next calls before handing results to the consumer
+            await fill()
+            for result in results:
+                yield result
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        await items.aclose()
+
+
+async def send(connection, request: BulkRequest, retry_rate_limited=True):
+    """Send a single `BulkRequest` with the matching connection method"""
+    while True:
+        try:
+            if request.method == 'GET':
+                return await connection.get(request.endpoint,
+                                            request.params,
+                                            request.headers)
+            if request.method == 'DELETE':
+                return await connection.delete(request.endpoint,
+                                               request.headers)
+            method = getattr(connection, request.method.lower())
+            return await method(request.endpoint,
+                                request.body,
+                                request.headers)
+        except TreillageRateLimitException:
+            if not retry_rate_limited:
+                raise
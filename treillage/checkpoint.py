@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class CheckpointStore:
+    """
+    Remember how far a paginated request has been consumed
+
+    Entries are keyed by endpoint and query parameters, so that a restarted
+    job asking for the same list resumes where the previous one stopped.
+    """
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict = None) -> str:
+        params = {
+            key: value for key, value in (params or dict()).items()
+            if key not in ('offset', 'limit')
+        }
+        return json.dumps([endpoint, params], sort_keys=True, default=str)
+
+    def load(self, key: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def save(self, key: str, offset: int):
+        raise NotImplementedError
+
+    def clear(self, key: str):
+        raise NotImplementedError
+
+
+class FileCheckpointStore(CheckpointStore):
+    """Keep checkpoints in a JSON file, rewritten atomically on each save"""
+
+    def __init__(self, path: str):
+        self.__path = path
+        if os.path.exists(path):
+            with open(path) as file:
+                self.__offsets = json.load(file)
+        else:
+            self.__offsets = dict()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def load(self, key: str) -> Optional[int]:
+        return self.__offsets.get(key)
+
+    def save(self, key: str, offset: int):
+        self.__offsets[key] = offset
+        self.__write()
+
+    def clear(self, key: str):
+        if self.__offsets.pop(key, None) is not None:
+            self.__write()
+
+    def __write(self):
+        temp_path = f"{self.__path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.__offsets, file)
+        os.replace(temp_path, self.__path)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Keep checkpoints in a SQLite database that can be shared by jobs"""
+
+    def __init__(self, path: str):
+        self.__path = path
+        # The store may be used from several threads, e.g. the event loop
+        # and the caller's thread with SyncTreillage, so every use of the
+        # connection holds the lock
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        with self.__db:
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "key TEXT PRIMARY KEY, "
+                "offset INTEGER NOT NULL, "
+                "updated REAL NOT NULL)"
+            )
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def load(self, key: str) -> Optional[int]:
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT offset FROM checkpoints WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, key: str, offset: int):
+        with self.__lock, self.__db:
+            self.__db.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, offset, updated) "
+                "VALUES (?, ?, ?)",
+                (key, offset, time.time())
+            )
+
+    def clear(self, key: str):
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
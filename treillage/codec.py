@@ -0,0 +1,84 @@
+import json
+from typing import Union
+from .exceptions import TreillageException, TreillageValueError
+
+
+class JSONCodec:
+    """Encode request bodies to and decode response bodies from JSON bytes"""
+    name = None
+    content_type = 'application/json'
+
+    def dumps(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes):
+        raise NotImplementedError
+
+
+class StdlibJSONCodec(JSONCodec):
+    name = 'json'
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            raise TreillageException(
+                msg="The orjson codec requires the orjson package"
+            )
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+class MsgspecCodec(JSONCodec):
+    name = 'msgspec'
+
+    def __init__(self):
+        try:
+            import msgspec
+        except ImportError:
+            raise TreillageException(
+                msg="The msgspec codec requires the msgspec package"
+            )
+        self.dumps = msgspec.json.encode
+        self.loads = msgspec.json.Decoder().decode
+
+
+CODECS = {
+    StdlibJSONCodec.name: StdlibJSONCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+}
+
+
+def get_codec(codec: Union[str, JSONCodec] = 'auto') -> JSONCodec:
+    """
+    Return a codec instance for a codec or codec name
+
+    'auto' picks the fastest installed codec, trying orjson, then msgspec
+    and falling back to the standard library json module.
+    """
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec == 'auto':
+        for codec_class in (OrjsonCodec, MsgspecCodec):
+            try:
+                return codec_class()
+            except TreillageException:
+                pass
+        return StdlibJSONCodec()
+    if codec not in CODECS:
+        raise TreillageValueError(
+            f"Unknown codec {codec}, expected 'auto' or one of: " +
+            ', '.join(CODECS)
+        )
+    return CODECS[codec]()
@@ -0,0 +1,118 @@
+import gzip
+from typing import Optional
+from .exceptions import TreillageValueError
+
+
+def accepted_encodings() -> str:
+    """Content codings the installed packages can decode"""
+    encodings = ['gzip', 'deflate']
+    # aiohttp and httpx decode brotli when either package is installed
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        encodings.append('br')
+        break
+    return ', '.join(encodings)
+
+
+class CompressionPolicy:
+    """
+    Negotiate compressed responses and compress large request bodies
+
+    Every request asks for the encodings in `accept_encoding`, by default
+    gzip, deflate and, when a brotli package is installed, br. With
+    `compress_requests`, JSON bodies of at least `min_size` bytes sent by
+    POST, PATCH and PUT are gzipped at `level`. If the server answers a
+    compressed body with 415 Unsupported Media Type, request compression is
+    turned off and the body is sent again as it is.
+    """
+
+    def __init__(self,
+                 accept_encoding: str = None,
+                 compress_requests: bool = False,
+                 min_size: int = 1024,
+                 level: int = 6):
+        if not 0 <= level <= 9:
+            raise TreillageValueError(
+                "Compression level must be between 0 and 9"
+            )
+        if accept_encoding is None:
+            accept_encoding = accepted_encodings()
+        self.__accept_encoding = accept_encoding
+        self.__compress_requests = compress_requests
+        self.__min_size = min_size
+        self.__level = level
+        self.responses = 0
+        self.compressed_responses = 0
+        # Bytes on the wire and after decoding, for compressed responses
+        # whose transferred size is known
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        # Decoded size of every response
+        self.response_bytes = 0
+        self.compressed_requests = 0
+        # Request body sizes before and after compression
+        self.request_bytes = 0
+        self.request_wire_bytes = 0
+
+    @property
+    def accept_encoding(self) -> str:
+        return self.__accept_encoding
+
+    @property
+    def compress_requests(self) -> bool:
+        return self.__compress_requests
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'responses': self.responses,
+            'compressed_responses': self.compressed_responses,
+            'compressed_bytes': self.compressed_bytes,
+            'decompressed_bytes': self.decompressed_bytes,
+            'response_ratio': (self.compressed_bytes /
+                               self.decompressed_bytes
+                               if self.decompressed_bytes else 1.0),
+            'response_bytes': self.response_bytes,
+            'compressed_requests': self.compressed_requests,
+            'request_bytes': self.request_bytes,
+            'request_wire_bytes': self.request_wire_bytes,
+            'request_ratio': (self.request_wire_bytes / self.request_bytes
+                              if self.request_bytes else 1.0),
+        }
+
+    def compress(self, data: bytes) -> Optional[bytes]:
+        """Gzip a request body, or return None to send it as it is"""
+        if not self.__compress_requests or len(data) < self.__min_size:
+            return None
+        compressed = gzip.compress(data, compresslevel=self.__level)
+        self.compressed_requests += 1
+        self.request_bytes += len(data)
+        self.request_wire_bytes += len(compressed)
+        return compressed
+
+    def reject_requests(self):
+        """The server does not accept compressed bodies, stop sending them"""
+        self.__compress_requests = False
+
+    def record_response(self, headers, size: int, wire_size: int = None):
+        """
+        Count a response body of `size` decoded bytes
+
+        `wire_size` is the number of bytes transferred, if the transport
+        knows it. Otherwise the Content-Length header is used, and
+        compressed responses without one only add to `response_bytes`.
+        """
+        self.responses += 1
+        self.response_bytes += size
+        encoding = headers.get('Content-Encoding', 'identity').lower()
+        if encoding == 'identity':
+            return
+        self.compressed_responses += 1
+        if wire_size is None and 'Content-Length' in headers:
+            wire_size = int(headers['Content-Length'])
+        if wire_size is not None:
+            self.compressed_bytes += wire_size
+            self.decompressed_bytes += size
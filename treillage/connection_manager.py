@@ -1,10 +1,24 @@
 import aiohttp
 import asyncio
 import functools
+import json
 import time
+from typing import Union
+from .bulk import BulkRequest, bounded_map, send
+from .codec import JSONCodec, get_codec
+from .compression import CompressionPolicy
+from .deadline import make_deadline, remaining, run_with_deadline
+from .hedging import HedgingPolicy
 from .token_manager import TokenManager
-from .ratelimiter import RateLimiter
-from .exceptions import TreillageHTTPException, TreillageRateLimitException
+from .ratelimiter import RateLimiter, RateLimiterBackend
+from .response_cache import ResponseCache, CacheEntry
+from .singleflight import SingleFlight
+from .transfer import public_url
+from .transport import (Transport, AiohttpTransport, HttpxTransport,
+                        check_transport)
+from .streaming import StreamedResponse, ByteStream
+from .exceptions import (TreillageHTTPException, TreillageRateLimitException,
+                         TreillageValueError)
 
 
 def renew_access_token(func):
@@ -28,6 +42,40 @@ def rate_limit(func):
     return wrapped
 
 
+def prepare_request(func):
+    # Does what renew_access_token and rate_limit do, in one wrapper as it
+    # runs for every request. `has_token` skips the rate limiter for callers
+    # that already took a token with try_get_token.
+    @functools.wraps(func)
+    async def wrapped(self, *args, has_token: bool = False, **kwargs):
+        # Refresh the token 90 seconds before it expires
+        if time.time() > self.token_manager.access_token_expiry - 90:
+            await self.token_manager.refresh_access_token()
+        if self.rate_limiter and not has_token:
+            await self.rate_limiter.get_token()
+        return await func(self, *args, **kwargs)
+
+    return wrapped
+
+
+def with_deadline(func):
+    # Turns the timeout and deadline options into one absolute deadline,
+    # passed on as `deadline`, and bounds the whole call by it, including
+    # token renewal and waiting for the rate limiter.
+    @functools.wraps(func)
+    async def wrapped(self, *args, timeout: float = None,
+                      deadline: float = None, **kwargs):
+        deadline = make_deadline(timeout, deadline)
+        if deadline is None:
+            return await func(self, *args, **kwargs)
+        return await run_with_deadline(
+            func(self, *args, deadline=deadline, **kwargs),
+            deadline
+        )
+
+    return wrapped
+
+
 def retry_on_rate_limit(func):
     @functools.wraps(func)
     async def wrapped(*args, **kwargs):
@@ -39,56 +87,162 @@ def retry_on_rate_limit(func):
     return wrapped
 
 
+def _retry_on_rate_limit_with_deadline(func):
+    # For library functions that take `timeout` and `deadline`: the timeout
+    # is turned into a deadline once, so that it covers all attempts rather
+    # than each one.
+    retrying = retry_on_rate_limit(func)
+
+    @functools.wraps(func)
+    async def wrapped(*args, timeout: float = None, deadline: float = None,
+                      **kwargs):
+        return await retrying(*args,
+                              deadline=make_deadline(timeout, deadline),
+                              **kwargs)
+    return wrapped
+
+
+# Shared empty keyword arguments, to avoid building a dict per request
+_NO_OPTIONS = {}
+
+
 class ConnectionManager:
     def __init__(self,
                  base_url: str,
                  credentials,
                  max_connections: int = None,
-                 rate_limit_token_regen_rate: int = None
+                 rate_limit_token_regen_rate: int = None,
+                 *,
+                 # Share one request between identical concurrent GETs
+                 coalesce_requests: bool = False,
+                 # Cache for GET responses, e.g. MemoryResponseCache()
+                 response_cache: ResponseCache = None,
+                 # JSON codec or codec name ('auto', 'json', 'orjson', ...)
+                 codec: Union[str, JSONCodec] = None,
+                 # Keyword arguments for aiohttp.TCPConnector, such as limit,
+                 # keepalive_timeout or ttl_dns_cache
+                 connector_options: dict = None,
+                 # Keep-alive connections to open while creating the session
+                 warm_up_connections: int = 0,
+                 # 'aiohttp', 'httpx' for HTTP/2, or a Transport instance
+                 transport: Union[str, Transport] = 'aiohttp',
+                 # Send a second request for GETs that are slower than usual
+                 hedging: HedgingPolicy = None,
+                 # Ask for compressed responses and gzip large bodies
+                 compression: CompressionPolicy = None,
+                 # Rate limiter to use instead of creating one, e.g. a
+                 # SharedRateLimiter shared with other processes
+                 rate_limiter: RateLimiterBackend = None
                  ):
         self.__base_url = base_url
         self.__credentials = credentials
-        if max_connections is not None:
-            self.__connector = aiohttp.TCPConnector(
-                limit_per_host=max_connections
+        check_transport(transport)
+        self.__transport = transport
+        self.__max_connections = max_connections
+        connector_options = dict(connector_options or {})
+        if max_connections is not None and isinstance(transport, Transport):
+            raise TreillageValueError(
+                "max_connections cannot be applied to a Transport instance, "
+                "set its connection limit when creating it"
+            )
+        if connector_options and transport != 'aiohttp':
+            raise TreillageValueError(
+                "connector_options only apply to the aiohttp transport"
             )
+        if max_connections is not None and transport == 'aiohttp':
+            connector_options['limit_per_host'] = max_connections
+        if connector_options:
+            self.__connector = aiohttp.TCPConnector(**connector_options)
         else:
             self.__connector = None
+        self.__warm_up_connections = warm_up_connections
         self.__session = None
         self.__auth_tokens = None
-        if rate_limit_token_regen_rate is not None:
+        # Auth headers for the current tokens, rebuilt when they rotate
+        self.__header_tokens = None
+        self.__auth_headers = None
+        self.__default_headers = None
+        if rate_limiter is not None:
+            if rate_limit_token_regen_rate is not None:
+                raise TreillageValueError(
+                    "Pass either rate_limit_token_regen_rate or "
+                    "rate_limiter, not both"
+                )
+            self.__rate_limiter = rate_limiter
+        elif rate_limit_token_regen_rate is not None:
             self.__rate_limiter = RateLimiter(
                 token_rate=rate_limit_token_regen_rate
             )
         else:
             self.__rate_limiter = None
+        if coalesce_requests:
+            self.__in_flight = SingleFlight()
+        else:
+            self.__in_flight = None
+        self.__response_cache = response_cache
+        self.__hedging = hedging
+        self.__compression = compression
+        # Bumped on every invalidation so that a GET that was in flight
+        # during a write does not cache the old body
+        self.__cache_generation = 0
+        # Without a codec, aiohttp's own stdlib json handling is used
+        self.__codec = get_codec(codec) if codec is not None else None
 
     @classmethod
     async def create(cls,
                      base_url: str,
                      credentials,
                      max_connections: int = None,
-                     rate_limit_token_regen_rate: int = None
+                     rate_limit_token_regen_rate: int = None,
+                     **options
                      ):
 
         self = ConnectionManager(
             base_url,
             credentials,
             max_connections,
-            rate_limit_token_regen_rate
+            rate_limit_token_regen_rate,
+            **options
         )
         self.__auth_tokens = await TokenManager.create(credentials, base_url)
-        if self.connector:
-            self.__session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=90),
-                connector=self.connector
+        if isinstance(self.__transport, Transport):
+            self.__session = self.__transport
+        elif self.__transport == 'httpx':
+            self.__session = HttpxTransport(
+                max_connections=self.__max_connections
             )
         else:
-            self.__session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=90)
-            )
+            self.__session = AiohttpTransport(connector=self.connector)
+        if self.__warm_up_connections:
+            await self.warm_up(self.__warm_up_connections)
         return self
 
+    async def warm_up(self, connections: int) -> int:
+        """
+        Open up to `connections` keep-alive connections to the API host
+
+        Sends that many concurrent HEAD requests to the base URL so that the
+        TCP and TLS handshakes are done before the first burst of real
+        requests. The connections stay pooled for the connector's
+        keepalive_timeout. Warm-up is best effort: it does not use rate
+        limit tokens and failures are ignored. Returns the number of
+        requests that got a response.
+        """
+        async def open_connection():
+            try:
+                async with self.__session.head(
+                        url=self.__base_url,
+                        allow_redirects=False
+                ):
+                    return True
+            except self.__session.errors:
+                return False
+
+        results = await asyncio.gather(
+            *(open_connection() for _ in range(connections))
+        )
+        return sum(results)
+
     async def close(self):
         if self.__session is not None:
             await self.__session.close()
@@ -100,88 +254,543 @@ class ConnectionManager:
         return self.__auth_tokens
 
     @property
-    def rate_limiter(self) -> RateLimiter:
+    def rate_limiter(self) -> RateLimiterBackend:
         return self.__rate_limiter
 
     @property
     def connector(self) -> aiohttp.TCPConnector:
         return self.__connector
 
-    async def __handle_response(self, response, http_success_code: int = 200):
+    @property
+    def transport(self) -> Transport:
+        return self.__session
+
+    @property
+    def response_cache(self) -> ResponseCache:
+        return self.__response_cache
+
+    @property
+    def hedging(self) -> HedgingPolicy:
+        return self.__hedging
+
+    @property
+    def codec(self) -> JSONCodec:
+        return self.__codec
+
+    @property
+    def compression(self) -> CompressionPolicy:
+        return self.__compression
+
+    async def __decode(self, response):
+        if self.__compression is not None:
+            # The body is kept by the response, so json() does not read it
+            # a second time
+            body = await response.read()
+            self.__compression.record_response(
+                response.headers, len(body),
+                getattr(response, 'wire_bytes', None)
+            )
+        if self.__codec is None:
+            return await response.json()
+        body = await response.read()
+        if not body or body.isspace():
+            return None
+        return self.__codec.loads(body)
+
+    def __encode(self, body, headers: dict) -> dict:
+        # Returns the keyword argument carrying the body for the session
+        if (self.__compression is not None and
+                self.__compression.compress_requests):
+            if self.__codec is None:
+                data = json.dumps(body).encode()
+                headers['Content-Type'] = 'application/json'
+            else:
+                data = self.__codec.dumps(body)
+                headers['Content-Type'] = self.__codec.content_type
+            compressed = self.__compression.compress(data)
+            if compressed is not None:
+                headers['Content-Encoding'] = 'gzip'
+                return {'data': compressed}
+            return {'data': data}
+        if self.__codec is None:
+            return {'json': body}
+        headers['Content-Type'] = self.__codec.content_type
+        return {'data': self.__codec.dumps(body)}
+
+    async def __handle_response(self,
+                                response,
+                                http_success_code: int = 200,
+                                cached: CacheEntry = None):
+        if response.status == 304 and cached is not None:
+            # The cached body is still current, nothing was transferred
+            if self.__rate_limiter is not None:
+                self.__rate_limiter.last_try_success(True)
+            return cached.value
         if response.status == http_success_code:
             if self.__rate_limiter is not None:
                 self.__rate_limiter.last_try_success(True)
-            return await response.json()
+            return await self.__decode(response)
         else:
-            msg = await response.text()
-            if response.status == 429:
-                if self.__rate_limiter is not None:
-                    self.__rate_limiter.last_try_success(False)
-                raise TreillageRateLimitException(url=response.url, msg=msg)
-            else:
-                raise TreillageHTTPException(
-                    code=response.status,
-                    url=response.url,
-                    msg=msg
-                )
+            await self.__raise_for_status(response)
+
+    async def __raise_for_status(self, response):
+        msg = await response.text()
+        if response.status == 429:
+            if self.__rate_limiter is not None:
+                self.__rate_limiter.last_try_success(False)
+            raise TreillageRateLimitException(url=response.url, msg=msg)
+        else:
+            raise TreillageHTTPException(
+                code=response.status,
+                url=response.url,
+                msg=msg
+            )
+
+    @staticmethod
+    def __timeout_option(deadline: float = None) -> dict:
+        # Without a deadline the session's default timeout applies
+        if deadline is None:
+            return _NO_OPTIONS
+        return {'timeout': remaining(deadline)}
+
+    def __build_auth_headers(self, tokens: tuple):
+        self.__header_tokens = tokens
+        self.__auth_headers = {
+            "x-fv-sessionid": tokens[1],
+            "Authorization": f"Bearer {tokens[0]}",
+        }
+        self.__default_headers = dict(self.__auth_headers)
+        if self.__compression is not None:
+            self.__default_headers["Accept-Encoding"] = (
+                self.__compression.accept_encoding
+            )
 
     def __setup_headers(self, headers: dict = None) -> dict:
+        # Without extra headers the cached dict is returned as it is, so it
+        # must not be modified by the caller
+        tokens = (self.__auth_tokens.access_token,
+                  self.__auth_tokens.refresh_token)
+        if tokens != self.__header_tokens:
+            self.__build_auth_headers(tokens)
         if not headers:
-            headers = dict()
-        headers["x-fv-sessionid"] = self.__auth_tokens.refresh_token
-        headers["Authorization"] = f"Bearer {self.__auth_tokens.access_token}"
+            return self.__default_headers
+        headers.update(self.__auth_headers)
+        if self.__compression is not None:
+            headers.setdefault("Accept-Encoding",
+                               self.__compression.accept_encoding)
         return headers
 
-    @renew_access_token
-    @rate_limit
+    @staticmethod
+    def __request_key(endpoint: str, params: dict, headers: dict) -> str:
+        # Auth headers are the same for every request and not part of the key
+        headers = {
+            k: v for k, v in (headers or {}).items()
+            if k not in ("x-fv-sessionid", "Authorization")
+        }
+        return json.dumps([endpoint, params or {}, headers],
+                          sort_keys=True, default=str)
+
+    @with_deadline
     async def get(
             self,
             endpoint: str,
             params: dict = None,
-            headers: dict = None
+            headers: dict = None,
+            timeout: float = None,
+            deadline: float = None
     ):
+        """
+        Send a GET request and return the decoded JSON body
+
+        When request coalescing is enabled, concurrent calls with the same
+        endpoint, parameters and headers share a single request, and so a
+        single rate limit token. They all receive the same response object,
+        which must therefore be treated as read-only.
+
+        With a response cache, fresh cached responses are returned without
+        a request. The built-in caches decode a new copy of the body for
+        every hit, so those may be modified. Stale responses that came
+        with an ETag or Last-Modified header are revalidated with a
+        conditional request, and a 304 response refreshes them in place.
+
+        With a hedging policy, a request that is still outstanding after the
+        policy's delay is duplicated and whichever response arrives first is
+        used, while the other request is cancelled. The duplicate takes its
+        own rate limit token and is skipped when none is available, or
+        while the rate limiter backs off after a rate limit error. The
+        policy measures latency from when a request is sent, so waiting for
+        the rate limiter does not count towards it.
+
+        `timeout` limits this call to that many seconds and `deadline` to a
+        `time.monotonic()` value, including time spent waiting for a rate
+        limit token. Past either, TreillageTimeoutError is raised. The same
+        options are accepted by every other request method.
+        """
+        if self.__in_flight is None and self.__response_cache is None:
+            return (await self.__send_get(endpoint, params, headers,
+                                          None, deadline))[0]
+        key = self.__request_key(endpoint, params, headers)
+        stale = None
+        if self.__response_cache is not None:
+            entry = self.__response_cache.lookup(key, include_stale=True)
+            if entry is not None and entry.fresh:
+                return entry.value
+            if entry is not None and entry.validators:
+                stale = entry
+        generation = self.__cache_generation
+        if self.__in_flight is None:
+            result = await self.__send_get(endpoint, params, headers, stale,
+                                           deadline)
+        else:
+            # The shared request is not bound by any one caller's deadline
+            result = await self.__in_flight.do(
+                key, self.__send_get, endpoint, params, headers, stale
+            )
+        value, validators, not_modified = result
+        if (self.__response_cache is not None and
+                generation == self.__cache_generation):
+            if not_modified:
+                self.__response_cache.refresh(key, stale)
+            else:
+                self.__response_cache.store(key, endpoint, value,
+                                            **validators)
+        return value
+
+    def __invalidate(self, endpoint: str):
+        if self.__response_cache is not None:
+            self.__cache_generation += 1
+            self.__response_cache.invalidate(endpoint)
+
+    async def __send_get(self, *args) -> tuple:
+        if self.__hedging is None:
+            return await self.__get(*args)
+        return await self.__hedged_get(*args)
+
+    async def __hedged_get(self, *args) -> tuple:
+        # Both requests take a rate limit token. The hedge only takes one
+        # that is free right away, and does not wait for it.
+        policy = self.__hedging
+        policy.request_started()
+        primary, primary_sent = self.__start_get(*args)
+        tasks = {primary}
+        try:
+            # The hedge delay and the latency only count from when the
+            # request is sent, not while it waits for the rate limiter
+            await asyncio.wait({primary, primary_sent},
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                done, _ = await asyncio.wait(tasks, timeout=policy.delay())
+                if (not done and
+                        (self.__rate_limiter is None or
+                         self.__rate_limiter.failed_attempts == 0) and
+                        policy.allow_hedge()):
+                    if (self.__rate_limiter is None or
+                            await self.__rate_limiter.try_get_token()):
+                        hedge, hedge_sent = self.__start_get(*args,
+                                                             has_token=True)
+                        tasks.add(hedge)
+                    else:
+                        # Give the unused hedge back to the budget
+                        policy.hedges -= 1
+            while True:
+                done, _ = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is not None:
+                        continue
+                    if task is primary:
+                        policy.record(time.monotonic() - primary_sent.result())
+                    else:
+                        policy.record(time.monotonic() - hedge_sent.result())
+                        policy.hedge_wins += 1
+                    return task.result()
+                if not tasks:
+                    # Both failed, report the original request's error
+                    return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __start_get(self, *args, has_token: bool = False) -> tuple:
+        # Returns the request task and a future with the time.monotonic()
+        # value at which the request was sent
+        sent = asyncio.get_running_loop().create_future()
+        task = asyncio.ensure_future(
+            self.__get(*args, sent=sent, has_token=has_token)
+        )
+        return task, sent
+
+    @prepare_request
+    async def __get(
+            self,
+            endpoint: str,
+            params: dict = None,
+            headers: dict = None,
+            stale: CacheEntry = None,
+            deadline: float = None,
+            sent: asyncio.Future = None
+    ) -> tuple:
+        # Returns the body, the validators sent with it and whether a stale
+        # cache entry was confirmed by a 304 response
+        if stale is not None:
+            headers = dict(headers or {})
+            headers.update(stale.conditional_headers)
+        if sent is not None:
+            sent.set_result(time.monotonic())
         async with self.__session.get(
                 url=self.__base_url + endpoint,
                 params=params,
-                headers=self.__setup_headers(headers)
+                headers=self.__setup_headers(headers),
+                **self.__timeout_option(deadline)
         ) as response:
-            return await self.__handle_response(response, 200)
+            value = await self.__handle_response(response, 200, stale)
+            not_modified = stale is not None and response.status == 304
+            validators = dict()
+            if self.__response_cache is not None and not not_modified:
+                validators = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+            return value, validators, not_modified
 
-    @renew_access_token
-    @rate_limit
-    async def patch(self, endpoint: str, body: dict, headers: dict = None):
-        async with self.__session.patch(
-                url=self.__base_url + endpoint,
-                json=body,
-                headers=self.__setup_headers(headers)
-        ) as response:
-            return await self.__handle_response(response, 200)
+    @with_deadline
+    @prepare_request
+    async def stream(
+            self,
+            endpoint: str,
+            params: dict = None,
+            headers: dict = None,
+            items_key: str = 'items',
+            chunk_size: int = 64 * 1024,
+            timeout: float = None,
+            deadline: float = None
+    ) -> StreamedResponse:
+        """
+        Send a GET request and decode the list in its body as it arrives
+
+        Returns a `StreamedResponse` once the status line has been checked.
+        Iterating over it yields the elements of `items_key` one at a time,
+        so the whole body is never held in memory. Streamed responses
+        bypass coalescing and the response cache, and are always decoded
+        with the standard library json module.
+        """
+        request = self.__session.get(
+            url=self.__base_url + endpoint,
+            params=params,
+            headers=self.__setup_headers(headers),
+            **self.__timeout_option(deadline)
+        )
+        response = await request.__aenter__()
+        if response.status != 200:
+            try:
+                await self.__raise_for_status(response)
+            finally:
+                await request.__aexit__(None, None, None)
+        if self.__rate_limiter is not None:
+            self.__rate_limiter.last_try_success(True)
+        return StreamedResponse(request, response,
+                                items_key=items_key,
+                                chunk_size=chunk_size)
 
-    @renew_access_token
-    @rate_limit
-    async def post(self, endpoint: str, body: dict, headers: dict = None):
-        async with self.__session.post(
+    async def __send_body(self, send, endpoint: str, body, headers: dict,
+                          deadline: float = None):
+        # Encoding adds body headers, so work on a copy
+        headers = dict(self.__setup_headers(headers))
+        async with send(
                 url=self.__base_url + endpoint,
-                json=body,
-                headers=self.__setup_headers(headers)
+                headers=headers,
+                **self.__encode(body, headers),
+                **self.__timeout_option(deadline)
         ) as response:
-            return await self.__handle_response(response, 200)
+            if (response.status != 415 or
+                    headers.get('Content-Encoding') != 'gzip' or
+                    self.__compression is None or
+                    not self.__compression.compress_requests):
+                return await self.__handle_response(response, 200)
+        # The server does not accept compressed bodies, send it as it is
+        self.__compression.reject_requests()
+        del headers['Content-Encoding']
+        return await self.__resend_body(send, endpoint, body, headers,
+                                        deadline)
+
+    @prepare_request
+    async def __resend_body(self, *args):
+        # A second request, which takes a rate limit token of its own
+        return await self.__send_body(*args)
+
+    @with_deadline
+    async def download(
+            self,
+            url: str,
+            headers: dict = None,
+            chunk_size: int = 1024 * 1024,
+            read_timeout: float = 90,
+            timeout: float = None,
+            deadline: float = None
+    ) -> ByteStream:
+        """
+        Send a GET request to a download URL and stream the body
+
+        `url` is a full URL outside the API, such as the storage location
+        of a document, so no auth headers are added and no rate limit token
+        is taken. Returns a `ByteStream` once the status line has been
+        checked. Without a timeout or deadline the transfer may take as
+        long as it needs, but waiting longer than `read_timeout` seconds
+        for data raises `asyncio.TimeoutError`. A timeout or deadline covers
+        the whole transfer. The body is requested without content encoding,
+        so that sizes and byte ranges refer to the stored file.
+        """
+        request = self.__session.get(
+            url=url,
+            headers={'Accept-Encoding': 'identity', **(headers or {})},
+            # The session's default total timeout would cut off large files
+            timeout=remaining(deadline) if deadline is not None else None
+        )
+        if deadline is None and read_timeout is not None:
+            response = await asyncio.wait_for(request.__aenter__(),
+                                              read_timeout)
+        else:
+            response = await request.__aenter__()
+        if response.status not in (200, 206):
+            try:
+                raise TreillageHTTPException(
+                    code=response.status,
+                    url=public_url(url),
+                    msg=await response.text()
+                )
+            finally:
+                await request.__aexit__(None, None, None)
+        return ByteStream(request, response,
+                          chunk_size=chunk_size,
+                          read_timeout=read_timeout,
+                          deadline=deadline)
+
+    @with_deadline
+    async def upload(
+            self,
+            url: str,
+            data,
+            content_length: int = None,
+            headers: dict = None,
+            timeout: float = None,
+            deadline: float = None
+    ):
+        """
+        Send a PUT request with a streamed body to an upload URL
 
-    @renew_access_token
-    @rate_limit
-    async def put(self, endpoint: str, body: dict, headers: dict = None):
+        `url` is a full URL outside the API, such as a signed storage URL
+        returned when a document is created, so no auth headers are added
+        and no rate limit token is taken. `data` may be bytes, a file object
+        or an async iterable of chunks. Pass `content_length` for iterables,
+        as most storage services do not accept chunked uploads. Without a
+        timeout or deadline the upload may take as long as it needs.
+        """
+        headers = dict(headers or {})
+        if content_length is not None:
+            headers['Content-Length'] = str(content_length)
+        headers.setdefault('Content-Type', 'application/octet-stream')
         async with self.__session.put(
-                url=self.__base_url + endpoint,
-                json=body,
-                headers=self.__setup_headers(headers)
+                url=url,
+                data=data,
+                headers=headers,
+                timeout=remaining(deadline) if deadline is not None else None
         ) as response:
-            return await self.__handle_response(response, 200)
-            
-    @renew_access_token
-    @rate_limit
-    async def delete(self, endpoint: str, headers: dict = None):
+            if not 200 <= response.status < 300:
+                raise TreillageHTTPException(
+                    code=response.status,
+                    url=public_url(url),
+                    msg=await response.text()
+                )
+            return response.headers
+
+    @with_deadline
+    @prepare_request
+    async def patch(self,
+                    endpoint: str,
+                    body: dict,
+                    headers: dict = None,
+                    timeout: float = None,
+                    deadline: float = None):
+        result = await self.__send_body(self.__session.patch, endpoint,
+                                        body, headers, deadline)
+        self.__invalidate(endpoint)
+        return result
+
+    @with_deadline
+    @prepare_request
+    async def post(self,
+                   endpoint: str,
+                   body: dict,
+                   headers: dict = None,
+                   timeout: float = None,
+                   deadline: float = None):
+        return await self.__send_body(self.__session.post, endpoint,
+                                      body, headers, deadline)
+
+    @with_deadline
+    @prepare_request
+    async def put(self,
+                  endpoint: str,
+                  body: dict,
+                  headers: dict = None,
+                  timeout: float = None,
+                  deadline: float = None):
+        result = await self.__send_body(self.__session.put, endpoint,
+                                        body, headers, deadline)
+        self.__invalidate(endpoint)
+        return result
+
+    @with_deadline
+    @prepare_request
+    async def delete(self,
+                     endpoint: str,
+                     headers: dict = None,
+                     timeout: float = None,
+                     deadline: float = None):
         async with self.__session.delete(
                 url=self.__base_url + endpoint,
-                headers=self.__setup_headers(headers)
+                headers=self.__setup_headers(headers),
+                **self.__timeout_option(deadline)
         ) as response:
-            return await self.__handle_response(response, 204)
+            result = await self.__handle_response(response, 204)
+            self.__invalidate(endpoint)
+            return result
+
+    def map(self, func, iterable, concurrency: int = 10, ordered=True):
+        """
+        Run the coroutine function `func` for every item of `iterable`
+
+        Returns an async iterator of `BulkResult`, see `bounded_map`. The
+        concurrency cap only bounds how many calls are in flight; requests
+        made by `func` still wait for the rate limiter.
+        """
+        return bounded_map(func, iterable,
+                           concurrency=concurrency,
+                           ordered=ordered)
+
+    def execute_many(self,
+                     requests,
+                     concurrency: int = 10,
+                     ordered: bool = True,
+                     retry_rate_limited: bool = True):
+        """
+        Send many requests with at most `concurrency` in flight
+
+        `requests` is an iterable or async iterable of `BulkRequest` objects,
+        or of dicts holding `BulkRequest` arguments. Yields a `BulkResult`
+        for each one, in order or as they complete. Failed requests are
+        reported on their result, and rate limited ones are retried unless
+        `retry_rate_limited` is false.
+        """
+        async def execute(request):
+            if isinstance(request, dict):
+                request = BulkRequest(**request)
+            return await send(self, request, retry_rate_limited)
+
+        return self.map(execute, requests,
+                        concurrency=concurrency,
+                        ordered=ordered)
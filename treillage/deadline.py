@@ -0,0 +1,53 @@
+import asyncio
+import time
+from typing import Optional
+from .exceptions import TreillageTimeoutError
+
+
+def make_deadline(timeout: float = None,
+                  deadline: float = None) -> Optional[float]:
+    """
+    Combine a relative timeout and an absolute deadline
+
+    Deadlines are `time.monotonic()` values. Returns the earlier of the two,
+    or None when neither is given.
+    """
+    if timeout is not None:
+        timeout_deadline = time.monotonic() + timeout
+        if deadline is None or timeout_deadline < deadline:
+            deadline = timeout_deadline
+    return deadline
+
+
+def remaining(deadline: float, url: str = None) -> float:
+    """Seconds left before deadline, raising once it has passed"""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TreillageTimeoutError(url=url)
+    return left
+
+
+def deadline_options(timeout: float = None, deadline: float = None) -> dict:
+    """Keyword arguments for a request, leaving out the ones not given"""
+    options = dict()
+    if timeout is not None:
+        options['timeout'] = timeout
+    if deadline is not None:
+        options['deadline'] = deadline
+    return options
+
+
+async def run_with_deadline(awaitable, deadline: float, url: str = None):
+    """Await awaitable, cancelling it and raising once deadline passes"""
+    try:
+        left = remaining(deadline, url)
+    except TreillageTimeoutError:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except TreillageTimeoutError:
+        raise
+    except asyncio.TimeoutError:
+        raise TreillageTimeoutError(url=url)
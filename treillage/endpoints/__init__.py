@@ -1,2 +1,5 @@
 from .document_management import *
 from .org_management import *
+from .project_collections import *
+from .list_paginator import (Page, PageSizePolicy, FixedPageSize,
+                             AdaptivePageSize)
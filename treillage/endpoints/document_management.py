@@ -1,6 +1,17 @@
-from typing import List
-from .. import ConnectionManager
-from .list_paginator import list_paginator
+import asyncio
+import os
+import time
+from typing import Callable, List, Union
+from .. import (ConnectionManager, TreillageTimeoutError,
+                TreillageValueError, retry_on_rate_limit)
+from ..connection_manager import _retry_on_rate_limit_with_deadline
+from ..bulk import bounded_map
+from ..checkpoint import CheckpointStore
+from ..deadline import deadline_options, make_deadline
+from ..transfer import (TransferStats, TransferResult, Checksum,
+                        download_stream, download_ranges, read_chunks)
+from .list_paginator import list_paginator, page_paginator
+from .list_paginator import PageSizePolicy
 
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
@@ -9,33 +20,406 @@ from .list_paginator import list_paginator
 
 async def get_document(connection: ConnectionManager,
                        document_id: str,
-                       requested_fields: List[str] = None):
+                       requested_fields: List[str] = None,
+                       timeout: float = None,
+                       deadline: float = None):
     endpoint = f"/core/documents/{document_id}"
     params = dict()
     if requested_fields:
         fields = ','.join(*[requested_fields])
         params['requestedFields'] = fields
 
-    return await connection.get(endpoint, params)
+    return await connection.get(endpoint, params,
+                                **deadline_options(timeout, deadline))
 
 
-async def get_document_list(connection: ConnectionManager,
-                            requested_fields: List[str] = None,
-                            folder_id: str = None):
-    endpoint = "/core/documents/"
-
+def _document_list_params(requested_fields: List[str] = None,
+                          folder_id: str = None) -> dict:
     params = dict()
     if requested_fields:
         fields = ','.join(*[requested_fields])
         params['requestedFields'] = fields
     if folder_id:
         params['folderId'] = folder_id
+    return params
+
+
+async def get_document_list(connection: ConnectionManager,
+                            requested_fields: List[str] = None,
+                            folder_id: str = None,
+                            prefetch: int = 0,
+                            concurrency: int = 1,
+                            ordered: bool = True,
+                            page_size: Union[int, PageSizePolicy] = 100,
+                            checkpoint: CheckpointStore = None,
+                            stream: bool = False,
+                            timeout: float = None,
+                            deadline: float = None):
+    endpoint = "/core/documents/"
+    params = _document_list_params(requested_fields, folder_id)
 
-    async for document in list_paginator(connection, endpoint, params):
-        yield document
+    items = list_paginator(connection, endpoint, params,
+                           prefetch=prefetch,
+                           concurrency=concurrency,
+                           ordered=ordered,
+                           page_size=page_size,
+                           checkpoint=checkpoint,
+                           stream=stream,
+                           timeout=timeout,
+                           deadline=deadline)
+    try:
+        async for document in items:
+            yield document
+    finally:
+        # Release prefetched pages when the caller stops early
+        await items.aclose()
+
+
+async def get_document_pages(connection: ConnectionManager,
+                             requested_fields: List[str] = None,
+                             folder_id: str = None,
+                             prefetch: int = 0,
+                             concurrency: int = 1,
+                             ordered: bool = True,
+                             page_size: Union[int, PageSizePolicy] = 100,
+                             checkpoint: CheckpointStore = None,
+                             timeout: float = None,
+                             deadline: float = None):
+    endpoint = "/core/documents/"
+    params = _document_list_params(requested_fields, folder_id)
+
+    pages = page_paginator(connection, endpoint, params,
+                           prefetch=prefetch,
+                           concurrency=concurrency,
+                           ordered=ordered,
+                           page_size=page_size,
+                           checkpoint=checkpoint,
+                           timeout=timeout,
+                           deadline=deadline)
+    try:
+        async for page in pages:
+            yield page
+    finally:
+        # Release prefetched pages when the caller stops early
+        await pages.aclose()
 
 
 async def delete_document(connection: ConnectionManager,
-                          document_id: str):
+                          document_id: str,
+                          timeout: float = None,
+                          deadline: float = None):
     endpoint = f"/core/documents/{document_id}"
-    await connection.delete(endpoint)
+    await connection.delete(endpoint, **deadline_options(timeout, deadline))
+
+
+async def get_document_locator(connection: ConnectionManager,
+                               document_id: str,
+                               timeout: float = None,
+                               deadline: float = None):
+    endpoint = f"/core/documents/{document_id}/locator"
+    return await connection.get(endpoint,
+                                **deadline_options(timeout, deadline))
+
+
+async def download_document(connection: ConnectionManager,
+                            document_id: str,
+                            # File path, or an object with a write method
+                            destination,
+                            chunk_size: int = 1024 * 1024,
+                            # Shared byte counts and throughput
+                            stats: TransferStats = None,
+                            # Called with (bytes written, total size or None)
+                            on_progress: Callable = None,
+                            # Expected digest as 'algorithm:hexdigest'
+                            checksum: str = None,
+                            # Byte ranges to request at the same time
+                            parallel_ranges: int = None,
+                            range_size: int = 16 * 1024 * 1024,
+                            # Seconds allowed for the whole download
+                            timeout: float = None,
+                            deadline: float = None) -> TransferResult:
+    """
+    Stream a document's content to a file or writer
+
+    The document's download URL is looked up with its locator and the
+    content is written `chunk_size` bytes at a time as it arrives, so files
+    are never held in memory. A file path is written to `path.part` and
+    renamed when the download completes. Writers may have a regular or a
+    coroutine `write` method, and are drained after every chunk if they
+    have a `drain` method, like `asyncio.StreamWriter`.
+
+    With `parallel_ranges`, a file is fetched as byte ranges of
+    `range_size`, that many at a time, and the completed ranges are
+    recorded in `path.progress`. Calling it again after an interruption
+    only fetches the missing ranges, see `transfer.download_ranges`. The
+    size is always checked, and the content is checked against `checksum`
+    when one is given.
+    """
+    if checksum is not None:
+        checksum = Checksum(checksum)
+    if parallel_ranges is not None and hasattr(destination, 'write'):
+        raise TreillageValueError(
+            "Range downloads need a file path as destination"
+        )
+    deadline = make_deadline(timeout, deadline)
+    if stats is None:
+        stats = TransferStats()
+    locator = await get_document_locator(
+        connection, document_id, **deadline_options(deadline=deadline)
+    )
+    stats.transfer_started()
+    started = time.monotonic()
+    ok = False
+    try:
+        if parallel_ranges is None:
+            size = await download_stream(
+                connection, locator['url'], destination,
+                chunk_size=chunk_size, stats=stats, on_progress=on_progress,
+                checksum=checksum, deadline=deadline
+            )
+        else:
+            size = await download_ranges(
+                connection, locator['url'], destination, key=document_id,
+                range_size=range_size, concurrency=parallel_ranges,
+                chunk_size=chunk_size, stats=stats, on_progress=on_progress,
+                checksum=checksum, deadline=deadline
+            )
+        ok = True
+    finally:
+        stats.transfer_finished(ok)
+    return TransferResult(document_id, destination, size,
+                          time.monotonic() - started)
+
+
+async def download_documents(connection: ConnectionManager,
+                             # (document_id, destination) pairs, or
+                             # (document_id, destination, checksum)
+                             downloads,
+                             concurrency: int = 4,
+                             ordered: bool = False,
+                             chunk_size: int = 1024 * 1024,
+                             stats: TransferStats = None,
+                             parallel_ranges: int = None,
+                             range_size: int = 16 * 1024 * 1024,
+                             # Seconds allowed for each download
+                             timeout: float = None,
+                             deadline: float = None):
+    """
+    Download many documents with at most `concurrency` at a time
+
+    `downloads` is a regular or async iterable of (document_id,
+    destination) pairs. Yields a `BulkResult` per pair whose value is a
+    `TransferResult`, as downloads finish unless `ordered` is true. A
+    failed download does not stop the others. Locator requests that are
+    rate limited are retried. Pass a `TransferStats` to follow the combined
+    byte count and throughput while the downloads run. `parallel_ranges`
+    and `range_size` apply to every download, see `download_document`.
+    """
+    if stats is None:
+        stats = TransferStats()
+
+    @retry_on_rate_limit
+    async def download(item):
+        document_id, destination, *checksum = item
+        return await download_document(connection, document_id, destination,
+                                       chunk_size=chunk_size,
+                                       stats=stats,
+                                       checksum=(checksum or [None])[0],
+                                       parallel_ranges=parallel_ranges,
+                                       range_size=range_size,
+                                       timeout=timeout,
+                                       deadline=deadline)
+
+    results = bounded_map(download, downloads,
+                          concurrency=concurrency,
+                          ordered=ordered)
+    try:
+        async for result in results:
+            yield result
+    finally:
+        await results.aclose()
+
+
+async def create_document_upload(connection: ConnectionManager,
+                                 filename: str,
+                                 size: int,
+                                 timeout: float = None,
+                                 deadline: float = None):
+    endpoint = "/core/documents"
+    body = {'filename': filename, 'size': size}
+    return await connection.post(endpoint, body,
+                                 **deadline_options(timeout, deadline))
+
+
+async def add_document_to_project(connection: ConnectionManager,
+                                  project_id: str,
+                                  document_id: str,
+                                  folder_id: str = None,
+                                  timeout: float = None,
+                                  deadline: float = None):
+    endpoint = f"/core/projects/{project_id}/documents/{document_id}"
+    body = dict()
+    if folder_id:
+        body['folderId'] = folder_id
+    return await connection.post(endpoint, body,
+                                 **deadline_options(timeout, deadline))
+
+
+def _native_id(value):
+    # Ids are returned as {'native': 123, 'partner': None}
+    if isinstance(value, dict):
+        return value.get('native')
+    return value
+
+
+class DocumentUpload:
+    """A file to upload with `upload_documents`"""
+
+    def __init__(self,
+                 path,
+                 filename: str = None,
+                 project_id: str = None,
+                 folder_id: str = None,
+                 context=None):
+        self.path = path
+        # Name of the document in Filevine, defaults to the file's name
+        self.filename = filename or os.path.basename(os.fspath(path))
+        # Project to attach the document to once it is uploaded
+        self.project_id = project_id
+        self.folder_id = folder_id
+        # Anything the caller wants back with the result
+        self.context = context
+
+    def __repr__(self):
+        return f"DocumentUpload({self.filename})"
+
+
+async def upload_document(connection: ConnectionManager,
+                          path,
+                          filename: str = None,
+                          project_id: str = None,
+                          folder_id: str = None,
+                          chunk_size: int = 1024 * 1024,
+                          # Shared byte counts and throughput
+                          stats: TransferStats = None,
+                          # Called with (bytes sent, total size)
+                          on_progress: Callable = None,
+                          # Attempts for the upload after a network error
+                          retries: int = 3,
+                          # Seconds allowed for the whole upload
+                          timeout: float = None,
+                          deadline: float = None) -> TransferResult:
+    """
+    Upload a file as a new document, optionally attaching it to a project
+
+    The document is created to get its upload URL, and the file is then
+    streamed from disk `chunk_size` bytes at a time, so it is never held
+    in memory. An upload that fails with a network error is sent again, up
+    to `retries` times, and rate limited API requests are retried. Returns
+    a `TransferResult` carrying the new document's id.
+    """
+    deadline = make_deadline(timeout, deadline)
+    options = deadline_options(deadline=deadline)
+    if filename is None:
+        filename = os.path.basename(os.fspath(path))
+    if stats is None:
+        stats = TransferStats()
+    size = await asyncio.get_running_loop().run_in_executor(
+        None, os.path.getsize, path
+    )
+    # Rate limited API requests are retried on their own, so that the file
+    # is never uploaded twice
+    document = await _retry_on_rate_limit_with_deadline(
+        create_document_upload
+    )(connection, filename, size, **options)
+    document_id = _native_id(document['documentId'])
+    errors = tuple(getattr(connection.transport, 'errors', ()))
+    stats.transfer_started()
+    started = time.monotonic()
+    ok = False
+    try:
+        for attempt in range(retries + 1):
+            sent = 0
+
+            def on_chunk(count: int):
+                nonlocal sent
+                sent += count
+                stats.add_bytes(count)
+                if on_progress is not None:
+                    on_progress(sent, size)
+
+            try:
+                await connection.upload(
+                    document['url'],
+                    read_chunks(path, chunk_size, on_chunk),
+                    content_length=size,
+                    **options
+                )
+                break
+            except TreillageTimeoutError:
+                raise
+            except errors:
+                # The bytes of the failed attempt will be sent again
+                stats.add_bytes(-sent)
+                if attempt == retries:
+                    raise
+        if project_id is not None:
+            await _retry_on_rate_limit_with_deadline(
+                add_document_to_project
+            )(connection, project_id, document_id, folder_id, **options)
+        ok = True
+    finally:
+        stats.transfer_finished(ok)
+    return TransferResult(document_id, path, size,
+                          time.monotonic() - started)
+
+
+async def upload_documents(connection: ConnectionManager,
+                           # Paths or DocumentUpload objects
+                           uploads,
+                           concurrency: int = 4,
+                           ordered: bool = False,
+                           # Defaults for uploads given as paths
+                           project_id: str = None,
+                           folder_id: str = None,
+                           chunk_size: int = 1024 * 1024,
+                           stats: TransferStats = None,
+                           # Seconds allowed for each upload
+                           timeout: float = None,
+                           deadline: float = None):
+    """
+    Upload many files with at most `concurrency` uploads at a time
+
+    `uploads` is a regular or async iterable of file paths or
+    `DocumentUpload` objects, read lazily so that thousands of files can be
+    queued. The concurrency cap is separate from the rate limiter, which
+    still paces the API requests that create and attach the documents;
+    the file transfers themselves go to storage and are not rate limited.
+    Yields a `BulkResult` per upload, holding a `TransferResult`, as
+    uploads finish unless `ordered` is true. A failed upload does not stop
+    the others.
+    """
+    if stats is None:
+        stats = TransferStats()
+
+    async def upload(item):
+        if not isinstance(item, DocumentUpload):
+            item = DocumentUpload(item, project_id=project_id,
+                                  folder_id=folder_id)
+        return await upload_document(connection, item.path,
+                                     filename=item.filename,
+                                     project_id=item.project_id,
+                                     folder_id=item.folder_id,
+                                     chunk_size=chunk_size,
+                                     stats=stats,
+                                     timeout=timeout,
+                                     deadline=deadline)
+
+    results = bounded_map(upload, uploads,
+                          concurrency=concurrency,
+                          ordered=ordered)
+    try:
+        async for result in results:
+            yield result
+    finally:
+        await results.aclose()
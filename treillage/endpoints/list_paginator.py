@@ -1,21 +1,402 @@
+import asyncio
+from collections import OrderedDict
+import sys
+import time
+from typing import Union
 from .. import ConnectionManager, TreillageRateLimitException
+from .. import TreillageValueError
+from ..checkpoint import CheckpointStore
+from ..deadline import deadline_options, make_deadline, remaining
+
+
+class PageSizePolicy:
+    """Decide how many items to request in each page of a list endpoint"""
+
+    def next_limit(self) -> int:
+        raise NotImplementedError
+
+    def record(self, limit: int, latency: float, page: dict):
+        pass
+
+
+class FixedPageSize(PageSizePolicy):
+    def __init__(self, limit: int = 100):
+        if limit < 1:
+            raise TreillageValueError("Page size must be at least 1")
+        self.__limit = limit
+
+    def next_limit(self) -> int:
+        return self.__limit
+
+
+class AdaptivePageSize(PageSizePolicy):
+    """
+    Start with small pages and grow them while the server keeps up
+
+    The page size doubles after every full page that arrives within half of
+    `target_latency` seconds, up to `maximum`. It is halved, down to
+    `minimum`, when a page takes longer than `target_latency` or when the
+    approximate in-memory size of a page exceeds `max_page_bytes`.
+    """
+
+    def __init__(self,
+                 initial: int = 20,
+                 minimum: int = 10,
+                 maximum: int = 1000,
+                 target_latency: float = 2.0,
+                 max_page_bytes: int = None):
+        if not 1 <= minimum <= initial <= maximum:
+            raise TreillageValueError(
+                "Page sizes must satisfy 1 <= minimum <= initial <= maximum"
+            )
+        self.__limit = initial
+        self.__minimum = minimum
+        self.__maximum = maximum
+        self.__target_latency = target_latency
+        self.__max_page_bytes = max_page_bytes
+
+    @property
+    def limit(self) -> int:
+        return self.__limit
+
+    def next_limit(self) -> int:
+        return self.__limit
+
+    def record(self, limit: int, latency: float, page: dict):
+        items = page['items']
+        too_large = (
+            self.__max_page_bytes is not None and
+            _approximate_size(items) > self.__max_page_bytes
+        )
+        if latency > self.__target_latency or too_large:
+            self.__limit = max(self.__minimum, min(self.__limit, limit) // 2)
+        elif (latency < self.__target_latency / 2 and
+              len(items) >= limit >= self.__limit):
+            self.__limit = min(self.__maximum, self.__limit * 2)
+
+
+def _approximate_size(items: list) -> int:
+    # Shallow estimate, enough to notice pages that suddenly get heavier
+    size = sys.getsizeof(items)
+    for item in items:
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            for value in item.values():
+                size += sys.getsizeof(value)
+    return size
+
+
+async def _fetch_page(connection: ConnectionManager,
+                      endpoint: str,
+                      params: dict,
+                      timeout: float = None,
+                      deadline: float = None):
+    # Retry the same window until it gets past the rate limit
+    deadline = make_deadline(timeout, deadline)
+    options = deadline_options(deadline=deadline)
+    while True:
+        if deadline is not None:
+            remaining(deadline)
+        start = time.monotonic()
+        try:
+            resp = await connection.get(endpoint, params, **options)
+            return resp, time.monotonic() - start
+        except TreillageRateLimitException:
+            pass
+
+
+class Page:
+    """One page of a list endpoint together with its metadata"""
+
+    def __init__(self,
+                 items: list,
+                 offset: int,
+                 limit: int,
+                 has_more: bool,
+                 count: int = None,
+                 latency: float = None):
+        self.items = items
+        self.offset = offset
+        self.limit = limit
+        self.has_more = has_more
+        # Total number of items, when the endpoint reports it
+        self.count = count
+        # Seconds taken by the request that returned this page
+        self.latency = latency
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+async def page_paginator(
+        connection: ConnectionManager,
+        endpoint: str,
+        params: dict,
+        # Number of pages to request ahead of the one being consumed
+        prefetch: int = 0,
+        # Number of offset windows to request at the same time
+        concurrency: int = 1,
+        # Yield pages in offset order, or as soon as they arrive
+        ordered: bool = True,
+        # Items per page, or a policy that adapts it between pages
+        page_size: Union[int, PageSizePolicy] = 100,
+        # Store that records consumed offsets so a restart can resume
+        checkpoint: CheckpointStore = None,
+        # Seconds allowed for each page request, including retries
+        timeout: float = None,
+        # time.monotonic() value by which the whole list must be fetched
+        deadline: float = None
+):
+    """
+    Yield every page of a paginated list endpoint as a `Page`
+
+    Pages are requested in windows whose size is set by `page_size`, 100
+    items unless an int or a `PageSizePolicy` is given. With the defaults a
+    page is only requested after the previous one has been consumed.
+    `prefetch` speculatively requests that many of the following pages
+    straight away. `concurrency` waits for the first page and then keeps
+    up to that many windows in flight, bounded by the `count` the server
+    reports. Every window goes through `connection.get`, so the rate
+    limiter and connection limit still apply. No further windows are
+    issued once a page reports `hasMore` as false.
+
+    With a `checkpoint` store, the offset up to which every page has been
+    consumed is saved whenever the next page is requested. A later call for
+    the same endpoint and parameters starts from that offset. The checkpoint
+    is cleared once the whole list has been consumed.
+
+    `timeout` bounds each page request and `deadline` the requests for the
+    whole list, time spent waiting for rate limit tokens included. A page
+    that misses either raises TreillageTimeoutError.
+    """
+    if isinstance(page_size, int):
+        page_size = FixedPageSize(page_size)
+    # Number of windows to keep in flight besides the one being consumed
+    depth = prefetch if concurrency <= 1 else max(prefetch, concurrency)
+    checkpoint_key = None
+    next_offset = 0
+    if checkpoint is not None:
+        checkpoint_key = checkpoint.make_key(endpoint, params)
+        next_offset = checkpoint.load(checkpoint_key) or 0
+    # Every item before this offset has been consumed
+    consumed_offset = next_offset
+    # End offsets of consumed pages that are not yet contiguous
+    consumed_pages = dict()
+    # Offset just past the last item, known once a page ends the list
+    end_offset = None
+    # Number of items reported by the server, only used as a hint
+    count_hint = None
+    pending = OrderedDict()
+    limits = dict()
+    discarded = []
+
+    def note_page(offset, task):
+        nonlocal end_offset, count_hint
+        if task.cancelled() or task.exception() is not None:
+            return
+        resp, latency = task.result()
+        if not resp['hasMore']:
+            end = offset + len(resp['items'])
+            end_offset = end if end_offset is None else min(end_offset, end)
+        elif isinstance(resp.get('count'), int):
+            count_hint = resp['count']
+
+    def more_pages() -> bool:
+        return end_offset is None or next_offset < end_offset
+
+    def schedule_page():
+        nonlocal next_offset
+        limit = page_size.next_limit()
+        page_params = dict(params, offset=next_offset, limit=limit)
+        task = asyncio.ensure_future(
+            _fetch_page(connection, endpoint, page_params,
+                        timeout=timeout,
+                        deadline=deadline)
+        )
+        task.add_done_callback(
+            lambda t, offset=next_offset: note_page(offset, t)
+        )
+        pending[next_offset] = task
+        limits[next_offset] = limit
+        next_offset += limit
+
+    def top_up():
+        # Drop windows past the end of the list
+        if end_offset is not None:
+            for offset in [o for o in pending if o >= end_offset]:
+                task = pending.pop(offset)
+                limits.pop(offset)
+                task.cancel()
+                discarded.append(task)
+        # Keep the next pages in flight while this one is consumed.
+        # A stale count only limits how far ahead windows are issued.
+        bound = end_offset if end_offset is not None else count_hint
+        while len(pending) < depth and more_pages():
+            if bound is not None and next_offset >= bound:
+                break
+            schedule_page()
+
+    async def next_pages():
+        if ordered:
+            offset, task = pending.popitem(last=False)
+            await task
+            done = [(offset, task)]
+        else:
+            await asyncio.wait(
+                pending.values(),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            done = [(o, pending.pop(o)) for o, t in list(pending.items())
+                    if t.done()]
+        pages = []
+        for offset, task in done:
+            # The done callback may not have run yet for this page
+            note_page(offset, task)
+            resp, latency = task.result()
+            limit = limits.pop(offset)
+            page_size.record(limit, latency, resp)
+            pages.append(Page(items=resp['items'],
+                              offset=offset,
+                              limit=limit,
+                              has_more=resp['hasMore'],
+                              count=resp.get('count'),
+                              latency=latency))
+        return pages
+
+    def page_consumed(offset, limit):
+        nonlocal consumed_offset
+        consumed_pages[offset] = offset + limit
+        start = consumed_offset
+        while consumed_offset in consumed_pages:
+            consumed_offset = consumed_pages.pop(consumed_offset)
+        if checkpoint is not None and consumed_offset != start:
+            checkpoint.save(checkpoint_key, consumed_offset)
+
+    try:
+        schedule_page()
+        for _ in range(prefetch):
+            schedule_page()
+
+        while pending:
+            pages = await next_pages()
+            top_up()
+            for page in pages:
+                yield page
+                page_consumed(page.offset, page.limit)
+            if not pending and more_pages():
+                schedule_page()
+        if checkpoint is not None:
+            checkpoint.clear(checkpoint_key)
+    finally:
+        # Runs when the list is exhausted, when the consumer breaks out
+        # early and when the generator is closed or garbage collected.
+        for task in pending.values():
+            task.cancel()
+        discarded.extend(pending.values())
+        if discarded:
+            await asyncio.gather(*discarded, return_exceptions=True)
+
+
+async def _stream_paginator(
+        connection: ConnectionManager,
+        endpoint: str,
+        params: dict,
+        page_size: int,
+        checkpoint: CheckpointStore = None,
+        timeout: float = None,
+        deadline: float = None
+):
+    checkpoint_key = None
+    offset = 0
+    if checkpoint is not None:
+        checkpoint_key = checkpoint.make_key(endpoint, params)
+        offset = checkpoint.load(checkpoint_key) or 0
+    while True:
+        page_params = dict(params, offset=offset, limit=page_size)
+        page_deadline = make_deadline(timeout, deadline)
+        while True:
+            if page_deadline is not None:
+                remaining(page_deadline)
+            try:
+                page = await connection.stream(
+                    endpoint, page_params,
+                    **deadline_options(deadline=page_deadline)
+                )
+                break
+            except TreillageRateLimitException:
+                pass
+        async with page:
+            async for item in page:
+                yield item
+        offset += page_size
+        if not page.fields['hasMore']:
+            break
+        if checkpoint is not None:
+            checkpoint.save(checkpoint_key, offset)
+    if checkpoint is not None:
+        checkpoint.clear(checkpoint_key)
 
 
 async def list_paginator(
         connection: ConnectionManager,
         endpoint: str,
-        params: dict
+        params: dict,
+        prefetch: int = 0,
+        concurrency: int = 1,
+        ordered: bool = True,
+        page_size: Union[int, PageSizePolicy] = 100,
+        checkpoint: CheckpointStore = None,
+        # Decode items while each page streams in instead of all at once
+        stream: bool = False,
+        timeout: float = None,
+        deadline: float = None
 ):
-    has_more = True
-    params['offset'] = 0
-    params['limit'] = 100
+    """
+    Yield every item of a paginated list endpoint
+
+    Takes the same options as `page_paginator`. A page only counts as
+    consumed for the checkpoint once all of its items have been yielded.
 
-    while has_more:
+    With `stream`, pages are requested one at a time through
+    `connection.stream` and items are yielded as soon as they are decoded,
+    so peak memory is set by the largest item rather than the largest page.
+    Streaming needs a fixed page size and cannot be combined with
+    `prefetch` or `concurrency`, which would buffer whole pages.
+    """
+    if stream:
+        if isinstance(page_size, FixedPageSize):
+            page_size = page_size.next_limit()
+        if prefetch > 0 or concurrency > 1 or not isinstance(page_size, int):
+            raise TreillageValueError(
+                "Streaming needs a fixed page size without prefetch "
+                "or concurrency"
+            )
+        items = _stream_paginator(connection, endpoint, params,
+                                  page_size=page_size,
+                                  checkpoint=checkpoint,
+                                  timeout=timeout,
+                                  deadline=deadline)
         try:
-            resp = await connection.get(endpoint, params)
-            has_more = resp['hasMore']
-            params['offset'] += params['limit']
-            for item in resp['items']:
+            async for item in items:
                 yield item
-        except TreillageRateLimitException:
-            pass
+        finally:
+            await items.aclose()
+        return
+    pages = page_paginator(connection, endpoint, params,
+                           prefetch=prefetch,
+                           concurrency=concurrency,
+                           ordered=ordered,
+                           page_size=page_size,
+                           checkpoint=checkpoint,
+                           timeout=timeout,
+                           deadline=deadline)
+    try:
+        async for page in pages:
+            for item in page.items:
+                yield item
+    finally:
+        # Cancel outstanding page requests when the consumer stops early
+        await pages.aclose()
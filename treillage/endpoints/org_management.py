@@ -1,7 +1,10 @@
-from typing import List
+from typing import List, Union
 from .. import ConnectionManager
+from ..checkpoint import CheckpointStore
+from ..deadline import deadline_options
 from .. import TreillageTypeError, TreillageValueError
-from .list_paginator import list_paginator
+from .list_paginator import list_paginator, page_paginator
+from .list_paginator import PageSizePolicy
 
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
@@ -12,7 +15,9 @@ from .list_paginator import list_paginator
 async def get_contact(
         connection: ConnectionManager,
         contact_id: str,
-        fields: List[str] = None
+        fields: List[str] = None,
+        timeout: float = None,
+        deadline: float = None
 ):
     endpoint = f'/core/contacts/{contact_id}'
     params = dict()
@@ -20,20 +25,19 @@ async def get_contact(
         requested_fields = ','.join(*[fields])
         params['requestedFields'] = requested_fields
 
-    return await connection.get(endpoint, params)
+    return await connection.get(endpoint, params,
+                                **deadline_options(timeout, deadline))
 
 
-async def get_contact_list(connection: ConnectionManager,
-                           fields: List[str] = None,
-                           first_name: str = None,
-                           last_name: str = None,
-                           full_name: str = None,
-                           nick_name: str = None,
-                           person_type: str = None,
-                           phone: str = None,
-                           email: str = None
-                           ):
-    endpoint = '/core/contacts'
+def _contact_list_params(fields: List[str] = None,
+                         first_name: str = None,
+                         last_name: str = None,
+                         full_name: str = None,
+                         nick_name: str = None,
+                         person_type: str = None,
+                         phone: str = None,
+                         email: str = None
+                         ) -> dict:
     params = dict()
     if fields:
         requested_fields = ','.join(*[fields])
@@ -52,9 +56,83 @@ async def get_contact_list(connection: ConnectionManager,
         params['phone'] = phone
     if email:
         params['email'] = email
+    return params
+
+
+async def get_contact_list(connection: ConnectionManager,
+                           fields: List[str] = None,
+                           first_name: str = None,
+                           last_name: str = None,
+                           full_name: str = None,
+                           nick_name: str = None,
+                           person_type: str = None,
+                           phone: str = None,
+                           email: str = None,
+                           prefetch: int = 0,
+                           concurrency: int = 1,
+                           ordered: bool = True,
+                           page_size: Union[int, PageSizePolicy] = 100,
+                           checkpoint: CheckpointStore = None,
+                           stream: bool = False,
+                           timeout: float = None,
+                           deadline: float = None
+                           ):
+    endpoint = '/core/contacts'
+    params = _contact_list_params(fields, first_name, last_name, full_name,
+                                  nick_name, person_type, phone, email)
+
+    items = list_paginator(connection, endpoint, params,
+                           prefetch=prefetch,
+                           concurrency=concurrency,
+                           ordered=ordered,
+                           page_size=page_size,
+                           checkpoint=checkpoint,
+                           stream=stream,
+                           timeout=timeout,
+                           deadline=deadline)
+    try:
+        async for contact in items:
+            yield contact
+    finally:
+        # Release prefetched pages when the caller stops early
+        await items.aclose()
+
+
+async def get_contact_pages(connection: ConnectionManager,
+                            fields: List[str] = None,
+                            first_name: str = None,
+                            last_name: str = None,
+                            full_name: str = None,
+                            nick_name: str = None,
+                            person_type: str = None,
+                            phone: str = None,
+                            email: str = None,
+                            prefetch: int = 0,
+                            concurrency: int = 1,
+                            ordered: bool = True,
+                            page_size: Union[int, PageSizePolicy] = 100,
+                            checkpoint: CheckpointStore = None,
+                            timeout: float = None,
+                            deadline: float = None
+                            ):
+    endpoint = '/core/contacts'
+    params = _contact_list_params(fields, first_name, last_name, full_name,
+                                  nick_name, person_type, phone, email)
 
-    async for contact in list_paginator(connection, endpoint, params):
-        yield contact
+    pages = page_paginator(connection, endpoint, params,
+                           prefetch=prefetch,
+                           concurrency=concurrency,
+                           ordered=ordered,
+                           page_size=page_size,
+                           checkpoint=checkpoint,
+                           timeout=timeout,
+                           deadline=deadline)
+    try:
+        async for page in pages:
+            yield page
+    finally:
+        # Release prefetched pages when the caller stops early
+        await pages.aclose()
 
 
 async def create_contact():
@@ -89,6 +167,8 @@ async def update_contact(connection: ConnectionManager,
                          phones: List = None,
                          emails: List = None,
                          addresses: List = None,
+                         timeout: float = None,
+                         deadline: float = None
                          ):
     def validate_person_type(person_type) -> bool:
         valid_types = {'Adjuster', 'Attorney', 'Client', 'Court', 'Defendant',
@@ -189,4 +269,5 @@ async def update_contact(connection: ConnectionManager,
         else:
             raise TreillageTypeError
 
-    return await connection.patch(endpoint, body)
+    return await connection.patch(endpoint, body,
+                                  **deadline_options(timeout, deadline))
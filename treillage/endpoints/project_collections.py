@@ -0,0 +1,178 @@
+import copy
+import inspect
+from typing import Callable, List
+from .. import ConnectionManager, TreillageRateLimitException
+from ..bulk import bounded_map
+from ..deadline import deadline_options, make_deadline, remaining
+
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#                          Collection Items
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def _collection_item_endpoint(project_id, section_selector, item_id) -> str:
+    return (f'/core/projects/{project_id}/collections/{section_selector}/'
+            f'{item_id}')
+
+
+async def get_collection_item(connection: ConnectionManager,
+                              project_id: str,
+                              section_selector: str,
+                              item_id: str,
+                              requested_fields: List[str] = None,
+                              timeout: float = None,
+                              deadline: float = None):
+    endpoint = _collection_item_endpoint(project_id, section_selector, item_id)
+    params = dict()
+    if requested_fields:
+        params['requestedFields'] = ','.join(requested_fields)
+
+    return await connection.get(endpoint, params,
+                                **deadline_options(timeout, deadline))
+
+
+async def update_collection_item(connection: ConnectionManager,
+                                 project_id: str,
+                                 section_selector: str,
+                                 item_id: str,
+                                 body: dict,
+                                 timeout: float = None,
+                                 deadline: float = None):
+    endpoint = _collection_item_endpoint(project_id, section_selector, item_id)
+    return await connection.patch(endpoint, body,
+                                  **deadline_options(timeout, deadline))
+
+
+class CollectionItemUpdate:
+    """A change to merge into one collection item"""
+
+    def __init__(self,
+                 project_id: str,
+                 section_selector: str,
+                 item_id: str,
+                 data: dict,
+                 requested_fields: List[str] = None,
+                 context=None):
+        self.project_id = project_id
+        self.section_selector = section_selector
+        self.item_id = item_id
+        # Body holding the new values, e.g. {'dataObject': {'docs': [...]}}
+        self.data = data
+        # Fields to read before merging, defaults to the fields in `data`
+        if requested_fields is None:
+            requested_fields = list(data.get('dataObject', dict()))
+        self.requested_fields = requested_fields
+        # Anything the caller wants back in its result and error sinks
+        self.context = context
+
+    @property
+    def endpoint(self) -> str:
+        return _collection_item_endpoint(self.project_id,
+                                         self.section_selector,
+                                         self.item_id)
+
+
+def merge_data_object(current: dict, data: dict) -> dict:
+    """
+    Add the values in `data` to the current values of the item
+
+    List fields are extended with the new values placed first, every other
+    field in `data` replaces the current value.
+    """
+    body = copy.deepcopy(data)
+    current_fields = current.get('dataObject') or dict()
+    for field, value in body.get('dataObject', dict()).items():
+        existing = current_fields.get(field)
+        if isinstance(value, list) and isinstance(existing, list):
+            body['dataObject'][field] = value + existing
+    return body
+
+
+def replace_data_object(current: dict, data: dict) -> dict:
+    """Send `data` as it is, overwriting the current values"""
+    return data
+
+
+async def _call_sink(sink, *args):
+    if sink is not None:
+        result = sink(*args)
+        if inspect.isawaitable(result):
+            await result
+
+
+async def _retry_rate_limited(func, *args, deadline: float = None):
+    while True:
+        if deadline is not None:
+            remaining(deadline)
+        try:
+            return await func(*args, **deadline_options(deadline=deadline))
+        except TreillageRateLimitException:
+            pass
+
+
+async def update_collection_items(
+        connection: ConnectionManager,
+        updates,
+        # Builds the PATCH body from the current item and the update data
+        merge: Callable[[dict, dict], dict] = merge_data_object,
+        concurrency: int = 10,
+        ordered: bool = False,
+        # Called with (update, response) after each successful PATCH
+        on_result: Callable = None,
+        # Called with (update, step, exception) when 'get', 'merge' or
+        # 'patch' fails
+        on_error: Callable = None,
+        # Seconds allowed for each GET or PATCH, including retries
+        timeout: float = None,
+        # time.monotonic() value by which every request must have finished
+        deadline: float = None
+):
+    """
+    Read, merge and write back many collection items concurrently
+
+    For every `CollectionItemUpdate` in `updates`, a regular or async
+    iterable, the item's requested fields are fetched, `merge` builds the
+    PATCH body from them and the update's `data`, and the item is patched.
+    Up to `concurrency` items are worked on at the same time, so the GETs
+    and PATCHes of different rows overlap while the rate limiter paces
+    them. A rate limited GET or PATCH is retried on its own.
+
+    Yields a `BulkResult` per update, as items finish unless `ordered` is
+    true. A failed item does not stop the others; its result carries the
+    exception, which is also passed to `on_error`. With a `merge` that
+    does not depend on the current item, such as `replace_data_object`,
+    pass `requested_fields=[]` on the updates to skip the GET.
+    """
+    async def process(update: CollectionItemUpdate):
+        step = 'get'
+        try:
+            current = dict()
+            if update.requested_fields:
+                current = await _retry_rate_limited(
+                    get_collection_item, connection, update.project_id,
+                    update.section_selector, update.item_id,
+                    update.requested_fields,
+                    deadline=make_deadline(timeout, deadline)
+                )
+            step = 'merge'
+            body = merge(current, update.data)
+            step = 'patch'
+            response = await _retry_rate_limited(
+                update_collection_item, connection, update.project_id,
+                update.section_selector, update.item_id, body,
+                deadline=make_deadline(timeout, deadline)
+            )
+        except Exception as exception:
+            await _call_sink(on_error, update, step, exception)
+            raise
+        await _call_sink(on_result, update, response)
+        return response
+
+    results = bounded_map(process, updates,
+                          concurrency=concurrency,
+                          ordered=ordered)
+    try:
+        async for result in results:
+            yield result
+    finally:
+        await results.aclose()
@@ -1,3 +1,6 @@
+import asyncio
+
+
 class TreillageException(Exception):
     def __init__(self, msg=None, url=None):
         if not msg:
@@ -37,3 +40,17 @@ class TreillageValueError(TreillageException, ValueError):
         if not msg:
             msg = "Given parameter does not meet argument requirements"
         super(TreillageValueError, self).__init__(msg=msg)
+
+
+class TreillageTimeoutError(TreillageException, asyncio.TimeoutError):
+    def __init__(self, url=None, msg=None):
+        if not msg:
+            msg = "Request did not complete before its deadline"
+        super(TreillageTimeoutError, self).__init__(msg=msg, url=url)
+
+
+class TreillageIntegrityError(TreillageException):
+    def __init__(self, url=None, msg=None):
+        if not msg:
+            msg = "Downloaded data does not match its size or checksum"
+        super(TreillageIntegrityError, self).__init__(msg=msg, url=url)
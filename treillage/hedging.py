@@ -0,0 +1,76 @@
+from collections import deque
+from math import ceil
+from .exceptions import TreillageValueError
+
+
+class HedgingPolicy:
+    """
+    Decide when a slow GET gets a second, identical request
+
+    A hedge is sent once a request has been outstanding for longer than the
+    `percentile` of recently observed latencies, clamped between
+    `min_delay` and `max_delay` seconds. Until `min_samples` latencies have
+    been seen, `initial_delay` is used. At most `max_hedge_ratio` of all
+    requests are hedged, so that slow periods do not double the load.
+    """
+
+    def __init__(self,
+                 percentile: float = 95,
+                 initial_delay: float = 1.0,
+                 min_delay: float = 0.01,
+                 max_delay: float = 10.0,
+                 max_hedge_ratio: float = 0.05,
+                 window: int = 1000,
+                 min_samples: int = 20):
+        if not 0 < percentile <= 100:
+            raise TreillageValueError(
+                "Percentile must be greater than 0 and at most 100"
+            )
+        if not 0 <= max_hedge_ratio <= 1:
+            raise TreillageValueError(
+                "Hedge ratio must be between 0 and 1"
+            )
+        self.__percentile = percentile
+        self.__initial_delay = initial_delay
+        self.__min_delay = min_delay
+        self.__max_delay = max_delay
+        self.__max_hedge_ratio = max_hedge_ratio
+        self.__latencies = deque(maxlen=window)
+        self.__min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        # Hedges that returned before the request they duplicated
+        self.hedge_wins = 0
+
+    @property
+    def stats(self) -> dict:
+        requests = self.requests
+        return {
+            'requests': requests,
+            'hedges': self.hedges,
+            'hedge_rate': self.hedges / requests if requests else 0.0,
+            'hedge_wins': self.hedge_wins,
+            'delay': self.delay(),
+        }
+
+    def delay(self) -> float:
+        """Seconds to wait for a response before sending a hedge"""
+        if len(self.__latencies) < self.__min_samples:
+            return self.__initial_delay
+        latencies = sorted(self.__latencies)
+        index = ceil(len(latencies) * self.__percentile / 100) - 1
+        return min(self.__max_delay,
+                   max(self.__min_delay, latencies[max(0, index)]))
+
+    def record(self, latency: float):
+        self.__latencies.append(latency)
+
+    def request_started(self):
+        self.requests += 1
+
+    def allow_hedge(self) -> bool:
+        """Take a hedge from the budget if that stays within the ratio"""
+        if self.hedges + 1 > self.__max_hedge_ratio * self.requests:
+            return False
+        self.hedges += 1
+        return True
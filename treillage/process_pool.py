@@ -0,0 +1,198 @@
+import asyncio
+import functools
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+from typing import Union
+from .bulk import BulkResult, bounded_map, _aiter
+from .connection_manager import ConnectionManager
+from .credential import Credential
+from .exceptions import TreillageException, TreillageValueError
+from .ratelimiter import SharedRateLimiter
+from .treillage import BaseURL
+
+# The state of the worker process this module runs in, see _init_worker
+_worker = None
+
+
+class _Worker:
+    """The event loop and connection of one worker process"""
+
+    def __init__(self, base_url: str, credentials: Credential,
+                 max_connections: int, rate_limiter: SharedRateLimiter,
+                 connection_options: dict):
+        self.base_url = base_url
+        self.credentials = credentials
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.connection_options = connection_options
+        self.connection = None
+        self.loop = asyncio.new_event_loop()
+        # Runs when the process exits, after its last batch
+        util.Finalize(self, self.close, exitpriority=10)
+
+    def run_batch(self, func, items: list, concurrency: int) -> list:
+        return self.loop.run_until_complete(
+            self.__run_batch(func, items, concurrency)
+        )
+
+    async def __run_batch(self, func, items: list, concurrency: int) -> list:
+        if self.connection is None:
+            self.connection = await ConnectionManager.create(
+                self.base_url,
+                self.credentials,
+                self.max_connections,
+                rate_limiter=self.rate_limiter,
+                **self.connection_options
+            )
+        results = []
+        async for result in bounded_map(
+                functools.partial(func, self.connection), items,
+                concurrency=concurrency):
+            results.append((result.value, _portable(result.exception)))
+        return results
+
+    def close(self):
+        if self.connection is not None:
+            self.loop.run_until_complete(self.connection.close())
+        self.loop.close()
+
+
+def _init_worker(*args):
+    global _worker
+    _worker = _Worker(*args)
+
+
+def _run_batch(func, items: list, concurrency: int) -> list:
+    return _worker.run_batch(func, items, concurrency)
+
+
+def _portable(exception):
+    # Exceptions are pickled on their way back to the parent process. Those
+    # that cannot be rebuilt there are replaced, keeping their message.
+    if exception is None:
+        return None
+    try:
+        pickle.loads(pickle.dumps(exception))
+        return exception
+    except Exception:
+        return TreillageException(
+            msg=f"{type(exception).__name__}: {exception}"
+        )
+
+
+async def _batches(iterable, batch_size: int):
+    batch = []
+    async for item in _aiter(iterable):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ProcessPoolRunner:
+    """
+    Run bulk jobs across worker processes that share one rate limit
+
+    For jobs whose work around each request, such as parsing files or
+    building bodies, is too much for a single core. Every worker process
+    opens its own `ConnectionManager` with the given options, while all of
+    them draw from one `requests_per_second` budget through a
+    `SharedRateLimiter`. The options, the functions passed to `map`, their
+    items and their results are pickled between processes.
+    """
+
+    def __init__(self,
+                 credentials_file: str,
+                 base_url: Union[str, BaseURL] = BaseURL.UNITED_STATES.value,
+                 # Number of worker processes, defaults to the CPU count
+                 processes: int = None,
+                 # Requests per second allowed across all processes
+                 requests_per_second: int = None,
+                 # Number of parallel connections of each process
+                 max_connections: int = None,
+                 # Items sent to a worker process at a time
+                 batch_size: int = 50,
+                 # A multiprocessing context, e.g. get_context('spawn')
+                 mp_context=None,
+                 # Further keyword options passed on to ConnectionManager
+                 **connection_options):
+        if isinstance(base_url, BaseURL):
+            base_url = base_url.value
+        if batch_size < 1:
+            raise TreillageValueError("Batch size must be at least 1")
+        credentials = Credential.get_credentials(credentials_file)
+        self.__processes = processes or os.cpu_count() or 1
+        self.__batch_size = batch_size
+        if requests_per_second is not None:
+            self.__rate_limiter = SharedRateLimiter(
+                token_rate=requests_per_second,
+                context=mp_context
+            )
+        else:
+            self.__rate_limiter = None
+        self.__pool = ProcessPoolExecutor(
+            max_workers=self.__processes,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(base_url, credentials, max_connections,
+                      self.__rate_limiter, connection_options)
+        )
+
+    @property
+    def processes(self) -> int:
+        return self.__processes
+
+    @property
+    def rate_limiter(self) -> SharedRateLimiter:
+        return self.__rate_limiter
+
+    async def map(self, func, iterable, concurrency: int = 10,
+                  ordered: bool = True):
+        """
+        Await `func(connection, item)` for every item in a worker process
+
+        `func` must be a coroutine function defined at module level, and
+        `iterable` may be a regular or an async iterable. Items go to the
+        workers in batches, and each worker runs up to `concurrency` of its
+        items at once. Yields a `BulkResult` for every item, like
+        `ConnectionManager.map`. If a whole batch fails, for example when a
+        result cannot be pickled, each of its items carries that error.
+        """
+        if concurrency < 1:
+            raise TreillageValueError("Concurrency must be at least 1")
+        loop = asyncio.get_running_loop()
+
+        async def run_batch(batch):
+            return await loop.run_in_executor(
+                self.__pool, _run_batch, func, batch, concurrency
+            )
+
+        # Two batches per process, so workers do not idle between batches
+        async for batch in bounded_map(run_batch,
+                                       _batches(iterable, self.__batch_size),
+                                       concurrency=2 * self.__processes,
+                                       ordered=ordered):
+            for offset, item in enumerate(batch.item):
+                if batch.ok:
+                    value, exception = batch.value[offset]
+                else:
+                    value, exception = None, batch.exception
+                yield BulkResult(item,
+                                 batch.index * self.__batch_size + offset,
+                                 value=value,
+                                 exception=exception)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.__pool.shutdown
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.close()
@@ -1,10 +1,67 @@
 import asyncio
 from math import log2, ceil
+import multiprocessing
 import random
 import time
+from .exceptions import TreillageException
 
 
-class RateLimiter:
+def backoff_time_ms(failed_attempts: float, max_backoff_time: int) -> float:
+    """
+    Return time in milliseconds to backoff after a failed request
+
+    Returns a random amount of time in milliseconds between 100ms and an
+    upper limit of 2^num_failed_attempts * 100. To avoid overflow, the
+    maximum exponent is limited so that max_backoff_time is never exceeded
+    """
+    return random.randint(
+        100,  # minimum 100ms
+        # The ceil function is working in tenths of seconds,
+        # so max_backoff_time must be converted from seconds to tenths of
+        # seconds and the result must be converted from tenths to
+        # milliseconds (thousandths of seconds).
+        ceil(2 ** (
+            min(
+                log2(max_backoff_time * 10),
+                failed_attempts
+            )
+        )) * 100
+    )
+
+
+class RateLimiterBackend:
+    """
+    Decides when `ConnectionManager` may send its next request
+
+    `get_token` waits until a request may be sent. `try_get_token` takes a
+    token only if one is available without waiting, for optional requests
+    such as hedges. `last_try_success` is told whether the response was
+    rate limited, and must not block as it is called from the response
+    handling. `tokens` is an estimate of the requests that could be sent
+    right away.
+    """
+
+    async def get_token(self):
+        raise NotImplementedError
+
+    async def try_get_token(self) -> bool:
+        """Take a token if that needs no waiting or backoff"""
+        return False
+
+    def last_try_success(self, was_success: bool):
+        raise NotImplementedError
+
+    @property
+    def tokens(self) -> float:
+        raise NotImplementedError
+
+    @property
+    def failed_attempts(self) -> float:
+        """Recent rate limit errors, above 0 while requests back off"""
+        return 0
+
+
+class RateLimiter(RateLimiterBackend):
     def __init__(self,
                  token_rate: int = 8,
                  max_backoff_time: int = 64):
@@ -28,6 +85,16 @@ class RateLimiter:
         # Consume a token
         self.__tokens -= 1
 
+    async def try_get_token(self) -> bool:
+        if self.__failed_attempts > 0:
+            return False
+        if self.__tokens < 1:
+            self.__add_new_token()
+        if self.__tokens < 1:
+            return False
+        self.__tokens -= 1
+        return True
+
     async def __wait_for_token(self):
         # Check if there are any tokens available to regen
         if not self.__add_new_token():
@@ -38,6 +105,10 @@ class RateLimiter:
     def tokens(self) -> int:
         return self.__tokens
 
+    @property
+    def failed_attempts(self) -> float:
+        return self.__failed_attempts
+
     @tokens.setter
     def tokens(self, i):
         # Must be between 0 and MAX_TOKENS
@@ -54,26 +125,8 @@ class RateLimiter:
             )
 
     def __get_backoff_time_ms(self) -> float:
-        """
-        Return time in milliseconds to backoff after a failed request
-
-        Returns a random amount of time in milliseconds between 100ms and an
-        upper limit of 2^num_failed_attempts * 100. To avoid overflow, the
-        maximum exponent is limited so that max_backoff_time is never exceeded
-        """
-        return random.randint(
-            100,  # minimum 100ms
-            # The ceil function is working in tenths of seconds,
-            # so max_backoff_time must be converted from seconds to tenths of
-            # seconds and the result must be converted from tenths to
-            # milliseconds (thousandths of seconds).
-            ceil(2 ** (
-                min(
-                    log2(self.__max_backoff_time * 10),
-                    self.__failed_attempts
-                )
-            )) * 100
-        )
+        return backoff_time_ms(self.__failed_attempts,
+                               self.__max_backoff_time)
 
     def __add_new_token(self) -> bool:
         now = time.monotonic()
@@ -85,3 +138,243 @@ class RateLimiter:
             return True
         else:
             return False
+
+
+class SharedRateLimiter(RateLimiterBackend):
+    """
+    A token bucket shared by several processes
+
+    The bucket lives in shared memory, so every process that received the
+    limiter when it was started draws from the same `token_rate` budget, and
+    a rate limit error seen by one of them makes all of them back off. Pass
+    it to each process's `ConnectionManager` with the `rate_limiter`
+    option. Tokens are reserved ahead, so callers wait in the order they
+    asked instead of polling the bucket.
+    """
+
+    def __init__(self,
+                 token_rate: int = 8,
+                 max_backoff_time: int = 64,
+                 context=None):
+        # A multiprocessing context, e.g. multiprocessing.get_context('spawn')
+        context = context or multiprocessing
+        self.__token_rate = token_rate
+        self.__max_tokens = token_rate
+        self.__max_backoff_time = max_backoff_time
+        # Tokens, time of the last update and failed attempts
+        self.__state = context.Array('d', [token_rate, time.monotonic(), 0])
+
+    @property
+    def token_rate(self) -> int:
+        return self.__token_rate
+
+    @property
+    def tokens(self) -> float:
+        """Tokens available now, negative while others wait for theirs"""
+        with self.__state.get_lock():
+            return self.__refill(time.monotonic())
+
+    @property
+    def failed_attempts(self) -> float:
+        return self.__state[2]
+
+    def __refill(self, now: float) -> float:
+        tokens, last_update, _ = self.__state
+        return min(self.__max_tokens,
+                   tokens + (now - last_update) * self.__token_rate)
+
+    async def get_token(self):
+        failed_attempts = self.__state[2]
+        if failed_attempts > 0:
+            await asyncio.sleep(
+                backoff_time_ms(failed_attempts, self.__max_backoff_time) /
+                1000
+            )
+        # The lock is only held for a few arithmetic operations, so taking
+        # it does not stall the event loop
+        with self.__state.get_lock():
+            now = time.monotonic()
+            tokens = self.__refill(now) - 1
+            self.__state[0] = tokens
+            self.__state[1] = now
+        if tokens < 0:
+            # Wait until the token reserved above has been regenerated
+            await asyncio.sleep(-tokens / self.__token_rate)
+
+    async def try_get_token(self) -> bool:
+        with self.__state.get_lock():
+            now = time.monotonic()
+            tokens = self.__refill(now)
+            if self.__state[2] > 0 or tokens < 1:
+                return False
+            self.__state[0] = tokens - 1
+            self.__state[1] = now
+        return True
+
+    def last_try_success(self, was_success: bool):
+        with self.__state.get_lock():
+            if not was_success:
+                self.__state[2] += 1
+            else:
+                self.__state[2] = max(
+                    0,
+                    self.__state[2] - self.__max_tokens / 3
+                )
+
+
+# Reserves the next request slot with the generic cell rate algorithm. The
+# theoretical arrival time (TAT) of the next request is kept in KEYS[1] and
+# the server clock is used, so hosts do not need synchronised clocks.
+# Returns the seconds to wait, the failed attempts kept in KEYS[2] and the
+# tokens left after the reservation. When ARGV[3] is 1, nothing is reserved
+# if that would mean waiting or backing off, and a positive wait is returned.
+_RESERVE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+tat = tat + interval
+local wait = math.max(0, tat - burst * interval - now)
+local failures = redis.call('GET', KEYS[2]) or '0'
+if ARGV[3] == '1' and (wait > 0 or tonumber(failures) > 0) then
+    return {tostring(math.max(wait, interval)), failures,
+            tostring(burst - (tat - interval - now) / interval)}
+end
+redis.call('SET', KEYS[1], tostring(tat),
+           'PX', math.ceil((tat - now) * 1000) + 1000)
+return {tostring(wait), failures, tostring(burst - (tat - now) / interval)}
+"""
+
+# Adds ARGV[1] to the failed attempts in KEYS[1], never going below zero.
+# The count expires after ARGV[2] seconds without rate limit errors.
+_RECORD_SCRIPT = """
+local failures = tonumber(redis.call('GET', KEYS[1]) or '0')
+failures = math.max(0, failures + tonumber(ARGV[1]))
+if failures > 0 then
+    redis.call('SET', KEYS[1], tostring(failures), 'EX', ARGV[2])
+else
+    redis.call('DEL', KEYS[1])
+end
+return tostring(failures)
+"""
+
+
+class RedisRateLimiter(RateLimiterBackend):
+    """
+    A rate limit shared by every host that uses the same Redis server
+
+    Requests are spaced with the generic cell rate algorithm, run as a Lua
+    script so that each reservation is atomic, and rate limit errors are
+    counted in Redis so one host's 429 makes the whole fleet back off. Give
+    every limiter for the same Filevine org the same `key`. `client` is a
+    `redis.asyncio.Redis` compatible client, or pass a Redis `url` and one
+    is created, which needs the redis package. Errors reaching Redis are
+    raised to the request that needed the token.
+    """
+
+    def __init__(self,
+                 client=None,
+                 token_rate: int = 8,
+                 max_backoff_time: int = 64,
+                 key: str = 'treillage:rate_limit',
+                 url: str = None):
+        if client is None:
+            if url is None:
+                raise TreillageException(
+                    msg="RedisRateLimiter needs a Redis client or url"
+                )
+            try:
+                import redis.asyncio
+            except ImportError:
+                raise TreillageException(
+                    msg="RedisRateLimiter requires the redis package, "
+                        "install it with `pip install redis`"
+                )
+            client = redis.asyncio.Redis.from_url(url)
+        self.__client = client
+        self.__token_rate = token_rate
+        self.__max_tokens = token_rate
+        self.__max_backoff_time = max_backoff_time
+        # The braces keep both keys in one Redis Cluster slot
+        self.__keys = [f'{{{key}}}:tat', f'{{{key}}}:failures']
+        self.__reserve = client.register_script(_RESERVE_SCRIPT)
+        self.__record = client.register_script(_RECORD_SCRIPT)
+        # Last values seen in Redis, for the synchronous methods
+        self.__failed_attempts = 0
+        self.__tokens = token_rate
+        self.__last_update = time.monotonic()
+        self.__pending = set()
+
+    @property
+    def client(self):
+        return self.__client
+
+    @property
+    def failed_attempts(self) -> float:
+        """Failed attempts in Redis as of the last reservation"""
+        return self.__failed_attempts
+
+    @property
+    def tokens(self) -> float:
+        """Tokens left at the last reservation, plus those regenerated"""
+        regenerated = (time.monotonic() - self.__last_update) * \
+            self.__token_rate
+        return min(self.__max_tokens, self.__tokens + regenerated)
+
+    async def __reserve_token(self, only_if_free: bool) -> float:
+        # Returns the seconds to wait for the reserved token
+        wait, failed_attempts, tokens = await self.__reserve(
+            keys=self.__keys,
+            args=[1 / self.__token_rate, self.__max_tokens,
+                  int(only_if_free)]
+        )
+        self.__failed_attempts = float(failed_attempts)
+        self.__tokens = float(tokens)
+        self.__last_update = time.monotonic()
+        return float(wait)
+
+    async def get_token(self):
+        wait = await self.__reserve_token(only_if_free=False)
+        if self.__failed_attempts > 0:
+            wait += backoff_time_ms(self.__failed_attempts,
+                                    self.__max_backoff_time) / 1000
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def try_get_token(self) -> bool:
+        """Reserve a token in Redis if one is free and no host backs off"""
+        return await self.__reserve_token(only_if_free=True) == 0
+
+    def last_try_success(self, was_success: bool):
+        if was_success:
+            # Most responses succeed while no host is backing off, so only
+            # write to Redis when there is a backoff to reduce
+            if self.__failed_attempts <= 0:
+                return
+            change = -self.__max_tokens / 3
+        else:
+            change = 1
+        self.__failed_attempts = max(0, self.__failed_attempts + change)
+        # Sent in the background as this method must not block
+        task = asyncio.get_running_loop().create_task(self.__record(
+            keys=self.__keys[1:],
+            args=[change, self.__max_backoff_time * 10]
+        ))
+        self.__pending.add(task)
+        task.add_done_callback(self.__recorded)
+
+    def __recorded(self, task):
+        self.__pending.discard(task)
+        # A lost update only shortens or lengthens one backoff, so the
+        # error is consumed rather than failing a request
+        if not task.cancelled():
+            task.exception()
+
+    async def flush(self):
+        """Wait until recorded successes and failures have reached Redis"""
+        if self.__pending:
+            await asyncio.gather(*self.__pending, return_exceptions=True)
@@ -0,0 +1,491 @@
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+import json
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+import zlib
+
+
+class CacheEntry:
+    def __init__(self,
+                 endpoint: str,
+                 value,
+                 expires: float,
+                 size: int,
+                 etag: str = None,
+                 last_modified: str = None):
+        self.endpoint = endpoint
+        self.value = value
+        # time.time() after which the entry is stale
+        self.expires = expires
+        # Approximate size of the cached body in bytes
+        self.size = size
+        # Validators returned by the server, used to revalidate when stale
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires
+
+    @property
+    def validators(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    @property
+    def conditional_headers(self) -> dict:
+        headers = dict()
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    Cache for decoded GET responses, keyed by request
+
+    `ttls` maps endpoint glob patterns, such as '/core/contacts/*', to the
+    number of seconds a response stays fresh. The first matching pattern
+    wins and endpoints that match none use `default_ttl`. A TTL of 0 turns
+    caching off for matching endpoints.
+    """
+
+    def __init__(self, default_ttl: float = 60, ttls: dict = None):
+        self.__default_ttl = default_ttl
+        self.__ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Stale entries confirmed by a 304 response
+        self.revalidations = 0
+
+    def ttl_for(self, endpoint: str) -> float:
+        for pattern, ttl in self.__ttls.items():
+            if fnmatchcase(endpoint, pattern):
+                return ttl
+        return self.__default_ttl
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'revalidations': self.revalidations,
+        }
+
+    def lookup(self,
+               key: str,
+               include_stale: bool = False) -> Optional[CacheEntry]:
+        """
+        Return the fresh entry for key, counting the hit or miss
+
+        With `include_stale`, a stale entry is returned as well, so that
+        it can be revalidated without being read a second time.
+        """
+        entry = self.get(key)
+        if entry is not None and entry.fresh:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return entry if include_stale else None
+
+    def store(self,
+              key: str,
+              endpoint: str,
+              value,
+              etag: str = None,
+              last_modified: str = None):
+        ttl = self.ttl_for(endpoint)
+        if ttl > 0:
+            self.set(key, CacheEntry(endpoint=endpoint,
+                                     value=value,
+                                     expires=time.time() + ttl,
+                                     size=approximate_size(value),
+                                     etag=etag,
+                                     last_modified=last_modified))
+
+    def refresh(self, key: str, entry: CacheEntry):
+        """Mark a revalidated entry as fresh for another TTL"""
+        self.revalidations += 1
+        entry.expires = time.time() + self.ttl_for(entry.endpoint)
+        self.touch(key, entry)
+
+    def touch(self, key: str, entry: CacheEntry):
+        self.set(key, entry)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CacheEntry):
+        raise NotImplementedError
+
+    def invalidate(self, endpoint: str):
+        """Drop the entries for endpoint and every path below it"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def matches(cached_endpoint: str, endpoint: str) -> bool:
+        endpoint = endpoint.rstrip('/')
+        cached_endpoint = cached_endpoint.rstrip('/')
+        return (cached_endpoint == endpoint or
+                cached_endpoint.startswith(endpoint + '/'))
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    In-memory LRU response cache
+
+    Bodies are kept as compact JSON and decoded on every hit, so callers
+    each receive their own objects and may modify them. The least recently
+    used entries are evicted once the cache holds more than `max_entries`
+    responses or their encoded size exceeds `max_bytes`.
+    """
+
+    def __init__(self,
+                 default_ttl: float = 60,
+                 ttls: dict = None,
+                 max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(default_ttl=default_ttl, ttls=ttls)
+        self.__entries = OrderedDict()
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__size = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def stats(self) -> dict:
+        stats = super().stats
+        stats['entries'] = len(self.__entries)
+        stats['bytes'] = self.__size
+        return stats
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        stored = self.__entries.get(key)
+        if stored is None:
+            return None
+        self.__entries.move_to_end(key)
+        return CacheEntry(endpoint=stored.endpoint,
+                          value=json.loads(stored.value),
+                          expires=stored.expires,
+                          size=stored.size,
+                          etag=stored.etag,
+                          last_modified=stored.last_modified)
+
+    def set(self, key: str, entry: CacheEntry):
+        body = json.dumps(entry.value, separators=(',', ':'))
+        entry = CacheEntry(endpoint=entry.endpoint,
+                           value=body,
+                           expires=entry.expires,
+                           size=sys.getsizeof(body),
+                           etag=entry.etag,
+                           last_modified=entry.last_modified)
+        if entry.size > self.__max_bytes:
+            return
+        self.__remove(key)
+        self.__entries[key] = entry
+        self.__size += entry.size
+        while (len(self.__entries) > self.__max_entries or
+               self.__size > self.__max_bytes):
+            oldest = next(iter(self.__entries))
+            self.__remove(oldest)
+            self.evictions += 1
+
+    def touch(self, key: str, entry: CacheEntry):
+        # Only the expiry changes, so the body is not encoded again
+        stored = self.__entries.get(key)
+        if stored is not None:
+            stored.expires = entry.expires
+            self.__entries.move_to_end(key)
+
+    def invalidate(self, endpoint: str):
+        for key in [key for key, entry in self.__entries.items()
+                    if self.matches(entry.endpoint, endpoint)]:
+            self.__remove(key)
+
+    def clear(self):
+        self.__entries.clear()
+        self.__size = 0
+
+    def __remove(self, key: str):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__size -= entry.size
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Persistent response cache stored in a SQLite file
+
+    Bodies are stored as zlib-compressed compact JSON so that a restarted
+    process can serve repeat reads locally. Once the stored bodies exceed
+    `max_bytes`, the least recently used entries are evicted. Cache hits
+    do not write to the file; their access times are kept in memory and
+    saved with the next write, or once `access_batch` of them are pending.
+    """
+
+    def __init__(self,
+                 path: str,
+                 default_ttl: float = 3600,
+                 ttls: dict = None,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 compression_level: int = 6,
+                 access_batch: int = 256):
+        super().__init__(default_ttl=default_ttl, ttls=ttls)
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__compression_level = compression_level
+        self.__access_batch = access_batch
+        # Access times of cache hits that are not written yet, by key
+        self.__accessed = dict()
+        # Used from more than one thread under SyncTreillage, e.g. reading
+        # stats while requests run on the event loop, so every use of the
+        # connection holds the lock
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        # A cache can be rebuilt, so commits do not wait for the disk
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute("PRAGMA synchronous = NORMAL")
+        self.__db.create_function('treillage_matches', 2, self.matches)
+        with self.__db:
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "endpoint TEXT NOT NULL, "
+                "body BLOB NOT NULL, "
+                "expires REAL NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "accessed REAL NOT NULL, "
+                "etag TEXT, "
+                "last_modified TEXT)"
+            )
+            columns = {row[1] for row in self.__db.execute(
+                "PRAGMA table_info(responses)"
+            )}
+            # Caches created before validators were stored
+            for column in ('etag', 'last_modified'):
+                if column not in columns:
+                    self.__db.execute(
+                        f"ALTER TABLE responses ADD COLUMN {column} TEXT"
+                    )
+            self.__db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed "
+                "ON responses (accessed)"
+            )
+        self.__size = self.__db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def stats(self) -> dict:
+        stats = super().stats
+        stats['entries'] = len(self)
+        stats['bytes'] = self.__size
+        return stats
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self.__lock:
+            row = self.__db.execute(
+                "SELECT endpoint, body, expires, size, etag, last_modified "
+                "FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.__accessed[key] = time.time()
+            if len(self.__accessed) >= self.__access_batch:
+                with self.__db:
+                    self.__save_accessed()
+        endpoint, body, expires, size, etag, last_modified = row
+        return CacheEntry(endpoint=endpoint,
+                          value=json.loads(zlib.decompress(body)),
+                          expires=expires,
+                          size=size,
+                          etag=etag,
+                          last_modified=last_modified)
+
+    def set(self, key: str, entry: CacheEntry):
+        body = zlib.compress(
+            json.dumps(entry.value, separators=(',', ':')).encode(),
+            self.__compression_level
+        )
+        if len(body) > self.__max_bytes:
+            return
+        with self.__lock, self.__db:
+            self.__accessed.pop(key, None)
+            # Eviction must see which entries were read recently
+            self.__save_accessed()
+            self.__remove(key)
+            self.__db.execute(
+                "INSERT INTO responses (key, endpoint, body, expires, size, "
+                "accessed, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.endpoint, body, entry.expires, len(body),
+                 time.time(), entry.etag, entry.last_modified)
+            )
+            self.__size += len(body)
+            self.__evict()
+
+    def touch(self, key: str, entry: CacheEntry):
+        # Only the expiry changes, so the body is not written again
+        with self.__lock, self.__db:
+            self.__accessed.pop(key, None)
+            self.__save_accessed()
+            self.__db.execute(
+                "UPDATE responses SET expires = ?, accessed = ? "
+                "WHERE key = ?",
+                (entry.expires, time.time(), key)
+            )
+
+    def invalidate(self, endpoint: str):
+        with self.__lock:
+            with self.__db:
+                self.__db.execute(
+                    "DELETE FROM responses "
+                    "WHERE treillage_matches(endpoint, ?)",
+                    (endpoint,)
+                )
+            self.__update_size()
+
+    def clear(self):
+        with self.__lock:
+            with self.__db:
+                self.__db.execute("DELETE FROM responses")
+            self.__size = 0
+
+    def close(self):
+        with self.__lock:
+            with self.__db:
+                self.__save_accessed()
+            self.__db.close()
+
+    def __save_accessed(self):
+        if self.__accessed:
+            self.__db.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key)
+                 for key, accessed in self.__accessed.items()]
+            )
+            self.__accessed.clear()
+
+    def __remove(self, key: str):
+        row = self.__db.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self.__db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.__size -= row[0]
+
+    def __evict(self):
+        while self.__size > self.__max_bytes:
+            key, size = self.__db.execute(
+                "SELECT key, size FROM responses "
+                "ORDER BY accessed, rowid LIMIT 1"
+            ).fetchone()
+            self.__db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.__size -= size
+            self.evictions += 1
+
+    def __update_size(self):
+        self.__size = self.__db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+
+class TieredResponseCache(ResponseCache):
+    """
+    Serve from a fast cache first and fall back to a persistent one
+
+    Entries found only in the persistent tier are copied into the fast
+    tier. Writes and invalidations go to both tiers. TTLs are taken from
+    the persistent tier.
+    """
+
+    def __init__(self, memory: ResponseCache, persistent: ResponseCache):
+        super().__init__()
+        self.__memory = memory
+        self.__persistent = persistent
+
+    @property
+    def memory(self) -> ResponseCache:
+        return self.__memory
+
+    @property
+    def persistent(self) -> ResponseCache:
+        return self.__persistent
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.__persistent.ttl_for(endpoint)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.__memory.get(key)
+        if entry is None or not entry.fresh:
+            entry = self.__persistent.get(key)
+            if entry is not None:
+                self.__memory.set(key, CacheEntry(
+                    endpoint=entry.endpoint,
+                    value=entry.value,
+                    expires=entry.expires,
+                    size=approximate_size(entry.value),
+                    etag=entry.etag,
+                    last_modified=entry.last_modified
+                ))
+        return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        self.__memory.set(key, entry)
+        self.__persistent.set(key, entry)
+
+    def touch(self, key: str, entry: CacheEntry):
+        self.__memory.touch(key, entry)
+        self.__persistent.touch(key, entry)
+
+    def invalidate(self, endpoint: str):
+        self.__memory.invalidate(endpoint)
+        self.__persistent.invalidate(endpoint)
+
+    def clear(self):
+        self.__memory.clear()
+        self.__persistent.clear()
+
+
+def approximate_size(value) -> int:
+    """Estimate the memory used by a decoded JSON value in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + approximate_size(item)
+    elif isinstance(value, list):
+        for item in value:
+            size += approximate_size(item)
+    return size
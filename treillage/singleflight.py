@@ -0,0 +1,51 @@
+import asyncio
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Share one in-flight call between concurrent callers with the same key
+
+    The first caller for a key starts the call, later callers wait for the
+    same result. Results and exceptions are delivered to every waiter.
+    A waiter that is cancelled only stops waiting; the shared call is
+    cancelled once no waiters are left.
+    """
+
+    def __init__(self):
+        self.__calls = dict()
+
+    def __len__(self):
+        return len(self.__calls)
+
+    async def do(self, key, func, *args, **kwargs):
+        call = self.__calls.get(key)
+        if call is None or call.task.done():
+            call = _Call(asyncio.ensure_future(func(*args, **kwargs)))
+            self.__calls[key] = call
+            call.task.add_done_callback(
+                lambda task: self.__forget(key, call)
+            )
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Unregister now, the task only finishes on a later loop
+                # tick and new callers must not join a cancelled call
+                if self.__calls.get(key) is call:
+                    del self.__calls[key]
+                call.task.cancel()
+
+    def __forget(self, key, call: _Call):
+        if self.__calls.get(key) is call:
+            del self.__calls[key]
+        # Every waiter has already seen the outcome
+        if not call.task.cancelled():
+            call.task.exception()
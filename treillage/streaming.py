@@ -0,0 +1,280 @@
+import asyncio
+import codecs
+import json
+import re
+from typing import Optional
+from .deadline import remaining
+from .exceptions import TreillageException
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DELIMITERS = frozenset(' \t\n\r,:]}')
+
+
+class JSONItemParser:
+    """
+    Incrementally decode the items of a JSON object as bytes arrive
+
+    The body must be a JSON object. Elements of the array stored under
+    `items_key` are returned by `feed` as soon as each one is complete, so
+    only the item being decoded has to be held in memory. All other
+    members of the object are collected in `fields`.
+    """
+
+    def __init__(self, items_key: str = 'items'):
+        self.__items_key = items_key
+        self.__decoder = json.JSONDecoder()
+        self.__text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.__buffer = ''
+        self.__pos = 0
+        self.__state = 'start'
+        self.__key = None
+        self.fields = dict()
+        self.item_count = 0
+
+    @property
+    def done(self) -> bool:
+        return self.__state == 'done'
+
+    def feed(self, data: bytes) -> list:
+        self.__buffer += self.__text_decoder.decode(data)
+        return self.__parse(final=False)
+
+    def close(self) -> list:
+        self.__buffer += self.__text_decoder.decode(b'', final=True)
+        items = self.__parse(final=True)
+        if not self.done:
+            raise TreillageException(msg="Incomplete JSON response body")
+        return items
+
+    def __skip_whitespace(self):
+        self.__pos = _WHITESPACE.match(self.__buffer, self.__pos).end()
+
+    def __decode_value(self, final: bool):
+        # Returns (True, value) or (False, None) when more data is needed
+        try:
+            value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+        except json.JSONDecodeError:
+            if final:
+                raise TreillageException(msg="Invalid JSON response body")
+            return False, None
+        # A number such as '12.' may continue in the next chunk, so a value
+        # only counts once the character that follows it has arrived
+        if not final and (end == len(self.__buffer) or
+                          self.__buffer[end] not in _DELIMITERS):
+            return False, None
+        self.__pos = end
+        return True, value
+
+    def __parse(self, final: bool) -> list:
+        items = []
+        while True:
+            self.__skip_whitespace()
+            if self.__pos >= len(self.__buffer):
+                break
+            char = self.__buffer[self.__pos]
+            if self.__state == 'start':
+                if char != '{':
+                    raise TreillageException(
+                        msg="Expected a JSON object in the response body"
+                    )
+                self.__pos += 1
+                self.__state = 'key'
+            elif self.__state == 'key':
+                if char == ',':
+                    self.__pos += 1
+                    continue
+                if char == '}':
+                    self.__pos += 1
+                    self.__state = 'done'
+                    continue
+                complete, key = self.__decode_value(final)
+                if not complete:
+                    break
+                self.__key = key
+                self.__state = 'colon'
+            elif self.__state == 'colon':
+                if char != ':':
+                    raise TreillageException(msg="Invalid JSON response body")
+                self.__pos += 1
+                self.__state = 'value'
+            elif self.__state == 'value':
+                if self.__key == self.__items_key and char == '[':
+                    self.__pos += 1
+                    self.__state = 'items'
+                    continue
+                complete, value = self.__decode_value(final)
+                if not complete:
+                    break
+                self.fields[self.__key] = value
+                self.__state = 'key'
+            elif self.__state == 'items':
+                if char == ',':
+                    self.__pos += 1
+                    continue
+                if char == ']':
+                    self.__pos += 1
+                    self.__state = 'key'
+                    continue
+                complete, item = self.__decode_value(final)
+                if not complete:
+                    break
+                items.append(item)
+                self.item_count += 1
+            else:
+                raise TreillageException(
+                    msg="Unexpected data after the JSON response body"
+                )
+        # Drop what has been decoded so memory stays bounded by item size
+        if self.__pos:
+            self.__buffer = self.__buffer[self.__pos:]
+            self.__pos = 0
+        return items
+
+
+class StreamedResponse:
+    """
+    A GET response whose list items are decoded while the body streams in
+
+    Iterate over it to receive the items. The remaining members of the
+    response, such as `hasMore`, are available from `fields` once the
+    items have been consumed. The connection is released when iteration
+    finishes, or by `close`, which is also called on leaving an
+    `async with` block.
+    """
+
+    def __init__(self,
+                 request_context,
+                 response,
+                 items_key: str = 'items',
+                 chunk_size: int = 64 * 1024):
+        self.__request_context = request_context
+        self.__response = response
+        self.__parser = JSONItemParser(items_key)
+        self.__chunk_size = chunk_size
+        self.__closed = False
+
+    @property
+    def fields(self) -> dict:
+        return self.__parser.fields
+
+    @property
+    def item_count(self) -> int:
+        return self.__parser.item_count
+
+    @property
+    def status(self) -> int:
+        return self.__response.status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self.__items()
+
+    async def __items(self):
+        try:
+            async for chunk in self.__response.content.iter_chunked(
+                    self.__chunk_size):
+                for item in self.__parser.feed(chunk):
+                    yield item
+            for item in self.__parser.close():
+                yield item
+        finally:
+            await self.close()
+
+    async def close(self):
+        if not self.__closed:
+            self.__closed = True
+            await self.__request_context.__aexit__(None, None, None)
+
+
+class ByteStream:
+    """
+    A response body read in chunks as it arrives
+
+    Iterate over it to receive chunks of up to `chunk_size` bytes. When
+    `read_timeout` is set, waiting longer than that for a chunk raises
+    `asyncio.TimeoutError`, as does reaching `deadline`, a
+    `time.monotonic()` value, before the body is complete. The connection
+    is released when iteration finishes, or by `close`, which is also
+    called on leaving an `async with` block.
+    """
+
+    def __init__(self,
+                 request_context,
+                 response,
+                 chunk_size: int = 1024 * 1024,
+                 read_timeout: float = None,
+                 deadline: float = None):
+        self.__request_context = request_context
+        self.__response = response
+        self.__chunk_size = chunk_size
+        self.__read_timeout = read_timeout
+        self.__deadline = deadline
+        self.__closed = False
+        self.bytes_received = 0
+
+    @property
+    def status(self) -> int:
+        return self.__response.status
+
+    @property
+    def headers(self):
+        return self.__response.headers
+
+    @property
+    def encoded(self) -> bool:
+        """Whether the body was sent with a content encoding, e.g. gzip"""
+        encoding = self.__response.headers.get('Content-Encoding', '')
+        return encoding.strip().lower() not in ('', 'identity')
+
+    @property
+    def size(self) -> Optional[int]:
+        """Length of the body from Content-Length, if the server sent it"""
+        length = self.__response.headers.get('Content-Length')
+        # Chunks are decoded, so an encoded length does not apply to them
+        if length is None or self.encoded:
+            return None
+        return int(length)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self.__chunks()
+
+    async def __chunks(self):
+        chunks = self.__response.content.iter_chunked(self.__chunk_size)
+        try:
+            while True:
+                wait = self.__read_timeout
+                if self.__deadline is not None:
+                    left = remaining(self.__deadline)
+                    wait = left if wait is None else min(wait, left)
+                try:
+                    if wait is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(chunks.__anext__(),
+                                                       wait)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    if self.__deadline is not None:
+                        remaining(self.__deadline)
+                    raise
+                self.bytes_received += len(chunk)
+                yield chunk
+        finally:
+            await self.close()
+
+    async def close(self):
+        if not self.__closed:
+            self.__closed = True
+            await self.__request_context.__aexit__(None, None, None)
@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import inspect
+import threading
+from typing import Union
+from .connection_manager import ConnectionManager
+from .exceptions import TreillageException
+from .treillage import Treillage, BaseURL
+
+
+class SyncConnectionManager:
+    """
+    Blocking versions of the `ConnectionManager` request methods
+
+    Every call runs on the event loop of the `SyncTreillage` it belongs to,
+    so all threads share its connection pool, rate limiter and caches.
+    """
+
+    def __init__(self, runner: 'SyncTreillage', connection: ConnectionManager):
+        self.__runner = runner
+        self.__connection = connection
+
+    @property
+    def connection(self) -> ConnectionManager:
+        """The asynchronous connection, for use on the event loop thread"""
+        return self.__connection
+
+    def get(self, endpoint: str, params: dict = None, headers: dict = None,
+            **options):
+        return self.__runner.run(
+            self.__connection.get(endpoint, params, headers, **options)
+        )
+
+    def post(self, endpoint: str, body: dict, headers: dict = None,
+             **options):
+        return self.__runner.run(
+            self.__connection.post(endpoint, body, headers, **options)
+        )
+
+    def patch(self, endpoint: str, body: dict, headers: dict = None,
+              **options):
+        return self.__runner.run(
+            self.__connection.patch(endpoint, body, headers, **options)
+        )
+
+    def put(self, endpoint: str, body: dict, headers: dict = None,
+            **options):
+        return self.__runner.run(
+            self.__connection.put(endpoint, body, headers, **options)
+        )
+
+    def delete(self, endpoint: str, headers: dict = None, **options):
+        return self.__runner.run(
+            self.__connection.delete(endpoint, headers, **options)
+        )
+
+    def map(self, func, iterable, **options):
+        """Iterate over the results of `ConnectionManager.map`"""
+        return self.__runner.iterate(
+            self.__connection.map(func, iterable, **options)
+        )
+
+    def execute_many(self, requests, **options):
+        """Iterate over the results of `ConnectionManager.execute_many`"""
+        return self.__runner.iterate(
+            self.__connection.execute_many(requests, **options)
+        )
+
+
+class SyncEndpoints:
+    """
+    Blocking versions of the functions in `treillage.endpoints`
+
+    The connection is passed for you, so `tr.endpoints.get_contact('1')`
+    calls `get_contact(conn, '1')`. Functions that yield, such as
+    `get_contact_list`, return a regular iterator.
+    """
+
+    def __init__(self, runner: 'SyncTreillage'):
+        self.__runner = runner
+
+    def __getattr__(self, name: str):
+        from . import endpoints
+        func = getattr(endpoints, name, None)
+        if name.startswith('_') or not (
+                inspect.iscoroutinefunction(func) or
+                inspect.isasyncgenfunction(func)):
+            raise AttributeError(f"No endpoint function named {name}")
+        return functools.partial(self.__runner.call, func)
+
+
+class SyncTreillage:
+    """
+    Use Treillage from regular, non-async code
+
+    A dedicated thread runs an event loop that owns the `Treillage` client.
+    Its methods block until the work is done on that loop, and may be called
+    from any number of threads, which then share one connection pool and
+    rate limiter. Takes the same arguments as `Treillage`. Call `close`, or
+    use it in a `with` block, to shut the client and the thread down.
+    """
+
+    def __init__(self,
+                 credentials_file: str,
+                 base_url: Union[str, BaseURL] = BaseURL.UNITED_STATES.value,
+                 max_connections: int = None,
+                 requests_per_second: int = None,
+                 **connection_options):
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run_loop,
+                                         name='treillage-event-loop',
+                                         daemon=True)
+        self.__thread.start()
+        try:
+            self.__treillage = self.run(Treillage.create(
+                credentials_file,
+                base_url,
+                max_connections,
+                requests_per_second,
+                **connection_options
+            ))
+        except BaseException:
+            self.__stop()
+            raise
+        self.__conn = SyncConnectionManager(self, self.__treillage.conn)
+        self.__endpoints = SyncEndpoints(self)
+        self.__closed = False
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+
+    def __stop(self):
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+
+    @property
+    def treillage(self) -> Treillage:
+        """The asynchronous client, for use on the event loop thread"""
+        return self.__treillage
+
+    @property
+    def conn(self) -> SyncConnectionManager:
+        return self.__conn
+
+    @property
+    def endpoints(self) -> SyncEndpoints:
+        return self.__endpoints
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.__loop
+
+    def run(self, awaitable):
+        """Run an awaitable on the event loop and return its result"""
+        if threading.current_thread() is self.__thread:
+            if inspect.iscoroutine(awaitable):
+                awaitable.close()
+            raise TreillageException(
+                msg="Blocking calls cannot be made from the event loop "
+                    "thread, await the asynchronous client instead"
+            )
+        future = asyncio.run_coroutine_threadsafe(
+            self.__as_coroutine(awaitable), self.__loop
+        )
+        try:
+            return future.result()
+        except BaseException:
+            # Stop the work when the caller gives up, e.g. on Ctrl+C
+            future.cancel()
+            raise
+
+    @staticmethod
+    async def __as_coroutine(awaitable):
+        return await awaitable
+
+    def iterate(self, async_iterable):
+        """Iterate over an async iterable from regular code"""
+        iterator = async_iterable.__aiter__()
+        try:
+            while True:
+                try:
+                    yield self.run(iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Release pages and connections when iteration stops early
+            aclose = getattr(iterator, 'aclose', None)
+            if aclose is not None and not self.__loop.is_closed():
+                self.run(aclose())
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call `func(conn, *args, **kwargs)` with the asynchronous connection
+
+        Coroutine functions are run to completion, async generators are
+        returned as regular iterators.
+        """
+        if inspect.isasyncgenfunction(func):
+            return self.iterate(func(self.__treillage.conn, *args, **kwargs))
+        return self.run(func(self.__treillage.conn, *args, **kwargs))
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        try:
+            self.run(self.__treillage.close())
+        finally:
+            self.__stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
@@ -0,0 +1,480 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import re
+import time
+from .bulk import bounded_map
+from .exceptions import (TreillageIntegrityError, TreillageTimeoutError,
+                         TreillageValueError)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class TransferStats:
+    """
+    Byte counts and throughput of a group of downloads or uploads
+
+    Pass the same object to several transfers, which may run at the same
+    time, to follow their combined progress. `throughput` is the number of
+    bytes per second since the first transfer started.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.active = 0
+        self.__started = None
+        self.__last = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.__started is None:
+            return 0.0
+        end = time.monotonic() if self.active else self.__last
+        return end - self.__started
+
+    @property
+    def throughput(self) -> float:
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed else 0.0
+
+    def transfer_started(self):
+        if self.__started is None:
+            self.__started = time.monotonic()
+        self.active += 1
+
+    def add_bytes(self, count: int):
+        self.bytes += count
+
+    def transfer_finished(self, ok: bool = True):
+        self.active -= 1
+        self.__last = time.monotonic()
+        if ok:
+            self.files += 1
+        else:
+            self.failed += 1
+
+    def __repr__(self):
+        return (f"TransferStats(files={self.files}, failed={self.failed}, "
+                f"bytes={self.bytes}, "
+                f"throughput={self.throughput / 1e6:.2f} MB/s)")
+
+
+class TransferResult:
+    """Size and duration of one finished download or upload"""
+
+    def __init__(self, document_id, destination, size: int, elapsed: float):
+        self.document_id = document_id
+        # The file path or writer the data went to, or came from
+        self.destination = destination
+        self.size = size
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self) -> float:
+        return self.size / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f"TransferResult({self.document_id}, {self.size} bytes, "
+                f"{self.elapsed:.2f} s)")
+
+
+class FileWriter:
+    """
+    Write chunks to a file without blocking the event loop
+
+    Data goes to `path` + '.part' and the file is renamed to `path` once
+    the transfer succeeded, so an interrupted download never leaves a
+    truncated file under the final name.
+    """
+
+    def __init__(self, path):
+        self.__path = os.fspath(path)
+        self.__part_path = self.__path + '.part'
+        self.__file = None
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    async def __run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, func, *args
+        )
+
+    async def open(self):
+        self.__file = await self.__run(open, self.__part_path, 'wb')
+
+    async def write(self, chunk: bytes):
+        await self.__run(self.__file.write, chunk)
+
+    async def close(self, ok: bool = True):
+        if self.__file is None:
+            return
+        await self.__run(self.__file.close)
+        self.__file = None
+        if ok:
+            await self.__run(os.replace, self.__part_path, self.__path)
+        else:
+            await self.__run(os.remove, self.__part_path)
+
+
+class _WriterAdapter:
+    # Wraps a caller's writer, whose write may be a plain function or a
+    # coroutine function, and which may need draining like a StreamWriter
+    def __init__(self, writer):
+        self.__writer = writer
+
+    async def open(self):
+        pass
+
+    async def write(self, chunk: bytes):
+        result = self.__writer.write(chunk)
+        if inspect.isawaitable(result):
+            await result
+        drain = getattr(self.__writer, 'drain', None)
+        if drain is not None:
+            await drain()
+
+    async def close(self, ok: bool = True):
+        # The caller owns the writer and closes it
+        pass
+
+
+async def read_chunks(path, chunk_size: int = 1024 * 1024, on_chunk=None):
+    """
+    Yield the contents of a file in blocks of `chunk_size` bytes
+
+    Reads run in the default executor so they do not block the event
+    loop, and only one block is held in memory at a time. `on_chunk` is
+    called with the size of every block.
+    """
+    loop = asyncio.get_running_loop()
+    file = await loop.run_in_executor(None, open, os.fspath(path), 'rb')
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, file.read, chunk_size)
+            if not chunk:
+                break
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+            yield chunk
+    finally:
+        await loop.run_in_executor(None, file.close)
+
+
+def open_destination(destination):
+    """A FileWriter for a path, or an adapter for an object with write"""
+    if hasattr(destination, 'write'):
+        return _WriterAdapter(destination)
+    return FileWriter(destination)
+
+
+class Checksum:
+    """
+    An expected digest in the form 'algorithm:hexdigest'
+
+    Any algorithm known to hashlib can be used, e.g. 'sha256:9f86d0...'.
+    """
+
+    def __init__(self, checksum: str):
+        algorithm, _, digest = checksum.partition(':')
+        algorithm = algorithm.lower()
+        if not digest or algorithm not in hashlib.algorithms_available:
+            raise TreillageValueError(
+                f"Invalid checksum {checksum}, expected 'algorithm:hexdigest'"
+            )
+        self.algorithm = algorithm
+        self.digest = digest.lower()
+
+    def hasher(self):
+        return hashlib.new(self.algorithm)
+
+    def verify(self, hasher, url: str = None):
+        if hasher.hexdigest() != self.digest:
+            raise TreillageIntegrityError(
+                url=url,
+                msg=f"{self.algorithm} checksum of the download does not "
+                    f"match {self.digest}"
+            )
+
+    async def verify_file(self, path: str, url: str = None):
+        def digest_file():
+            hasher = self.hasher()
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    hasher.update(block)
+            return hasher
+
+        hasher = await asyncio.get_running_loop().run_in_executor(
+            None, digest_file
+        )
+        self.verify(hasher, url)
+
+
+def public_url(url: str) -> str:
+    """The URL without its query, which often holds a signature"""
+    return url.split('?')[0]
+
+
+async def download_stream(connection,
+                          url: str,
+                          destination,
+                          chunk_size: int = 1024 * 1024,
+                          stats: TransferStats = None,
+                          on_progress=None,
+                          checksum: Checksum = None,
+                          deadline: float = None) -> int:
+    """Download `url` in a single request, returning the bytes written"""
+    writer = open_destination(destination)
+    hasher = checksum.hasher() if checksum is not None else None
+    ok = False
+    try:
+        options = {'deadline': deadline} if deadline is not None else {}
+        async with await connection.download(
+                url, chunk_size=chunk_size, **options) as body:
+            await writer.open()
+            size = body.size
+            async for chunk in body:
+                await writer.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                if stats is not None:
+                    stats.add_bytes(len(chunk))
+                if on_progress is not None:
+                    on_progress(body.bytes_received, size)
+            written = body.bytes_received
+        if size is not None and written != size:
+            raise TreillageIntegrityError(
+                url=public_url(url),
+                msg=f"Received {written} of {size} bytes"
+            )
+        if hasher is not None:
+            checksum.verify(hasher, public_url(url))
+        ok = True
+    finally:
+        await writer.close(ok)
+    return written
+
+
+class _RangeProgress:
+    # The sidecar file recording which ranges of a download are complete
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self.size = None
+        self.range_size = None
+        self.etag = None
+        self.done = set()
+        self.__lock = asyncio.Lock()
+
+    def load(self, range_size: int) -> bool:
+        """Read earlier progress, True if it belongs to this download"""
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if state.get('key') != self.key or \
+                state.get('range_size') != range_size:
+            return False
+        self.size = state['size']
+        self.range_size = range_size
+        self.etag = state.get('etag')
+        self.done = set(state['done'])
+        return True
+
+    def __write(self, state: dict):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+
+    async def save(self):
+        state = {'key': self.key, 'size': self.size,
+                 'range_size': self.range_size, 'etag': self.etag,
+                 'done': sorted(self.done)}
+        async with self.__lock:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.__write, state
+            )
+
+    async def complete(self, index: int):
+        self.done.add(index)
+        await self.save()
+
+    def remove(self):
+        for path in (self.path, self.path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def download_ranges(connection,
+                          url: str,
+                          path,
+                          # Identifies the content, e.g. the document id
+                          key: str,
+                          range_size: int = 16 * 1024 * 1024,
+                          concurrency: int = 4,
+                          chunk_size: int = 1024 * 1024,
+                          stats: TransferStats = None,
+                          on_progress=None,
+                          checksum: Checksum = None,
+                          retries: int = 3,
+                          deadline: float = None) -> int:
+    """
+    Download `url` to `path` as concurrent byte ranges
+
+    Ranges of `range_size` bytes are requested with up to `concurrency` in
+    flight and written at their offset in `path` + '.part'. Completed
+    ranges are recorded in `path` + '.progress', so a download of the same
+    `key` that was interrupted continues with the missing ranges. A range
+    that fails with a network error is requested again, up to `retries`
+    times. Once every range has arrived the checksum, if given, is checked
+    and the file is renamed to `path`. Servers that ignore the Range header
+    get a single request instead. Returns the size of the file.
+    """
+    path = os.fspath(path)
+    part_path = path + '.part'
+    progress = _RangeProgress(path + '.progress', str(key))
+    log_url = public_url(url)
+    loop = asyncio.get_running_loop()
+    options = {'deadline': deadline} if deadline is not None else {}
+    errors = tuple(getattr(connection.transport, 'errors', ()))
+
+    def report(count: int):
+        received[0] += count
+        if stats is not None:
+            stats.add_bytes(count)
+        if on_progress is not None:
+            on_progress(received[0], progress.size)
+
+    async def open_range(index: int):
+        start = index * range_size
+        end = min(start + range_size, progress.size or start + range_size)
+        body = await connection.download(
+            url, headers={'Range': f'bytes={start}-{end - 1}'},
+            chunk_size=chunk_size, **options
+        )
+        if body.status != 206:
+            if progress.size is None:
+                # Checked by the caller, which falls back to one request
+                return body
+            await body.close()
+            raise TreillageIntegrityError(
+                url=log_url,
+                msg="The server did not return the requested range"
+            )
+        if body.encoded:
+            # The range would be of the encoded representation
+            await body.close()
+            raise TreillageIntegrityError(
+                url=log_url,
+                msg="The server sent the requested range content encoded"
+            )
+        match = _CONTENT_RANGE.match(body.headers.get('Content-Range', ''))
+        etag = body.headers.get('ETag')
+        if (match is None or int(match.group(1)) != start or
+                (progress.size is not None and
+                 int(match.group(3)) != progress.size) or
+                (progress.etag and etag and etag != progress.etag)):
+            await body.close()
+            progress.remove()
+            raise TreillageIntegrityError(
+                url=log_url,
+                msg="The document changed while it was downloaded"
+            )
+        return body
+
+    async def write_range(index: int, body):
+        start = index * range_size
+        length = min(range_size, progress.size - start)
+        written = 0
+        try:
+            file = await loop.run_in_executor(None, open, part_path, 'r+b')
+            try:
+                await loop.run_in_executor(None, file.seek, start)
+                async with body:
+                    async for chunk in body:
+                        await loop.run_in_executor(None, file.write, chunk)
+                        written += len(chunk)
+                        report(len(chunk))
+            finally:
+                await loop.run_in_executor(None, file.close)
+            if written != length:
+                raise TreillageIntegrityError(
+                    url=log_url,
+                    msg=f"Received {written} of {length} bytes for the "
+                        f"range starting at {start}"
+                )
+        except BaseException:
+            # The range will be requested again in full
+            report(-written)
+            raise
+        await progress.complete(index)
+
+    async def fetch_range(index: int):
+        for attempt in range(retries + 1):
+            try:
+                return await write_range(index, await open_range(index))
+            except TreillageTimeoutError:
+                raise
+            except errors:
+                if attempt == retries:
+                    raise
+
+    received = [0]
+    resumed = (progress.load(range_size) and os.path.exists(part_path) and
+               os.path.getsize(part_path) == progress.size)
+    if resumed:
+        received[0] = sum(min(range_size, progress.size - i * range_size)
+                          for i in progress.done)
+    else:
+        progress.done = set()
+        progress.range_size = range_size
+        # The first range also reports the size of the file
+        first = await open_range(0)
+        if first.status != 206:
+            await first.close()
+            progress.remove()
+            return await download_stream(
+                connection, url, path, chunk_size=chunk_size, stats=stats,
+                on_progress=on_progress, checksum=checksum, deadline=deadline
+            )
+        progress.size = int(_CONTENT_RANGE.match(
+            first.headers['Content-Range']).group(3))
+        progress.etag = first.headers.get('ETag')
+
+        def allocate():
+            with open(part_path, 'wb') as file:
+                file.truncate(progress.size)
+
+        try:
+            await loop.run_in_executor(None, allocate)
+            await progress.save()
+            await write_range(0, first)
+        except errors:
+            # Retried with the other ranges
+            pass
+    ranges = -(-progress.size // range_size)
+    missing = [i for i in range(ranges) if i not in progress.done]
+    results = bounded_map(fetch_range, missing, concurrency=concurrency)
+    try:
+        async for result in results:
+            result.unwrap()
+    finally:
+        await results.aclose()
+    if checksum is not None:
+        try:
+            await checksum.verify_file(part_path, log_url)
+        except TreillageIntegrityError:
+            # The data on disk is bad, do not resume from it
+            progress.remove()
+            await loop.run_in_executor(None, os.remove, part_path)
+            raise
+    await loop.run_in_executor(None, os.replace, part_path, path)
+    progress.remove()
+    return progress.size
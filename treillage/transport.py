@@ -0,0 +1,276 @@
+import aiohttp
+import asyncio
+import json
+from .exceptions import TreillageException, TreillageValueError
+
+
+class Transport:
+    """
+    Sends the HTTP requests made by `ConnectionManager`
+
+    The interface is the part of `aiohttp.ClientSession` that Treillage
+    uses. `get`, `post`, `patch`, `put`, `delete` and `head` take keyword
+    arguments (`url`, `params`, `headers`, `json`, `data`) and return an
+    async context manager. It yields a response with `status`, `headers`
+    and `url` attributes, the coroutines `read`, `text` and `json`, and
+    `content.iter_chunked(size)` for streaming the body. A `timeout` in
+    seconds overrides the default timeout for one request, and requests
+    that time out raise `asyncio.TimeoutError`. Responses may also have a
+    `wire_bytes` attribute counting the body bytes before decompression.
+    """
+    # Exceptions raised when a request cannot be completed
+    errors = ()
+
+    def request(self, method: str, **kwargs):
+        raise NotImplementedError
+
+    def get(self, **kwargs):
+        return self.request('GET', **kwargs)
+
+    def post(self, **kwargs):
+        return self.request('POST', **kwargs)
+
+    def patch(self, **kwargs):
+        return self.request('PATCH', **kwargs)
+
+    def put(self, **kwargs):
+        return self.request('PUT', **kwargs)
+
+    def delete(self, **kwargs):
+        return self.request('DELETE', **kwargs)
+
+    def head(self, **kwargs):
+        return self.request('HEAD', **kwargs)
+
+    async def close(self):
+        pass
+
+
+class AiohttpTransport(Transport):
+    """HTTP/1.1 transport backed by an aiohttp.ClientSession"""
+    errors = (aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self,
+                 connector: aiohttp.TCPConnector = None,
+                 timeout: float = 90):
+        if connector:
+            self.__session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                connector=connector
+            )
+        else:
+            self.__session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self.__session
+
+    @staticmethod
+    def __options(kwargs: dict) -> dict:
+        # Timeouts are given in seconds, aiohttp wants a ClientTimeout
+        if isinstance(kwargs.get('timeout'), (int, float)):
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=kwargs['timeout'])
+        return kwargs
+
+    def request(self, method: str, **kwargs):
+        return self.__session.request(method, **self.__options(kwargs))
+
+    def get(self, **kwargs):
+        return self.__session.get(**self.__options(kwargs))
+
+    def post(self, **kwargs):
+        return self.__session.post(**self.__options(kwargs))
+
+    def patch(self, **kwargs):
+        return self.__session.patch(**self.__options(kwargs))
+
+    def put(self, **kwargs):
+        return self.__session.put(**self.__options(kwargs))
+
+    def delete(self, **kwargs):
+        return self.__session.delete(**self.__options(kwargs))
+
+    def head(self, **kwargs):
+        return self.__session.head(**self.__options(kwargs))
+
+    async def close(self):
+        await self.__session.close()
+
+
+async def _before(awaitable, deadline: float, timeout_error):
+    # Await before the loop time deadline, if any, and report timeouts the
+    # way aiohttp does
+    if deadline is None:
+        timeout = None
+    else:
+        timeout = max(deadline - asyncio.get_running_loop().time(), 0)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except timeout_error as error:
+        raise asyncio.TimeoutError() from error
+
+
+class _HttpxContent:
+    def __init__(self, response, deadline: float, timeout_error):
+        self.__response = response
+        self.__deadline = deadline
+        self.__timeout_error = timeout_error
+
+    async def iter_chunked(self, size: int):
+        chunks = self.__response.aiter_bytes(size)
+        try:
+            while True:
+                try:
+                    yield await _before(chunks.__anext__(), self.__deadline,
+                                        self.__timeout_error)
+                except StopAsyncIteration:
+                    return
+        finally:
+            await chunks.aclose()
+
+
+class _HttpxResponse:
+    """Presents an httpx response with the aiohttp response interface"""
+
+    def __init__(self, response, deadline: float, timeout_error):
+        self.__response = response
+        self.__deadline = deadline
+        self.__timeout_error = timeout_error
+        self.content = _HttpxContent(response, deadline, timeout_error)
+
+    @property
+    def status(self) -> int:
+        return self.__response.status_code
+
+    @property
+    def headers(self):
+        return self.__response.headers
+
+    @property
+    def url(self) -> str:
+        return str(self.__response.url)
+
+    @property
+    def http_version(self) -> str:
+        return self.__response.http_version
+
+    @property
+    def wire_bytes(self) -> int:
+        # Bytes received so far, before any content decoding
+        return self.__response.num_bytes_downloaded
+
+    async def read(self) -> bytes:
+        return await _before(self.__response.aread(), self.__deadline,
+                             self.__timeout_error)
+
+    async def text(self) -> str:
+        await self.read()
+        return self.__response.text
+
+    async def json(self):
+        body = await self.read()
+        if not body.strip():
+            return None
+        return json.loads(body)
+
+
+class _HttpxRequest:
+    def __init__(self, client, method: str, kwargs: dict, timeout: float,
+                 timeout_error):
+        self.__client = client
+        self.__timeout = timeout
+        self.__timeout_error = timeout_error
+        self.__method = method
+        self.__kwargs = kwargs
+        self.__response = None
+
+    async def __aenter__(self) -> _HttpxResponse:
+        kwargs = dict(self.__kwargs)
+        follow_redirects = kwargs.pop('allow_redirects', True)
+        if 'data' in kwargs:
+            kwargs['content'] = kwargs.pop('data')
+        # Like aiohttp's total timeout, this covers sending the request and
+        # reading the whole body. None means no timeout.
+        timeout = kwargs.pop('timeout', self.__timeout)
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = asyncio.get_running_loop().time() + timeout
+        request = self.__client.build_request(self.__method, **kwargs)
+        self.__response = await _before(
+            self.__client.send(request,
+                               stream=True,
+                               follow_redirects=follow_redirects),
+            deadline,
+            self.__timeout_error
+        )
+        return _HttpxResponse(self.__response, deadline,
+                              self.__timeout_error)
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        await self.__response.aclose()
+
+
+class HttpxTransport(Transport):
+    """
+    HTTP/2 transport backed by an httpx.AsyncClient
+
+    Over HTTPS the client negotiates HTTP/2 and multiplexes concurrent
+    requests over a single connection per host. `max_connections` caps the
+    number of connections, as `max_connections` does for aiohttp. Needs the
+    httpx package with its http2 extra.
+
+    `timeout` is a total in seconds for each request, including reading
+    its body, as with aiohttp. httpx's own per-phase timeouts are turned
+    off, they can be set through `client.timeout`.
+    """
+
+    def __init__(self,
+                 http2: bool = True,
+                 max_connections: int = None,
+                 timeout: float = 90,
+                 **client_options):
+        try:
+            import httpx
+        except ImportError:
+            raise TreillageException(
+                msg="The httpx transport requires the httpx package, "
+                    "install it with `pip install httpx[http2]`"
+            )
+        self.errors = (httpx.HTTPError, asyncio.TimeoutError)
+        self.__timeout_error = httpx.TimeoutException
+        self.__timeout = timeout
+        self.__client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections),
+            timeout=httpx.Timeout(None),
+            **client_options
+        )
+
+    @property
+    def client(self):
+        return self.__client
+
+    def request(self, method: str, **kwargs):
+        return _HttpxRequest(self.__client, method, kwargs, self.__timeout,
+                             self.__timeout_error)
+
+    async def close(self):
+        await self.__client.aclose()
+
+
+TRANSPORTS = {
+    'aiohttp': AiohttpTransport,
+    'httpx': HttpxTransport,
+}
+
+
+def check_transport(transport):
+    """Raise if transport is neither a Transport nor a known name"""
+    if not isinstance(transport, Transport) and transport not in TRANSPORTS:
+        raise TreillageValueError(
+            f"Unknown transport {transport}, expected a Transport or one "
+            "of: " + ', '.join(TRANSPORTS)
+        )
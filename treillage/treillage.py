@@ -16,7 +16,9 @@ class Treillage:
                  # Number of parallel connections to each host:port endpoint
                  max_connections: int = None,
                  # Maximum requests per second allowed by the rate-limiter
-                 requests_per_second: int = None):
+                 requests_per_second: int = None,
+                 # Further keyword options passed on to ConnectionManager
+                 **connection_options):
         self.__credential = Credential.get_credentials(credentials_file)
         if isinstance(base_url, BaseURL):
             self.__base_url = base_url.value
@@ -24,6 +26,7 @@ class Treillage:
             self.__base_url = base_url
         self.__max_connections = max_connections
         self.__requests_per_second = requests_per_second
+        self.__connection_options = connection_options
         self.__conn = None
 
     @property
@@ -35,7 +38,8 @@ class Treillage:
             self.__base_url,
             self.__credential,
             self.__max_connections,
-            self.__requests_per_second
+            self.__requests_per_second,
+            **self.__connection_options
         )
 
     @classmethod
@@ -45,11 +49,13 @@ class Treillage:
             base_url: Union[str, BaseURL] = BaseURL.UNITED_STATES.value,
             max_connections: int = None,
             requests_per_second: int = None,
+            **connection_options
     ):
         self = Treillage(credentials_file,
                          base_url,
                          max_connections,
-                         requests_per_second)
+                         requests_per_second,
+                         **connection_options)
         await self.__async_init()
         return self
 